@@ -0,0 +1,202 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1024"))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "86400"))
+ANSWER_CACHE_MIN_SIMILARITY = float(os.getenv("ANSWER_CACHE_MIN_SIMILARITY", "0.92"))
+# File đánh dấu phiên bản kho tri thức, dùng chung cho mọi worker/tiến trình nạp dữ liệu
+ANSWER_CACHE_VERSION_FILE = os.getenv("ANSWER_CACHE_VERSION_FILE", os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "chroma_db_storage", "knowledge_version"))
+# Số embedding câu hỏi gần nhất được giữ lại để `put` không phải embed lại
+_PENDING_LIMIT = 256
+
+
+def _default_embeddings():
+    from agents.vector_store import get_embeddings
+    return get_embeddings()
+
+
+def _normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+class KnowledgeVersion:
+    """
+    Phiên bản kho tri thức lưu trong một file nhỏ: `bump()` ghi lại file (file tạm + os.replace),
+    `token()` là (inode, mtime) của file nên mọi tiến trình thấy thay đổi chỉ với một lời gọi stat.
+    """
+
+    def __init__(self, path: str = ANSWER_CACHE_VERSION_FILE):
+        self.path = path
+
+    def token(self) -> Optional[tuple]:
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_ino, st.st_mtime_ns
+
+    def bump(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(str(time.time_ns()))
+        os.replace(tmp_path, self.path)
+
+
+class SemanticAnswerCache:
+    """
+    Cache câu trả lời theo embedding của `condensed_query`: câu hỏi mới có cosine
+    similarity >= min_similarity với câu đã trả lời (cùng query_type) dùng lại câu trả lời cũ.
+    Vector được giữ trong một ma trận cấp phát sẵn (max_entries x dim) nên mỗi lần tra chỉ là
+    một phép nhân ma trận-vector; loại bỏ theo LRU và TTL. Gọi `clear()` khi kho tri thức thay đổi:
+    phiên bản trong `version` được tăng và cache của các worker khác tự xóa ở lần tra tiếp theo.
+    """
+
+    def __init__(self, max_entries: int = ANSWER_CACHE_SIZE, ttl_seconds: float = ANSWER_CACHE_TTL_SECONDS,
+                 min_similarity: float = ANSWER_CACHE_MIN_SIMILARITY,
+                 embeddings_getter: Callable = _default_embeddings, version: Optional[KnowledgeVersion] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.min_similarity = min_similarity
+        self.embeddings_getter = embeddings_getter
+        self._vectors: Optional[np.ndarray] = None
+        self._types = np.full(max(max_entries, 0), -1, dtype=np.int32)
+        self._type_codes = {}
+        self._entries: "OrderedDict[int, dict]" = OrderedDict()
+        self._free: List[int] = list(range(max_entries - 1, -1, -1))
+        self._pending: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.version = version if version is not None else KnowledgeVersion()
+        self._version_token = self.version.token()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def _embed(self, query: str) -> Optional[np.ndarray]:
+        embeddings = self.embeddings_getter()
+        if embeddings is None:
+            return None
+        vector = np.asarray(embeddings.embed_query(query), dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def _type_code(self, query_type: str) -> int:
+        return self._type_codes.setdefault(query_type, len(self._type_codes))
+
+    def _reset(self):
+        self.generation += 1
+        self._entries.clear()
+        # Giữ `_pending`: embedding đã tra mang generation cũ nên `put` tương ứng sẽ bị bỏ qua
+        self._free = list(range(self.max_entries - 1, -1, -1))
+        self._types[:] = -1
+        if self._vectors is not None:
+            self._vectors[:] = 0
+
+    def _check_version(self):
+        """Xóa cache nếu tiến trình khác đã thay đổi kho tri thức (gọi khi giữ _lock)."""
+        token = self.version.token()
+        if token != self._version_token:
+            self._version_token = token
+            self._reset()
+
+    def _evict(self, slot: int):
+        self._entries.pop(slot, None)
+        self._types[slot] = -1
+        self._vectors[slot] = 0
+        self._free.append(slot)
+
+    def get(self, query_type: str, query: str) -> Optional[dict]:
+        """Trả về {"answer", "sources", "similarity", "query"} nếu có câu hỏi đủ giống, ngược lại None."""
+        if not self.enabled or not query:
+            return None
+        vector = self._embed(query)
+        if vector is None:
+            return None
+        with self._lock:
+            self._check_version()
+            self._pending[(query_type, _normalize_query(query))] = (vector, self.generation)
+            while len(self._pending) > _PENDING_LIMIT:
+                self._pending.popitem(last=False)
+
+            if self._vectors is None or not self._entries:
+                self.misses += 1
+                return None
+            scores = self._vectors @ vector
+            scores[self._types != self._type_codes.get(query_type, -2)] = -1.0
+            slot = int(np.argmax(scores))
+            similarity = float(scores[slot])
+            entry = self._entries.get(slot)
+            if entry is not None and time.monotonic() - entry["created_at"] > self.ttl_seconds:
+                self._evict(slot)
+                entry = None
+            if entry is None or similarity < self.min_similarity:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(slot)
+            self.hits += 1
+            return {"answer": entry["answer"], "sources": list(entry["sources"]),
+                    "similarity": similarity, "query": entry["query"]}
+
+    def put(self, query_type: str, query: str, answer: str, sources: Optional[List[str]] = None):
+        """Lưu câu trả lời. Bỏ qua nếu kho tri thức đã thay đổi kể từ lúc câu hỏi được tra cache."""
+        if not self.enabled or not query or not answer:
+            return
+        key = (query_type, _normalize_query(query))
+        with self._lock:
+            pending = self._pending.pop(key, None)
+        if pending is None:
+            pending = (self._embed(query), self.generation)
+        vector, generation = pending
+        if vector is None:
+            return
+        with self._lock:
+            self._check_version()
+            if generation != self.generation:
+                return
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+            if not self._free:
+                oldest = next(iter(self._entries))
+                self._evict(oldest)
+            slot = self._free.pop()
+            self._vectors[slot] = vector
+            self._types[slot] = self._type_code(query_type)
+            self._entries[slot] = {"answer": answer, "sources": list(sources or []), "query": query,
+                                   "created_at": time.monotonic()}
+
+    def clear(self):
+        """Xóa toàn bộ cache của mọi worker (gọi khi kho tri thức thay đổi)."""
+        with self._lock:
+            try:
+                self.version.bump()
+            except OSError as e:
+                logger.error(f"❌ Không cập nhật được phiên bản kho tri thức {self.version.path}: {e}")
+            self._version_token = self.version.token()
+            self._reset()
+        logger.info("🧹 Đã xóa cache câu trả lời (kho tri thức thay đổi).")
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "min_similarity": self.min_similarity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+answer_cache = SemanticAnswerCache()
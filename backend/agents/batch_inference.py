@@ -0,0 +1,107 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class MicroBatcher:
+    """
+    Gom các yêu cầu suy luận đến gần nhau về thời gian thành một batch.
+
+    Mỗi lời gọi `submit` đưa một input vào hàng đợi và nhận lại một Future.
+    Luồng worker lấy tối đa `max_batch_size` input, chờ không quá `max_wait_ms`
+    kể từ input đầu tiên, rồi gọi `infer_fn(list_inputs)` một lần duy nhất.
+    `infer_fn` phải trả về danh sách kết quả cùng thứ tự và cùng độ dài.
+    """
+
+    def __init__(self, infer_fn: Callable[[List[Any]], List[Any]],
+                 max_batch_size: int = 8, max_wait_ms: float = 5.0, name: str = "batcher"):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size phải >= 1")
+        self.infer_fn = infer_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max(max_wait_ms, 0.0) / 1000.0
+        self.name = name
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.batches_run = 0
+        self.items_run = 0
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._worker, name=self.name, daemon=True)
+                self._thread.start()
+
+    def submit(self, item: Any) -> Future:
+        """Đưa một input vào hàng đợi, trả về Future chứa kết quả riêng của input đó."""
+        future: Future = Future()
+        if self.max_batch_size == 1:
+            # Không cần gom batch: chạy trực tiếp trên luồng gọi
+            try:
+                future.set_result(self.infer_fn([item])[0])
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        self._ensure_started()
+        self._queue.put((item, future))
+        return future
+
+    def __call__(self, item: Any, timeout: Optional[float] = None) -> Any:
+        return self.submit(item).result(timeout=timeout)
+
+    def close(self):
+        """Dừng luồng worker sau khi xử lý hết các yêu cầu đang chờ."""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+
+    @property
+    def average_batch_size(self) -> float:
+        return self.items_run / self.batches_run if self.batches_run else 0.0
+
+    def _collect(self, first) -> list:
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._queue.put(_STOP)
+                break
+            batch.append(item)
+        return batch
+
+    def _worker(self):
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            batch = self._collect(first)
+            inputs = [item for item, _ in batch]
+            futures = [future for _, future in batch]
+            try:
+                outputs = self.infer_fn(inputs)
+                if len(outputs) != len(inputs):
+                    raise RuntimeError(f"{self.name}: infer_fn trả về {len(outputs)} kết quả cho {len(inputs)} input")
+            except Exception as e:
+                logger.error(f"❌ Lỗi khi chạy batch {self.name} ({len(inputs)} input): {e}")
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            self.batches_run += 1
+            self.items_run += len(inputs)
+            for future, output in zip(futures, outputs):
+                future.set_result(output)
@@ -0,0 +1,97 @@
+"""
+Nhận diện cây trồng (cây chủ) trong câu hỏi, nhãn của model phân loại ảnh và trường
+`cay_chu` của plant.json. Mỗi chunk được gắn cờ metadata `crop_<key>` lúc nạp dữ liệu để
+tìm kiếm vector lọc trước theo cây trồng và chỉ mục BM25 chia phân vùng theo cây trồng.
+"""
+import re
+import unicodedata
+from typing import Dict, Iterable, List, Optional
+
+# key -> các cách gọi (chữ thường, đã chuẩn hóa NFC), gồm cả tên khoa học
+CROP_ALIASES: Dict[str, List[str]] = {
+    "lua": ["lúa", "oryza sativa", "oryza"],
+    "ca_chua": ["cà chua", "solanum lycopersicum", "lycopersicum"],
+    "ngo": ["ngô", "bắp", "zea mays"],
+    "tao": ["táo", "malus"],
+    "bi": ["bí", "bí đỏ", "bí xanh", "bí ngô", "cucurbita"],
+    "cherry": ["cherry", "chery", "anh đào"],
+    "khoai_tay": ["khoai tây", "solanum tuberosum"],
+    "nho": ["nho", "vitis"],
+    "dau_tay": ["dâu tây", "fragaria"],
+    "dao": ["đào", "prunus persica"],
+    "dau_nanh": ["đậu nành", "đậu tương", "glycine max"],
+    "mam_xoi": ["mâm xôi", "phúc bồn tử", "rubus"],
+    "ot_chuong": ["ớt chuông", "ớt ngọt", "capsicum"],
+    "viet_quat": ["việt quất", "blueberry", "vaccinium"],
+    "cam_quyt": ["cam", "quýt", "chanh", "bưởi", "rutaceae", "citrus"],
+}
+CROP_FLAG_PREFIX = "crop_"
+
+# Alias trùng với từ thông dụng ("đào" hố, "cam" kết, "bắp" cải): chỉ tính là cây trồng khi đứng
+# sau một từ chỉ cây trồng ("cây đào", "quả cam", "trái bắp")
+CONTEXT_ONLY_ALIASES = {"đào", "cam", "bắp"}
+CROP_CONTEXT_WORDS = {"cây", "quả", "trái", "vườn", "ruộng", "gốc", "lá", "hoa", "cành", "giống", "hạt", "bông"}
+# Từ ghép không phải cây trồng, bỏ qua kể cả khi có từ chỉ cây trồng đứng trước ("lá bắp cải")
+NON_CROP_COMPOUNDS = {
+    ("bắp", "cải"), ("bắp", "chuối"), ("bắp", "tay"), ("bắp", "chân"), ("bắp", "thịt"),
+    ("cam", "kết"), ("cam", "đoan"), ("cam", "chịu"), ("cam", "lòng"), ("cam", "tâm"),
+    ("đào", "tạo"), ("đào", "bới"), ("đào", "hố"), ("đào", "rãnh"), ("đào", "mương"), ("đào", "đất"),
+    ("đào", "ao"), ("đào", "thải"), ("đào", "sâu"), ("đào", "lên"),
+}
+
+_WORD_RE = re.compile(r"\w+")
+# (các âm tiết của alias, key), alias dài xét trước: "anh đào" là cherry chứ không phải đào
+_ALIAS_TOKENS = sorted(
+    ((tuple(alias.split()), key) for key, aliases in CROP_ALIASES.items() for alias in aliases),
+    key=lambda item: len(item[0]), reverse=True,
+)
+
+
+def extract_crops(text: Optional[str], require_context: bool = True) -> List[str]:
+    """
+    Các key cây trồng xuất hiện trong văn bản, theo thứ tự xuất hiện. `require_context=False`
+    khi văn bản chắc chắn là tên cây (trường `cay_chu`): "Đào" đứng một mình vẫn được nhận.
+    """
+    tokens = _WORD_RE.findall(unicodedata.normalize("NFC", text or "").lower())
+    found: List[str] = []
+    i = 0
+    while i < len(tokens):
+        if tuple(tokens[i:i + 2]) in NON_CROP_COMPOUNDS:
+            i += 2
+            continue
+        for alias, key in _ALIAS_TOKENS:
+            if tuple(tokens[i:i + len(alias)]) == alias:
+                if (require_context and len(alias) == 1 and alias[0] in CONTEXT_ONLY_ALIASES
+                        and (i == 0 or tokens[i - 1] not in CROP_CONTEXT_WORDS)):
+                    i += 1
+                    break
+                if key not in found:
+                    found.append(key)
+                i += len(alias)
+                break
+        else:
+            i += 1
+    return found
+
+
+def crop_metadata(crops: Iterable[str]) -> dict:
+    """Metadata gắn vào chunk: cờ `crop_<key>` (Chroma chỉ lọc được giá trị vô hướng) và danh sách dạng chuỗi."""
+    crops = list(crops)
+    metadata = {f"{CROP_FLAG_PREFIX}{crop}": True for crop in crops}
+    if crops:
+        metadata["crops"] = ",".join(crops)
+    return metadata
+
+
+def crops_of(metadata: Optional[dict]) -> List[str]:
+    """Đọc lại danh sách cây trồng từ metadata của chunk."""
+    value = (metadata or {}).get("crops") or ""
+    return [crop for crop in value.split(",") if crop]
+
+
+def crop_filter(crops: Iterable[str]) -> Optional[dict]:
+    """Bộ lọc `where` của Chroma: chunk thuộc ít nhất một trong các cây trồng."""
+    clauses = [{f"{CROP_FLAG_PREFIX}{crop}": True} for crop in dict.fromkeys(crops)]
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$or": clauses}
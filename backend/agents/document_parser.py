@@ -0,0 +1,247 @@
+"""
+Đọc và chia chunk tài liệu upload trong một process pool riêng: trích xuất văn bản PDF (pypdf)
+và `split_documents` là Python thuần, giữ GIL, nếu chạy trong thread sẽ tranh CPU với các
+request chat. PDF lớn được chia thành các khoảng PARSE_PAGES_PER_TASK trang xử lý song song;
+kết quả được trả về dần theo thứ tự trang để embedding bắt đầu ngay. Mỗi tài liệu có giới hạn
+thời gian PARSE_TIMEOUT_SECONDS: quá hạn thì pool bị loại (tài liệu mới dùng pool mới) và các
+process của nó chỉ bị dừng sau khi các tài liệu khác đang đọc trên pool đó đã xong.
+
+Module chỉ import loader/splitter để process con (spawn) khởi động nhanh.
+"""
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from langchain_community.document_loaders import PyPDFLoader, TextLoader, UnstructuredFileLoader
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# 0: đọc ngay trong thread gọi (không dùng process pool)
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+PARSE_PAGES_PER_TASK = int(os.getenv("PARSE_PAGES_PER_TASK", "8"))
+PARSE_TIMEOUT_SECONDS = float(os.getenv("PARSE_TIMEOUT_SECONDS", "300"))
+
+# Tham số chia chunk; nằm trong hash của manifest nên đổi giá trị sẽ nạp lại mọi tài liệu
+CHUNK_SIZE = 600
+CHUNK_OVERLAP = 100
+CHUNK_SEPARATORS = ["\n\n", "\n", " ", ""]
+
+
+class DocumentParseTimeout(TimeoutError):
+    """Đọc tài liệu vượt quá PARSE_TIMEOUT_SECONDS."""
+
+
+def make_loader(file_path: str, original_filename: str):
+    """Chọn loader theo đuôi file (PDF, TXT hoặc định dạng khác)."""
+    if original_filename.lower().endswith(".pdf"):
+        return PyPDFLoader(file_path)
+    if original_filename.lower().endswith(".txt"):
+        return TextLoader(file_path, encoding="utf-8")
+    return UnstructuredFileLoader(file_path)
+
+
+def make_text_splitter() -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter(
+        separators=CHUNK_SEPARATORS,
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP,
+        add_start_index=True
+    )
+
+
+def splitter_signature() -> str:
+    """Chuỗi mô tả cấu hình chia chunk hiện tại (dùng cho hash trong manifest)."""
+    return json.dumps({"chunk_size": CHUNK_SIZE, "chunk_overlap": CHUNK_OVERLAP,
+                       "separators": CHUNK_SEPARATORS, "add_start_index": True}, sort_keys=True)
+
+
+# --- Chạy trong process con ---
+
+def _pdf_page_count(file_path: str) -> int:
+    from pypdf import PdfReader
+    return len(PdfReader(file_path).pages)
+
+
+def _split_pages(pages: List[Document], filename: str) -> List[Document]:
+    # Chia từng trang như khi đọc tuần tự: start_index tính trong trang, id chunk không đổi
+    splitter = make_text_splitter()
+    chunks = []
+    for page in pages:
+        page.metadata["source"] = filename
+        chunks.extend(splitter.split_documents([page]))
+    return chunks
+
+
+def _purge_metadata(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Chuẩn hóa metadata PDF giống PyPDFLoader (bỏ "/" đầu key, viết thường, đổi ngày sang ISO,
+    thêm total_pages/source) để chunk và id chunk trùng với khi đọc bằng loader.
+    """
+    map_key = {"page_count": "total_pages", "file_path": "source"}
+    new_metadata: Dict[str, Any] = {}
+    for key, value in metadata.items():
+        if type(value) not in (str, int):
+            value = str(value)
+        key = key[1:] if key.startswith("/") else key
+        key = key.lower()
+        if key in ("creationdate", "moddate"):
+            try:
+                new_metadata[key] = datetime.strptime(value.replace("'", ""), "D:%Y%m%d%H%M%S%z").isoformat("T")
+            except ValueError:
+                new_metadata[key] = value
+        elif key in map_key:
+            new_metadata[map_key[key]] = value
+            new_metadata[key] = value
+        elif isinstance(value, str):
+            new_metadata[key] = value.strip()
+        elif isinstance(value, int):
+            new_metadata[key] = value
+    return new_metadata
+
+
+def _parse_pdf_pages(file_path: str, filename: str, start: int, end: int) -> Tuple[int, List[Document]]:
+    """
+    Trích xuất và chia chunk các trang [start, end) của một PDF. Văn bản và metadata giống
+    PyPDFLoader (chế độ "page") nên chunk, và id chunk, trùng với khi đọc tuần tự.
+    """
+    from pypdf import PdfReader
+    reader = PdfReader(file_path)
+    total_pages = len(reader.pages)
+    doc_metadata = _purge_metadata({"producer": "PyPDF", "creator": "PyPDF", "creationdate": ""}
+                                   | dict(reader.metadata or {})
+                                   | {"source": filename, "total_pages": total_pages})
+    pages = []
+    for number in range(start, min(end, total_pages)):
+        text = reader.pages[number].extract_text(extraction_mode="plain") or ""
+        pages.append(Document(page_content=text.strip(),
+                              metadata={**doc_metadata, "page": number, "page_label": reader.page_labels[number]}))
+    return len(pages), _split_pages(pages, filename)
+
+
+def _parse_file(file_path: str, filename: str) -> Tuple[int, List[Document]]:
+    pages = make_loader(file_path, filename).load()
+    return len(pages), _split_pages(pages, filename)
+
+
+# --- Process pool ---
+
+class _ParsePool:
+    """Process pool kèm số tài liệu đang dùng; pool bị loại chỉ dừng khi không còn ai dùng."""
+
+    def __init__(self, workers: int):
+        # spawn: tiến trình chính có nhiều thread (PyTorch, thread pool), fork không an toàn
+        self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        self.users = 0
+        self.retired = False
+
+
+_pool: Optional[_ParsePool] = None
+_pool_lock = threading.Lock()
+
+
+def _acquire_pool(workers: int = PARSE_WORKERS) -> _ParsePool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = _ParsePool(workers)
+        _pool.users += 1
+        return _pool
+
+
+def _terminate(pool: _ParsePool):
+    for process in list((getattr(pool.executor, "_processes", None) or {}).values()):
+        process.terminate()
+    pool.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _release_pool(pool: _ParsePool):
+    with _pool_lock:
+        pool.users -= 1
+        drained = pool.retired and pool.users <= 0
+    if drained:
+        # Tài liệu cuối cùng trên pool bị loại đã xong: dừng process còn kẹt (tác vụ quá hạn)
+        _terminate(pool)
+
+
+def _retire_pool(pool: _ParsePool):
+    """
+    Không dừng riêng được một tác vụ đang chạy: bỏ pool khỏi vòng sử dụng (tài liệu mới dùng pool
+    mới), các tài liệu khác đang đọc trên pool này vẫn chạy tiếp, pool bị dừng khi họ xong.
+    """
+    global _pool
+    with _pool_lock:
+        pool.retired = True
+        if _pool is pool:
+            _pool = None
+
+
+def shutdown_parse_pool():
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def iter_document_chunks(file_path: str, filename: str, timeout: float = PARSE_TIMEOUT_SECONDS,
+                         workers: int = PARSE_WORKERS,
+                         pages_per_task: int = PARSE_PAGES_PER_TASK) -> Iterator[Tuple[int, List[Document]]]:
+    """
+    Đọc và chia chunk tài liệu, trả về dần từng phần (số trang, các chunk) theo thứ tự trang.
+    PDF được chia thành các khoảng `pages_per_task` trang chạy song song trên process pool,
+    định dạng khác đọc nguyên file trong một process. Ném DocumentParseTimeout nếu quá `timeout` giây.
+    """
+    if workers <= 0:
+        if filename.lower().endswith(".pdf"):
+            yield _parse_pdf_pages(file_path, filename, 0, _pdf_page_count(file_path))
+        else:
+            yield _parse_file(file_path, filename)
+        return
+
+    pool = _acquire_pool(workers)
+    executor = pool.executor
+    deadline = time.monotonic() + timeout
+    pending = deque()
+
+    def wait(future):
+        try:
+            return future.result(timeout=max(deadline - time.monotonic(), 0))
+        except FutureTimeoutError:
+            _retire_pool(pool)
+            raise DocumentParseTimeout(f"Đọc file {filename} quá {timeout:g}s")
+        except BrokenProcessPool:
+            _retire_pool(pool)
+            raise
+
+    try:
+        if not filename.lower().endswith(".pdf"):
+            yield wait(executor.submit(_parse_file, file_path, filename))
+            return
+        total_pages = wait(executor.submit(_pdf_page_count, file_path))
+        # Giữ tối đa 2 khoảng trang mỗi process đang chờ: bộ nhớ không tăng theo kích thước file
+        max_pending = max(workers, 1) * 2
+        for start in range(0, total_pages, max(pages_per_task, 1)):
+            pending.append(executor.submit(_parse_pdf_pages, file_path, filename, start, start + pages_per_task))
+            while len(pending) >= max_pending:
+                yield wait(pending.popleft())
+        while pending:
+            yield wait(pending.popleft())
+    finally:
+        # Bị hủy giữa chừng (generator đóng sớm) hoặc lỗi: bỏ các khoảng trang chưa chạy
+        for future in pending:
+            future.cancel()
+        _release_pool(pool)
@@ -0,0 +1,202 @@
+"""
+Cache embedding trên đĩa dùng chung cho nạp dữ liệu và truy vấn: key = hash(model, loại, văn bản).
+Vector nằm trong một file np.memmap (capacity x dim, float32) và được đọc thẳng từ page cache;
+chỉ mục key -> slot nằm trong SQLite nên nhiều worker uvicorn và load_json dùng chung được.
+Khi đầy, các slot dùng lâu nhất bị thay thế (LRU theo thời điểm dùng gần nhất).
+"""
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "1") == "1"
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", os.path.join(current_dir, "embedding_cache"))
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "100000"))
+
+
+def embedding_key(model_name: str, kind: str, text: str) -> str:
+    return hashlib.sha256(f"{model_name}\0{kind}\0{text}".encode("utf-8")).hexdigest()[:32]
+
+
+class EmbeddingStore:
+    """
+    Lưu vector theo key trong `directory`: index.sqlite3 (key -> slot, last_used) và
+    vectors.f32 (memmap). Số chiều được cố định ở lần ghi đầu tiên.
+    """
+
+    def __init__(self, directory: str, capacity: int = EMBEDDING_CACHE_SIZE):
+        self.directory = directory
+        self.capacity = capacity
+        self._conn: Optional[sqlite3.Connection] = None
+        self._vectors: Optional[np.memmap] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(self.directory, exist_ok=True)
+            conn = sqlite3.connect(os.path.join(self.directory, "index.sqlite3"), timeout=30,
+                                   check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS entries ("
+                         "key TEXT PRIMARY KEY, slot INTEGER NOT NULL UNIQUE, last_used REAL NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            self._conn = conn
+        return self._conn
+
+    def _open_vectors(self, dim: Optional[int] = None) -> Optional[np.memmap]:
+        if self._vectors is not None:
+            return self._vectors
+        conn = self._connect()
+        row = conn.execute("SELECT value FROM meta WHERE name = 'dim'").fetchone()
+        if row is None:
+            if dim is None:
+                return None
+            conn.execute("INSERT OR IGNORE INTO meta (name, value) VALUES ('dim', ?)", (dim,))
+            row = conn.execute("SELECT value FROM meta WHERE name = 'dim'").fetchone()
+        capacity = conn.execute("SELECT value FROM meta WHERE name = 'capacity'").fetchone()
+        if capacity is None or capacity[0] != self.capacity:
+            # Đổi EMBEDDING_CACHE_SIZE: slot cũ có thể nằm ngoài file mới, bắt đầu lại từ đầu
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM entries")
+            conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('next_slot', 0)")
+            conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('capacity', ?)", (self.capacity,))
+            conn.execute("COMMIT")
+        path = os.path.join(self.directory, "vectors.f32")
+        shape = (self.capacity, row[0])
+        size = shape[0] * shape[1] * 4
+        # Chỉ nới rộng (file thưa, chỉ chiếm đĩa cho slot đã ghi), không ghi đè dữ liệu tiến trình khác vừa ghi
+        with open(path, "ab") as f:
+            if f.tell() < size:
+                f.truncate(size)
+        self._vectors = np.memmap(path, dtype=np.float32, mode="r+", shape=shape)
+        return self._vectors
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, np.ndarray]:
+        """Các vector có trong cache (view trên memmap, không copy)."""
+        if not keys or self.capacity <= 0:
+            return {}
+        with self._lock:
+            vectors = self._open_vectors()
+            if vectors is None:
+                return {}
+            conn = self._connect()
+            found = {}
+            for start in range(0, len(keys), 500):
+                part = list(keys[start:start + 500])
+                placeholders = ",".join("?" * len(part))
+                found.update(conn.execute(f"SELECT key, slot FROM entries WHERE key IN ({placeholders})",
+                                          part).fetchall())
+            if found:
+                now = time.time()
+                conn.executemany("UPDATE entries SET last_used = ? WHERE key = ?", [(now, key) for key in found])
+            return {key: vectors[slot] for key, slot in found.items()}
+
+    def put_many(self, items: Dict[str, Sequence[float]]):
+        if not items or self.capacity <= 0:
+            return
+        items = dict(list(items.items())[:self.capacity])
+        dim = len(next(iter(items.values())))
+        with self._lock:
+            vectors = self._open_vectors(dim)
+            if vectors.shape[1] != dim:
+                logger.warning(f"⚠️ Cache embedding có số chiều {vectors.shape[1]}, bỏ qua vector {dim} chiều")
+                return
+            conn = self._connect()
+            # BEGIN IMMEDIATE: cấp phát slot tuần tự giữa các tiến trình dùng chung cache
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                placeholders = ",".join("?" * len(items))
+                existing = {key for key, in conn.execute(
+                    f"SELECT key FROM entries WHERE key IN ({placeholders})", list(items)).fetchall()}
+                new_keys = [key for key in items if key not in existing]
+                row = conn.execute("SELECT value FROM meta WHERE name = 'next_slot'").fetchone()
+                next_slot = row[0] if row else 0
+                fresh = max(0, min(len(new_keys), self.capacity - next_slot))
+                slots = list(range(next_slot, next_slot + fresh))
+                if fresh < len(new_keys):
+                    evicted = conn.execute("SELECT key, slot FROM entries ORDER BY last_used LIMIT ?",
+                                           (len(new_keys) - fresh,)).fetchall()
+                    conn.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key, _ in evicted])
+                    slots += [slot for _, slot in evicted]
+                for key, slot in zip(new_keys, slots):
+                    vectors[slot] = np.asarray(items[key], dtype=np.float32)
+                vectors.flush()
+                now = time.time()
+                conn.executemany("INSERT INTO entries (key, slot, last_used) VALUES (?, ?, ?)",
+                                 [(key, slot, now) for key, slot in zip(new_keys, slots)])
+                conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('next_slot', ?)",
+                             (next_slot + fresh,))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connect().execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Bọc một Embeddings của LangChain (HuggingFaceEmbeddings hoặc RemoteEmbeddings của model
+    server): văn bản đã từng embedding với cùng model được đọc từ cache, chỉ phần còn thiếu
+    mới chạy qua model (một lời gọi cho cả lô).
+    """
+
+    def __init__(self, inner: Embeddings, model_name: str, cache_dir: str = EMBEDDING_CACHE_DIR,
+                 capacity: int = EMBEDDING_CACHE_SIZE):
+        self.inner = inner
+        self.model_name = model_name
+        safe_name = re.sub(r"[^\w.-]+", "_", model_name)
+        self.store = EmbeddingStore(os.path.join(cache_dir, safe_name), capacity=capacity)
+        self.hits = 0
+        self.misses = 0
+
+    def _embed(self, kind: str, texts: List[str], compute) -> List[List[float]]:
+        keys = [embedding_key(self.model_name, kind, text) for text in texts]
+        try:
+            cached = self.store.get_many(keys)
+        except Exception as e:
+            logger.error(f"❌ Lỗi đọc cache embedding: {e}")
+            cached = {}
+        missing = [i for i, key in enumerate(keys) if key not in cached]
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        computed = {}
+        if missing:
+            vectors = compute([texts[i] for i in missing])
+            # Làm tròn về float32 như bản lưu trong cache để trúng hay trượt cache đều cho cùng kết quả
+            computed = {keys[i]: np.asarray(vector, dtype=np.float32) for i, vector in zip(missing, vectors)}
+            try:
+                self.store.put_many(computed)
+            except Exception as e:
+                logger.error(f"❌ Lỗi ghi cache embedding: {e}")
+        return [(computed[key] if key in computed else cached[key]).tolist() for key in keys]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed("doc", list(texts), self.inner.embed_documents)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed("query", [text], lambda texts: [self.inner.embed_query(texts[0])])[0]
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0}
+
+
+def with_embedding_cache(embeddings: Embeddings, model_name: str) -> Embeddings:
+    """Bọc cache nếu EMBEDDING_CACHE_ENABLED, ngược lại trả về nguyên embeddings."""
+    if not EMBEDDING_CACHE_ENABLED or EMBEDDING_CACHE_SIZE <= 0:
+        return embeddings
+    return CachedEmbeddings(embeddings, model_name)
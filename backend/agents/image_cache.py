@@ -0,0 +1,90 @@
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from PIL import Image
+
+
+def dhash(image: Image.Image, hash_size: int = 8) -> int:
+    """
+    Difference hash (dHash) 64-bit của ảnh: so sánh độ sáng các pixel kề nhau
+    trên ảnh xám thu nhỏ. Ảnh gửi lại hoặc nén lại cho ra hash giống hoặc rất gần.
+    """
+    small = image.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = small.tobytes()
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class PerceptualHashCache:
+    """
+    Cache kết quả dự đoán theo perceptual hash, loại bỏ theo LRU.
+    Một ảnh được coi là trùng nếu khoảng cách Hamming tới hash đã lưu <= max_distance.
+    """
+
+    def __init__(self, max_entries: int = 512, max_distance: int = 4):
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self._entries: "OrderedDict[int, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def _find(self, image_hash: int) -> Optional[int]:
+        if image_hash in self._entries:
+            return image_hash
+        if self.max_distance <= 0:
+            return None
+        best_key, best_distance = None, self.max_distance + 1
+        for key in self._entries:
+            distance = hamming_distance(image_hash, key)
+            if distance < best_distance:
+                best_key, best_distance = key, distance
+        return best_key
+
+    def get(self, image_hash: int) -> Optional[dict]:
+        with self._lock:
+            key = self._find(image_hash)
+            if key is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(self._entries[key])
+
+    def put(self, image_hash: int, result: dict):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[image_hash] = dict(result)
+            self._entries.move_to_end(image_hash)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "max_distance": self.max_distance,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
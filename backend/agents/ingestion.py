@@ -0,0 +1,211 @@
+"""
+Pipeline nạp tài liệu upload vào kho tri thức theo luồng: đọc và chia chunk trong process
+pool (agents/document_parser.py), gom thành lô INGEST_BATCH_SIZE, tính embedding song song
+trên INGEST_EMBED_WORKERS luồng và ghi vào Chroma + BM25 theo từng lô. Số lô đang chờ
+embedding bị giới hạn nên bộ nhớ không tăng theo kích thước file; tiến độ được cập nhật sau mỗi lô. Chỉ các chunk mới
+hoặc đã thay đổi (theo manifest) mới được embedding.
+"""
+import hashlib
+import logging
+import os
+import re
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional
+
+from dotenv import load_dotenv
+from langchain_core.documents import Document
+
+from agents.answer_cache import answer_cache
+from agents.manifest import DocumentManifest, chunk_id, file_hash
+from agents.document_parser import iter_document_chunks, splitter_signature
+from agents.vector_store import CHROMA_DB_PATH, get_lexical_index, get_vector_store, upsert_chunks
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "64"))
+INGEST_EMBED_WORKERS = int(os.getenv("INGEST_EMBED_WORKERS", "2"))
+
+manifest = DocumentManifest(CHROMA_DB_PATH)
+
+
+# Upload cũ (trước khi có manifest) lưu source là đường dẫn file tạm "<thư mục>/<uuid>_<tên file>"
+LEGACY_UPLOAD_SOURCE = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}_(.+)$")
+
+_legacy_uploads: Optional[Dict[str, List[str]]] = None
+_legacy_lock = threading.Lock()
+
+
+class IngestionCancelled(Exception):
+    """Tác vụ nạp tài liệu bị hủy giữa chừng."""
+
+
+def document_hash(file_path: str) -> str:
+    """Hash nội dung file kèm cấu hình chia chunk: đổi chunk_size/overlap/separators thì nạp lại."""
+    return hashlib.sha256(f"{file_hash(file_path)}\0{splitter_signature()}".encode("utf-8")).hexdigest()
+
+
+def text_hash(text: str) -> str:
+    """Như `document_hash` cho nội dung không nằm trong file (kết quả web search)."""
+    content = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return hashlib.sha256(f"{content}\0{splitter_signature()}".encode("utf-8")).hexdigest()
+
+
+def _legacy_chunk_ids(collection, source: str) -> List[str]:
+    """
+    Id các chunk của `source` được nạp trước khi có manifest (id ngẫu nhiên): chunk có đúng
+    source (load_json), hoặc upload qua admin có source là file tạm "<uuid>_<source>".
+    Danh sách upload cũ được quét một lần mỗi tiến trình.
+    """
+    global _legacy_uploads
+    ids = collection.get(where={"source": source}, include=[])["ids"]
+    with _legacy_lock:
+        if _legacy_uploads is None:
+            _legacy_uploads = {}
+            total = collection.count()
+            for offset in range(0, total, 5000):
+                page = collection.get(include=["metadatas"], limit=5000, offset=offset)
+                for doc_id, metadata in zip(page["ids"], page["metadatas"]):
+                    match = LEGACY_UPLOAD_SOURCE.match(os.path.basename(str((metadata or {}).get("source", ""))))
+                    if match:
+                        _legacy_uploads.setdefault(match.group(1), []).append(doc_id)
+        return ids + _legacy_uploads.get(source, [])
+
+
+def sync_document(source: str, chunks: Iterable[Document], content_hash: str, vector_store, manifest: DocumentManifest,
+                  lexical_index=None, on_progress: Optional[Callable[[dict], None]] = None,
+                  cancel_event: Optional[threading.Event] = None, batch_size: int = INGEST_BATCH_SIZE,
+                  workers: int = INGEST_EMBED_WORKERS) -> dict:
+    """
+    Đồng bộ một tài liệu (các chunk của nó) với kho tri thức theo manifest:
+    - hash nội dung (`document_hash`: file + cấu hình chia chunk) trùng với lần nạp trước: bỏ qua toàn bộ;
+    - chunk đã có (cùng id = hash(source, nội dung)): giữ nguyên, không embedding lại;
+    - chunk mới: embedding theo lô trên `workers` luồng, ghi vào Chroma theo từng lô;
+    - chunk của phiên bản cũ không còn xuất hiện: xóa.
+    Bị hủy hoặc lỗi giữa chừng thì xóa các chunk mới đã ghi, phiên bản cũ giữ nguyên.
+    Trả về thống kê {"chunks", "embedded", "unchanged", "deleted", "batches", "skipped"}.
+    """
+    stats = {"chunks": 0, "embedded": 0, "unchanged": 0, "deleted": 0, "batches": 0, "skipped": False}
+    collection = vector_store._collection
+    entry = manifest.get(source)
+    if entry is not None and entry["content_hash"] == content_hash:
+        stats.update(skipped=True, unchanged=len(entry["chunk_ids"]))
+        logger.info(f"⏭️ {source} không thay đổi, bỏ qua.")
+        return stats
+    if entry is not None:
+        previous_ids = set(entry["chunk_ids"])
+    else:
+        # Chưa có trong manifest: các chunk được nạp trước khi có manifest (id ngẫu nhiên)
+        previous_ids = set(_legacy_chunk_ids(collection, source))
+    existing_ids = set(collection.get(ids=list(previous_ids), include=[])["ids"]) if previous_ids else set()
+
+    embeddings = vector_store.embeddings
+    chunk_ids: List[str] = []
+    seen = set()
+    written_ids: List[str] = []
+    pending = deque()
+
+    def report():
+        if on_progress is not None:
+            on_progress(dict(stats))
+
+    def check_cancelled():
+        if cancel_event is not None and cancel_event.is_set():
+            raise IngestionCancelled(f"Đã hủy nạp {source}")
+
+    def submit(batch):
+        texts = [doc.page_content for _, doc in batch]
+        pending.append((batch, executor.submit(embeddings.embed_documents, texts)))
+
+    def drain(max_pending: int):
+        # Ghi theo đúng thứ tự các lô; chờ cho tới khi số lô đang embedding <= max_pending
+        while len(pending) > max_pending:
+            batch, future = pending.popleft()
+            vectors = future.result()
+            check_cancelled()
+            written_ids.extend(upsert_chunks(vector_store, [doc for _, doc in batch], vectors,
+                                             ids=[doc_id for doc_id, _ in batch], lexical_index=lexical_index))
+            stats["embedded"] += len(batch)
+            stats["batches"] += 1
+            report()
+
+    executor = ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix="ingest-embed")
+    try:
+        batch = []
+        for chunk in chunks:
+            check_cancelled()
+            if not chunk.page_content.strip():
+                continue
+            doc_id = chunk_id(source, chunk.page_content)
+            if doc_id in seen:
+                continue
+            seen.add(doc_id)
+            chunk_ids.append(doc_id)
+            stats["chunks"] += 1
+            if doc_id in existing_ids:
+                stats["unchanged"] += 1
+                continue
+            batch.append((doc_id, chunk))
+            if len(batch) >= batch_size:
+                submit(batch)
+                batch = []
+                drain(max(workers, 1))
+        if batch:
+            submit(batch)
+        drain(0)
+    except BaseException:
+        for _, future in pending:
+            future.cancel()
+        if written_ids:
+            collection.delete(ids=written_ids)
+            if lexical_index is not None:
+                lexical_index.remove(written_ids)
+            logger.warning(f"↩️ Đã xóa {len(written_ids)} chunk mới ghi của {source}")
+        raise
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+    removed_ids = [doc_id for doc_id in existing_ids if doc_id not in seen]
+    if removed_ids:
+        collection.delete(ids=removed_ids)
+        if lexical_index is not None:
+            lexical_index.remove(removed_ids)
+    stats["deleted"] = len(removed_ids)
+    manifest.update(source, content_hash, chunk_ids)
+    if stats["embedded"] or stats["deleted"]:
+        # Câu trả lời đã cache (ở mọi worker) có thể không còn đúng với kho tri thức mới
+        answer_cache.clear()
+    report()
+    return stats
+
+
+def ingest_file(file_path: str, filename: str, on_progress: Optional[Callable[[dict], None]] = None,
+                cancel_event: Optional[threading.Event] = None, batch_size: int = INGEST_BATCH_SIZE,
+                workers: int = INGEST_EMBED_WORKERS, vector_store=None) -> dict:
+    """
+    Nạp một file upload vào kho tri thức (chạy đồng bộ, gọi từ thread pool): đọc từng trang,
+    chia chunk và đồng bộ theo manifest với source = tên file gốc, nên upload lại cùng tên
+    file thì thay thế phiên bản trước. Trả về thống kê của `sync_document` kèm "pages".
+    """
+    vector_store = vector_store if vector_store is not None else get_vector_store()
+    if vector_store is None:
+        raise RuntimeError("Vector store chưa được khởi tạo")
+    pages = {"pages": 0}
+
+    def iter_chunks():
+        # Đọc + chia chunk trong process pool, nhận dần từng khoảng trang
+        for page_count, chunks in iter_document_chunks(file_path, filename):
+            pages["pages"] += page_count
+            yield from chunks
+
+    def report(stats: dict):
+        if on_progress is not None:
+            on_progress({**stats, **pages})
+
+    stats = sync_document(filename, iter_chunks(), document_hash(file_path), vector_store, manifest,
+                          lexical_index=get_lexical_index(), on_progress=report, cancel_event=cancel_event,
+                          batch_size=batch_size, workers=workers)
+    return {**stats, **pages}
@@ -0,0 +1,158 @@
+"""
+Chỉ mục tra cứu trực tiếp: class id của model phân loại ảnh -> các đoạn tri thức của bệnh
+tương ứng trong plant.json. Được build lúc nạp dữ liệu (load_json.py) và lưu thành
+label_index.json cạnh thư mục Chroma; chẩn đoán từ ảnh lấy context theo key thay vì
+embedding + tìm kiếm ANN + rerank.
+"""
+import json
+import logging
+import os
+import threading
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+LABEL_INDEX_FILE = "label_index.json"
+
+# class id (agents/predict_image.class_names) -> id bản ghi trong plant.json.
+# None: plant.json chưa có bản ghi tương ứng, chẩn đoán dùng tìm kiếm vector như cũ.
+CLASS_RECORD_IDS = {
+    0: 0,           # Bệnh bạc lá cây lúa
+    1: 2,           # Bệnh cháy lá cây ngô phía Bắc (Exserohilum turcicum - đốm lá lớn)
+    2: 11,          # Bệnh nấm phấn trắng trên cây bí
+    3: "TOM-014",   # Nhện đỏ hai đốm cây cà chua
+    4: "TOM-017",   # Virus vàng xoăn lá cây cà chua
+    5: None,        # bệnh cháy lá cây lúa
+    6: 4,           # bệnh cháy lá sớm trên cây cà chua (Alternaria solani)
+    7: 8,           # bệnh ghẻ trên cây táo
+    8: 9,           # bệnh gỉ sắt trên cây ngô
+    9: None,        # bệnh mốc sương sớm cây khoai tây
+    10: 12,         # bệnh phấn trắng cây cherry
+    11: 13,         # bệnh sương mai cây khoai tây
+    12: 14,         # bệnh thối đen cây nho
+    13: 1,          # bệnh đạo ôn cây lúa
+    14: 5,          # bệnh đốm lá Septoria cây cà chua
+    15: 6,          # bệnh đốm lá xám cây ngô
+    16: 7,          # bệnh đốm nâu trên cây lúa
+    17: 32,         # bọ cánh cứng gây hại cho cây lúa
+    18: 3,          # cháy bìa lá cây lúa
+    19: 26,         # cháy lá cây dâu tây
+    20: 89,         # cây cà chua khỏe mạnh
+    21: 39,         # cây dâu tây lành mạnh
+    22: 28,         # cây khoai tây khỏe mạnh
+    23: 19,         # cây lúa khỏe mạnh
+    24: 18,         # cây mâm xôi khỏe mạnh
+    25: 37,         # cây ngô khỏe mạnh
+    26: 22,         # cây nho khỏe mạnh
+    27: 38,         # cây táo khỏe mạnh
+    28: 90,         # cây việt quất khỏe mạnh
+    29: 111,        # cây đào khỏe mạnh
+    30: 222,        # cây đậu nành khỏe mạnh
+    31: 98,         # cây ớt chuông khỏe mạnh
+    32: 36,         # nấm lá cây cà chua
+    33: None,       # quả cherry khỏe mạnh
+    34: "APP-010",  # rỉ táo tuyết trùng cây táo
+    35: "GRP-011",  # sởi đen cây nho
+    36: "APP-011",  # thối đen trên cây táo
+    37: "TOM-016",  # virus khảm cây cà chua
+    38: "CIT-012",  # vàng lá gân xanh cây cam
+    39: 24,         # Đốm mục tiêu trên cây cà chua
+    40: 25,         # đốm lá cây nho
+    41: 23,         # đốm vi khuẩn cây cà chua
+    42: 53,         # đốm vi khuẩn cây đào
+    43: 49,         # đốm vi khuẩn cây ớt chuông
+    44: "TOM-015",  # ốc sương trên cây cà chua
+}
+RECORD_CLASS_IDS = {str(record_id): class_id for class_id, record_id in CLASS_RECORD_IDS.items()
+                    if record_id is not None}
+
+
+def class_id_for_record(record_id) -> Optional[int]:
+    return RECORD_CLASS_IDS.get(str(record_id))
+
+
+def build_label_index(chunks: list) -> Dict[str, List[dict]]:
+    """Gom các chunk (Document có metadata 'id' của plant.json) theo class id, giữ thứ tự trong tài liệu."""
+    index: Dict[str, List[dict]] = {}
+    for chunk in chunks:
+        class_id = class_id_for_record(chunk.metadata.get("id"))
+        if class_id is None:
+            continue
+        index.setdefault(str(class_id), []).append({
+            "content": chunk.page_content,
+            "source": chunk.metadata.get("source", "Local DB"),
+            "start_index": chunk.metadata.get("start_index", 0),
+        })
+    for entries in index.values():
+        entries.sort(key=lambda entry: entry["start_index"])
+    return index
+
+
+def save_label_index(index: Dict[str, List[dict]], chroma_db_path: str) -> str:
+    path = os.path.join(chroma_db_path, LABEL_INDEX_FILE)
+    os.makedirs(chroma_db_path, exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    logger.info(f"✅ Đã lưu chỉ mục nhãn ({len(index)} lớp) tại: {path}")
+    return path
+
+
+def merge_label_index(index: Dict[str, List[dict]], sources, chroma_db_path: str) -> Dict[str, List[dict]]:
+    """
+    Thay các mục của `sources` trong label_index.json bằng `index` (build từ các nguồn đó),
+    giữ nguyên mục của các nguồn khác (nhiều file JSON dùng chung một chỉ mục).
+    """
+    sources = set(sources)
+    path = os.path.join(chroma_db_path, LABEL_INDEX_FILE)
+    merged: Dict[str, List[dict]] = {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            existing = json.load(f)
+    except FileNotFoundError:
+        existing = {}
+    for class_id, entries in existing.items():
+        kept = [entry for entry in entries if entry.get("source") not in sources]
+        if kept:
+            merged[class_id] = kept
+    for class_id, entries in index.items():
+        merged.setdefault(class_id, []).extend(entries)
+    save_label_index(merged, chroma_db_path)
+    return merged
+
+
+class LabelIndex:
+    """Đọc label_index.json (tự nạp lại khi file được build lại)."""
+
+    def __init__(self, chroma_db_path: str):
+        self.path = os.path.join(chroma_db_path, LABEL_INDEX_FILE)
+        self._index: Dict[str, List[dict]] = {}
+        self._mtime: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            self._index, self._mtime = {}, None
+            return
+        if mtime == self._mtime:
+            return
+        with self._lock:
+            if mtime == self._mtime:
+                return
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._index = json.load(f)
+                self._mtime = mtime
+                logger.info(f"📖 Đã nạp chỉ mục nhãn: {len(self._index)} lớp")
+            except Exception as e:
+                logger.error(f"❌ Lỗi khi đọc chỉ mục nhãn {self.path}: {e}")
+
+    def lookup(self, class_id) -> List[dict]:
+        """Các đoạn tri thức của class id, rỗng nếu chưa có."""
+        if class_id is None:
+            return []
+        self._refresh()
+        return self._index.get(str(class_id), [])
@@ -0,0 +1,159 @@
+"""
+Chỉ mục từ khóa BM25 trong bộ nhớ cho các chunk của Chroma, bổ sung cho tìm kiếm vector:
+bắt chính xác tên bệnh tiếng Việt và tên khoa học (vd. "Xanthomonas oryzae") mà embedding
+hay bỏ sót. Kết quả hai bên được trộn bằng Reciprocal Rank Fusion.
+"""
+import heapq
+import logging
+import math
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from langchain_core.documents import Document
+
+from agents.crops import crops_of
+
+logger = logging.getLogger(__name__)
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Tách từ tiếng Việt: chuẩn hóa NFC, chữ thường, mỗi âm tiết là một token, thêm bigram
+    các âm tiết liền kề ("đạo_ôn") để giữ từ ghép nhiều âm tiết.
+    """
+    syllables = _WORD_RE.findall(unicodedata.normalize("NFC", text or "").lower())
+    return syllables + [f"{a}_{b}" for a, b in zip(syllables, syllables[1:])]
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """Trộn nhiều danh sách id đã xếp hạng: score(id) = sum(1 / (k + hạng))."""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class BM25Index:
+    """
+    Chỉ mục ngược BM25 (Okapi) theo id chunk của Chroma, thêm/xóa tăng dần.
+    `sync_with` đối chiếu với collection Chroma để bắt các thay đổi từ tiến trình khác
+    (load_json, worker khác). Các chunk được chia phân vùng theo cây trồng (metadata
+    `crops`) để `search(..., crops=...)` chỉ chấm điểm chunk của các cây trồng đó.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75, resync_seconds: float = 60.0):
+        self.k1 = k1
+        self.b = b
+        self.resync_seconds = resync_seconds
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._lengths: Dict[str, int] = {}
+        self._docs: Dict[str, Document] = {}
+        self._partitions: Dict[str, Set[str]] = {}
+        self._total_length = 0
+        self._last_sync = 0.0
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def add(self, ids: Iterable[str], documents: Iterable[Document]):
+        with self._lock:
+            for doc_id, doc in zip(ids, documents):
+                if doc_id in self._docs:
+                    self._remove_one(doc_id)
+                counts = Counter(tokenize(doc.page_content))
+                for term, tf in counts.items():
+                    self._postings.setdefault(term, {})[doc_id] = tf
+                length = sum(counts.values())
+                self._lengths[doc_id] = length
+                self._total_length += length
+                self._docs[doc_id] = Document(page_content=doc.page_content, metadata=dict(doc.metadata or {}),
+                                              id=doc_id)
+                for crop in crops_of(doc.metadata):
+                    self._partitions.setdefault(crop, set()).add(doc_id)
+
+    def _remove_one(self, doc_id: str):
+        doc = self._docs.pop(doc_id)
+        for term in set(tokenize(doc.page_content)):
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+        self._total_length -= self._lengths.pop(doc_id)
+        for crop in crops_of(doc.metadata):
+            partition = self._partitions.get(crop)
+            if partition is not None:
+                partition.discard(doc_id)
+                if not partition:
+                    del self._partitions[crop]
+
+    def remove(self, ids: Iterable[str]):
+        with self._lock:
+            for doc_id in ids:
+                if doc_id in self._docs:
+                    self._remove_one(doc_id)
+
+    def sync_with(self, collection, force: bool = False):
+        """Đồng bộ với collection Chroma (chỉ tải nội dung các chunk mới)."""
+        if not force and len(self._docs) == collection.count() and \
+                time.monotonic() - self._last_sync < self.resync_seconds:
+            return
+        with self._lock:
+            current_ids = set(collection.get(include=[])["ids"])
+            removed = [doc_id for doc_id in self._docs if doc_id not in current_ids]
+            added = [doc_id for doc_id in current_ids if doc_id not in self._docs]
+            if removed:
+                self.remove(removed)
+            if added:
+                data = collection.get(ids=added, include=["documents", "metadatas"])
+                self.add(data["ids"], [Document(page_content=content or "", metadata=metadata or {})
+                                       for content, metadata in zip(data["documents"], data["metadatas"])])
+            self._last_sync = time.monotonic()
+        if removed or added:
+            logger.info(f"🔤 Đồng bộ chỉ mục BM25: +{len(added)} / -{len(removed)} chunk (tổng {len(self._docs)})")
+
+    def search(self, query: str, k: int = 4, crops: Optional[Iterable[str]] = None) -> List[Tuple[Document, float]]:
+        """BM25 top-k; nếu có `crops` thì chỉ xét các chunk thuộc những cây trồng đó."""
+        terms = set(tokenize(query))
+        with self._lock:
+            n_docs = len(self._docs)
+            if not n_docs or not terms:
+                return []
+            allowed: Optional[Set[str]] = None
+            if crops:
+                allowed = set().union(*(self._partitions.get(crop, ()) for crop in crops))
+                if not allowed:
+                    return []
+            avg_length = self._total_length / n_docs
+            scores: Dict[str, float] = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                if allowed is None:
+                    candidates = postings.items()
+                elif len(allowed) < len(postings):
+                    candidates = ((doc_id, postings[doc_id]) for doc_id in allowed if doc_id in postings)
+                else:
+                    candidates = ((doc_id, tf) for doc_id, tf in postings.items() if doc_id in allowed)
+                for doc_id, tf in candidates:
+                    norm = self.k1 * (1 - self.b + self.b * self._lengths[doc_id] / avg_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+            top = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+            return [(self._docs[doc_id], score) for doc_id, score in top]
+
+    def get(self, doc_id: str) -> Optional[Document]:
+        return self._docs.get(doc_id)
+
+    def stats(self) -> dict:
+        return {"documents": len(self._docs), "terms": len(self._postings),
+                "partitions": {crop: len(ids) for crop, ids in self._partitions.items()}}
@@ -0,0 +1,92 @@
+"""
+Manifest các tài liệu đã nạp vào kho tri thức: source -> hash nội dung file + danh sách id
+chunk. Id chunk là hash của (source, nội dung chunk) nên nạp lại cùng tài liệu chỉ embedding
+các chunk mới, bỏ qua chunk không đổi và xóa chunk không còn trong phiên bản mới.
+Lưu thành manifest.json cạnh thư mục Chroma.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "manifest.json"
+
+
+def chunk_id(source: str, content: str) -> str:
+    return hashlib.sha256(f"{source}\0{content}".encode("utf-8")).hexdigest()[:32]
+
+
+def file_hash(path: str, block_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class DocumentManifest:
+    """
+    Đọc/ghi manifest.json. Mỗi lần ghi đọc lại file nếu tiến trình khác (load_json, worker khác)
+    vừa sửa, rồi ghi nguyên tử bằng file tạm + os.replace.
+    """
+
+    def __init__(self, chroma_db_path: str):
+        self.path = os.path.join(chroma_db_path, MANIFEST_FILE)
+        self._documents: Dict[str, dict] = {}
+        self._mtime: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            self._documents, self._mtime = {}, None
+            return
+        if mtime == self._mtime:
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._documents = json.load(f).get("documents", {})
+            self._mtime = mtime
+        except Exception as e:
+            logger.error(f"❌ Lỗi khi đọc manifest {self.path}: {e}")
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"documents": self._documents}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        self._mtime = os.stat(self.path).st_mtime
+
+    def get(self, source: str) -> Optional[dict]:
+        """{"content_hash", "chunk_ids", "updated_at"} của tài liệu, None nếu chưa nạp."""
+        with self._lock:
+            self._refresh()
+            entry = self._documents.get(source)
+            return dict(entry) if entry is not None else None
+
+    def update(self, source: str, content_hash: str, chunk_ids: List[str]):
+        with self._lock:
+            self._refresh()
+            self._documents[source] = {"content_hash": content_hash, "chunk_ids": list(chunk_ids),
+                                       "updated_at": time.time()}
+            self._save()
+
+    def remove(self, source: str) -> Optional[dict]:
+        with self._lock:
+            self._refresh()
+            entry = self._documents.pop(source, None)
+            if entry is not None:
+                self._save()
+            return entry
+
+    def sources(self) -> List[str]:
+        with self._lock:
+            self._refresh()
+            return list(self._documents)
@@ -0,0 +1,186 @@
+import importlib.util
+import logging
+import os
+import shutil
+from typing import Callable, Optional, Tuple
+
+import torch
+import torch.nn as nn
+
+logger = logging.getLogger(__name__)
+
+# eager     : PyTorch fp32 (mặc định)
+# onnx      : đồ thị ONNX chạy bằng ONNX Runtime (fp32)
+# onnx-int8 : đồ thị ONNX đã lượng tử hóa INT8 (trọng số Conv + Linear) bằng ONNX Runtime
+# Không có "int8" PyTorch cho model ảnh: quantize_dynamic chỉ lượng tử hóa lớp Linear, với ResNet50
+# chỉ là lớp fc cuối, phần Conv vẫn chạy fp32 nên không nhanh hơn.
+SUPPORTED_BACKENDS = ("eager", "onnx", "onnx-int8")
+# Reranker (CrossEncoder) gần như toàn lớp Linear nên dynamic quantization của PyTorch có tác dụng
+RERANKER_BACKENDS = ("eager", "int8", "onnx", "onnx-int8")
+
+# Thư viện cần cho từng backend; thiếu thư viện là lỗi cấu hình, không âm thầm quay về eager
+BACKEND_REQUIREMENTS = {
+    "onnx": ("onnx", "onnxruntime"),
+    "onnx-int8": ("onnx", "onnxruntime"),
+}
+RERANKER_BACKEND_REQUIREMENTS = {
+    "onnx": ("onnxruntime", "optimum"),
+    "onnx-int8": ("onnxruntime", "optimum"),
+}
+
+Runner = Callable[[torch.Tensor], torch.Tensor]
+
+
+def _require(name: str, requirements: dict):
+    """Ném ImportError nếu backend `name` được cấu hình nhưng thiếu thư viện của nó."""
+    missing = [module for module in requirements.get(name, ()) if importlib.util.find_spec(module) is None]
+    if missing:
+        raise ImportError(f"Backend '{name}' cần cài {', '.join(missing)} (xem requirements.txt)")
+
+
+def eager_runner(model: nn.Module) -> Runner:
+    def run(x: torch.Tensor) -> torch.Tensor:
+        with torch.no_grad():
+            return model(x)
+    return run
+
+
+def _write_atomic(path: str, write: Callable[[str], None]):
+    """
+    Gọi `write(tmp_path)` rồi os.replace sang `path`: worker khác khởi động cùng lúc không
+    bao giờ đọc phải file ONNX ghi dở, worker chết giữa chừng không để lại file hỏng.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def export_onnx(model: nn.Module, onnx_path: str, input_size: int = 224):
+    """Xuất model sang ONNX với batch động."""
+    dummy = torch.randn(1, 3, input_size, input_size)
+    _write_atomic(onnx_path, lambda tmp_path: torch.onnx.export(
+        model, dummy, tmp_path,
+        input_names=["input"], output_names=["logits"],
+        dynamic_axes={"input": {0: "batch"}, "logits": {0: "batch"}},
+        opset_version=17,
+        dynamo=False
+    ))
+    logger.info(f"✅ Đã xuất model ONNX tại: {onnx_path}")
+
+
+def onnx_runner(model: nn.Module, onnx_path: str, quantize: bool = False) -> Runner:
+    import onnxruntime as ort
+
+    if not os.path.exists(onnx_path):
+        export_onnx(model, onnx_path)
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+
+        int8_path = onnx_path.replace(".onnx", ".int8.onnx")
+        if not os.path.exists(int8_path):
+            _write_atomic(int8_path, lambda tmp_path: quantize_dynamic(onnx_path, tmp_path,
+                                                                       weight_type=QuantType.QInt8))
+            logger.info(f"✅ Đã lượng tử hóa model ONNX INT8 tại: {int8_path}")
+        onnx_path = int8_path
+
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = torch.get_num_threads()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    session = ort.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+
+    def run(x: torch.Tensor) -> torch.Tensor:
+        logits = session.run(None, {"input": x.contiguous().numpy()})[0]
+        return torch.from_numpy(logits)
+    return run
+
+
+def load_backend(name: str, model: nn.Module, onnx_path: Optional[str] = None) -> Tuple[str, Runner]:
+    """
+    Tạo hàm suy luận theo backend được cấu hình.
+    Backend không hợp lệ hoặc xuất/khởi tạo lỗi thì quay về eager; thiếu onnxruntime thì ném ImportError.
+    Trả về (tên backend thực sự dùng, runner).
+    """
+    name = (name or "eager").lower()
+    if name not in SUPPORTED_BACKENDS:
+        logger.warning(f"⚠️ Backend '{name}' không được hỗ trợ, dùng eager. Hỗ trợ: {SUPPORTED_BACKENDS}")
+        return "eager", eager_runner(model)
+    _require(name, BACKEND_REQUIREMENTS)
+    try:
+        if name in ("onnx", "onnx-int8"):
+            if not onnx_path:
+                raise ValueError("Chưa cấu hình đường dẫn model ONNX")
+            runner = onnx_runner(model, onnx_path, quantize=name == "onnx-int8")
+        else:
+            runner = eager_runner(model)
+    except Exception as e:
+        logger.error(f"❌ Không khởi tạo được backend '{name}' ({e}), quay về eager.")
+        return "eager", eager_runner(model)
+    logger.info(f"✅ Backend suy luận: {name}")
+    return name, runner
+
+
+# --- CrossEncoder (reranker) ---
+
+_ONNX_INT8_FILE = "onnx/model_qint8_avx2.onnx"
+
+
+def _onnx_int8_cross_encoder(model_name: str, onnx_dir: str):
+    from sentence_transformers import CrossEncoder
+
+    if not os.path.exists(os.path.join(onnx_dir, _ONNX_INT8_FILE)):
+        from sentence_transformers.backend import export_dynamic_quantized_onnx_model
+
+        # Xuất vào thư mục tạm rồi đổi tên: không worker nào thấy thư mục xuất dở
+        tmp_dir = f"{onnx_dir.rstrip(os.sep)}.{os.getpid()}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        try:
+            model = CrossEncoder(model_name, backend="onnx")
+            model.save_pretrained(tmp_dir)
+            export_dynamic_quantized_onnx_model(model, "avx2", tmp_dir)
+            if os.path.isdir(onnx_dir) and not os.path.exists(os.path.join(onnx_dir, _ONNX_INT8_FILE)):
+                shutil.rmtree(onnx_dir)  # bản dở dang từ phiên bản cũ
+            try:
+                os.replace(tmp_dir, onnx_dir)
+                logger.info(f"✅ Đã lượng tử hóa reranker ONNX INT8 tại: {onnx_dir}")
+            except OSError:
+                # Worker khác đã xuất xong trước
+                pass
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    return CrossEncoder(onnx_dir, backend="onnx", model_kwargs={"file_name": _ONNX_INT8_FILE})
+
+
+def load_cross_encoder(name: str, model_name: str, onnx_dir: Optional[str] = None):
+    """
+    Load CrossEncoder theo backend (RERANKER_BACKENDS). Các backend ONNX cần onnxruntime + optimum,
+    thiếu thì ném ImportError; backend không hợp lệ hoặc xuất/khởi tạo lỗi thì quay về eager.
+    """
+    from sentence_transformers import CrossEncoder
+
+    name = (name or "eager").lower()
+    if name not in RERANKER_BACKENDS:
+        logger.warning(f"⚠️ Backend '{name}' không được hỗ trợ, dùng eager. Hỗ trợ: {RERANKER_BACKENDS}")
+        return CrossEncoder(model_name)
+    if name == "eager":
+        return CrossEncoder(model_name)
+    _require(name, RERANKER_BACKEND_REQUIREMENTS)
+    try:
+        if name == "int8":
+            model = CrossEncoder(model_name, device="cpu")
+            torch.ao.quantization.quantize_dynamic(model.model, {nn.Linear}, dtype=torch.qint8, inplace=True)
+        elif name == "onnx":
+            model = CrossEncoder(model_name, backend="onnx")
+        elif name == "onnx-int8":
+            if not onnx_dir:
+                raise ValueError("Chưa cấu hình thư mục lưu reranker ONNX")
+            model = _onnx_int8_cross_encoder(model_name, onnx_dir)
+    except Exception as e:
+        logger.error(f"❌ Không khởi tạo được reranker backend '{name}' ({e}), quay về eager.")
+        return CrossEncoder(model_name)
+    logger.info(f"✅ Reranker backend: {name}")
+    return model
@@ -1,13 +1,34 @@
+import binascii
+import io
 import os
+from typing import BinaryIO, Union
 
+import numpy as np
 import torch
 from torchvision import transforms
 from PIL import Image
 from dotenv import load_dotenv
 from torchvision import models
 import torch.nn as nn
+from agents.batch_inference import MicroBatcher
+from agents.model_backends import load_backend
+from agents.image_cache import PerceptualHashCache, dhash
+from model_registry import registry
 
 load_dotenv()
+PREDICT_MAX_BATCH_SIZE = int(os.getenv("PREDICT_MAX_BATCH_SIZE", "8"))
+PREDICT_MAX_WAIT_MS = float(os.getenv("PREDICT_MAX_WAIT_MS", "5"))
+BASE64_CHUNK_SIZE = 64 * 1024
+# eager | onnx | onnx-int8 (xem agents/model_backends.py)
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "eager")
+# Cache kết quả theo perceptual hash (0 = tắt cache)
+IMAGE_CACHE_SIZE = int(os.getenv("IMAGE_CACHE_SIZE", "512"))
+IMAGE_CACHE_MAX_DISTANCE = int(os.getenv("IMAGE_CACHE_MAX_DISTANCE", "4"))
+# Giải mã JPEG ở độ phân giải giảm (draft mode) thay vì giải mã toàn bộ ảnh gốc
+PREPROCESS_DRAFT = os.getenv("PREPROCESS_DRAFT", "1") == "1"
+INPUT_SIZE = 224
+# Giữ ảnh draft >= 2x kích thước đầu vào để bước resize sau đó vẫn khử răng cưa như pipeline cũ
+DRAFT_SIZE = INPUT_SIZE * 2
 class_names = {0: 'Bệnh bạc lá cây lúa',
  1: 'Bệnh cháy lá cây ngô phía Bắc',
  2: 'Bệnh nấm phấn trắng trên cây bí',
@@ -56,16 +77,35 @@ class_names = {0: 'Bệnh bạc lá cây lúa',
 current_dir = os.path.dirname(os.path.abspath(__file__))
 MODEL_PATH = os.path.join(current_dir, "..", "model", "disease_model.pth")
 MODEL_PATH = os.path.normpath(MODEL_PATH)
-model = models.resnet50(weights=None)
-model.fc = nn.Sequential(
-    nn.Linear(model.fc.in_features,512),
-    nn.ReLU(),
-    nn.Dropout(0.1),
-    nn.Linear(512,len(class_names))
-)
-model.load_state_dict(torch.load(MODEL_PATH, map_location="cpu"))
-model.eval()
+ONNX_MODEL_PATH = os.getenv("ONNX_MODEL_PATH", os.path.splitext(MODEL_PATH)[0] + ".onnx")
+
+
+def load_model() -> nn.Module:
+    """Load ResNet50 + head phân loại từ MODEL_PATH (fp32, eval mode)."""
+    model = models.resnet50(weights=None)
+    model.fc = nn.Sequential(
+        nn.Linear(model.fc.in_features,512),
+        nn.ReLU(),
+        nn.Dropout(0.1),
+        nn.Linear(512,len(class_names))
+    )
+    model.load_state_dict(torch.load(MODEL_PATH, map_location="cpu"))
+    model.eval()
+    return model
+
+
+def _load_classifier():
+    _, run_model = load_backend(INFERENCE_BACKEND, load_model(), onnx_path=ONNX_MODEL_PATH)
+    return run_model
+
+
+def _warmup_classifier(run_model):
+    with torch.no_grad():
+        run_model(torch.zeros(1, 3, INPUT_SIZE, INPUT_SIZE))
+
 
+# Model chỉ được load khi cần (hoặc song song trong lifespan của app)
+registry.register("classifier", _load_classifier, warmup=_warmup_classifier)
 
 
 transform = transforms.Compose([
@@ -74,15 +114,104 @@ transform = transforms.Compose([
     transforms.Normalize(mean=[0.485, 0.456, 0.406],
                          std=[0.229, 0.224, 0.225])
 ])
-def predict(image_path:str):
-    image = Image.open(image_path).convert('RGB')
-    x = transform(image).unsqueeze(0)
+# Hệ số chuẩn hóa gộp: (x / 255 - mean) / std = x * scale - offset
+_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32).reshape(3, 1, 1)
+_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32).reshape(3, 1, 1)
+_SCALE = 1.0 / (255.0 * _STD)
+_OFFSET = _MEAN / _STD
+
+
+def open_image(source) -> Image.Image:
+    """
+    Mở ảnh và, với JPEG, yêu cầu libjpeg giảm độ phân giải ngay trong miền DCT
+    (1/2, 1/4, 1/8) sao cho ảnh vẫn >= DRAFT_SIZE ở cả hai chiều.
+    """
+    image = Image.open(source)
+    if PREPROCESS_DRAFT and image.format == "JPEG":
+        image.draft("RGB", (DRAFT_SIZE, DRAFT_SIZE))
+    return image
+
+
+def preprocess(image: Image.Image, out: torch.Tensor = None) -> torch.Tensor:
+    """
+    Tương đương `transform` nhưng chuẩn hóa vector hóa trên numpy và ghi thẳng
+    vào tensor `out` (3 x INPUT_SIZE x INPUT_SIZE) nếu được cấp sẵn.
+    """
+    image = image.convert("RGB")
+    if image.size != (INPUT_SIZE, INPUT_SIZE):
+        image = image.resize((INPUT_SIZE, INPUT_SIZE), Image.BILINEAR)
+    if out is None:
+        out = torch.empty((3, INPUT_SIZE, INPUT_SIZE), dtype=torch.float32)
+    dst = out.numpy()
+    np.multiply(np.asarray(image).transpose(2, 0, 1), _SCALE, out=dst)
+    np.subtract(dst, _OFFSET, out=dst)
+    return out
+
+
+def predict_batch(tensors: list):
+    """Chạy model trên một batch ảnh đã tiền xử lý, trả về label/confidence cho từng ảnh."""
+    run_model = registry.get("classifier")
+    x = torch.stack(tensors)
     with torch.no_grad():
-        output = model(x)
+        output = run_model(x)
         probs = torch.softmax(output,dim = 1)
         conf, pred = torch.max(probs, dim = 1)
-    result ={
-        "label": class_names[pred.item()],
-        "confidence": conf.item()
-    }
-    return result
\ No newline at end of file
+    return [
+        {"class_id": p, "label": class_names[p], "confidence": c}
+        for p, c in zip(pred.tolist(), conf.tolist())
+    ]
+
+
+# Các request ảnh đồng thời được gom thành một forward pass duy nhất
+batcher = MicroBatcher(
+    predict_batch,
+    max_batch_size=PREDICT_MAX_BATCH_SIZE,
+    max_wait_ms=PREDICT_MAX_WAIT_MS,
+    name="disease-classifier"
+)
+image_cache = PerceptualHashCache(max_entries=IMAGE_CACHE_SIZE, max_distance=IMAGE_CACHE_MAX_DISTANCE)
+
+
+def decode_base64_image(data: str, chunk_size: int = BASE64_CHUNK_SIZE) -> io.BytesIO:
+    """
+    Giải mã chuỗi base64 theo từng đoạn vào một buffer trong bộ nhớ,
+    tránh giữ cùng lúc bản mã hóa dạng bytes và bản giải mã đầy đủ.
+    """
+    buffer = io.BytesIO()
+    leftover = ""
+    for start in range(0, len(data), chunk_size):
+        chunk = leftover + "".join(data[start:start + chunk_size].split())
+        usable = len(chunk) - len(chunk) % 4
+        if usable:
+            buffer.write(binascii.a2b_base64(chunk[:usable]))
+        leftover = chunk[usable:]
+    if leftover:
+        raise ValueError("Dữ liệu base64 không hợp lệ (độ dài không chia hết cho 4)")
+    buffer.seek(0)
+    return buffer
+
+
+def _predict_image(image: Image.Image):
+    image = image.convert('RGB')
+    image_hash = dhash(image) if image_cache.enabled else None
+    if image_hash is not None:
+        cached = image_cache.get(image_hash)
+        if cached is not None:
+            return cached
+    result = batcher(preprocess(image))
+    if image_hash is not None:
+        image_cache.put(image_hash, result)
+    return result
+
+
+def predict(image_path:str):
+    with open_image(image_path) as image:
+        return _predict_image(image)
+
+
+def predict_bytes(data: Union[bytes, bytearray, memoryview, BinaryIO]):
+    """Dự đoán bệnh từ ảnh nằm sẵn trong bộ nhớ (bytes hoặc buffer), không ghi file tạm."""
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        data = io.BytesIO(data)
+    with open_image(data) as image:
+        return _predict_image(image)
@@ -0,0 +1,242 @@
+"""
+Bộ định tuyến câu hỏi cục bộ chạy trước LLM.
+
+Phân loại các câu hiển nhiên (chào hỏi, cảm ơn, câu hỏi nêu rõ tên bệnh hoặc mô tả
+triệu chứng) thành chitchat / text_disease / normal_qa mà không cần gọi Cohere.
+Thứ tự: luật từ khóa (tên bệnh lấy từ plant.json) -> phân loại nearest-centroid trên
+embedding model hiện có (tắt mặc định, bật bằng FAST_ROUTER_CENTROID=1 sau khi hiệu chỉnh ngưỡng
+bằng benchmarks/bench_router.py). Trả về None khi không đủ tự tin để LLM xử lý như cũ.
+Tập câu hỏi đã gán nhãn data/router_eval.json dùng để đo precision của từng route.
+"""
+import json
+import logging
+import os
+import re
+import threading
+import unicodedata
+from dataclasses import dataclass
+from typing import List, Optional, Set
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+PLANT_JSON_PATH = os.path.join(current_dir, "..", "data", "plant.json")
+ROUTER_EVAL_PATH = os.path.join(current_dir, "..", "data", "router_eval.json")
+
+# Phân loại nearest-centroid chỉ có 8 câu mẫu mỗi lớp: tắt mặc định, câu không khớp luật do LLM phân loại
+FAST_ROUTER_CENTROID = os.getenv("FAST_ROUTER_CENTROID", "0") == "1"
+FAST_ROUTER_MIN_SIMILARITY = float(os.getenv("FAST_ROUTER_MIN_SIMILARITY", "0.55"))
+FAST_ROUTER_MIN_MARGIN = float(os.getenv("FAST_ROUTER_MIN_MARGIN", "0.05"))
+
+CHITCHAT_PHRASES = [
+    "xin chào", "chào", "chào bạn", "chào bot", "hello", "hi", "alo", "hey",
+    "cảm ơn", "cám ơn", "cảm ơn bạn", "thanks", "thank you", "ok", "oke", "okay", "vâng", "dạ",
+    "tạm biệt", "bye", "hẹn gặp lại", "bạn là ai", "bạn tên gì", "tốt lắm", "hay quá", "tuyệt vời",
+]
+# Từ đệm đi kèm câu chào/cảm ơn ("cảm ơn bạn nhiều nhé")
+CHITCHAT_FILLERS = ["bạn", "nhé", "nha", "nhá", "ạ", "à", "nhiều", "lắm", "rất", "rồi", "vậy", "nhe", "mình", "em"]
+CROP_KEYWORDS = [
+    "lúa", "ngô", "bắp", "cà chua", "khoai tây", "táo", "nho", "bí", "dâu tây", "đào", "đậu nành",
+    "ớt chuông", "ớt", "mâm xôi", "việt quất", "cam", "quýt", "bưởi", "chanh", "cherry", "anh đào",
+]
+PEST_KEYWORDS = [
+    "sâu", "rầy", "rệp", "bọ", "nhện đỏ", "nhện", "ốc", "ốc sên", "bọ trĩ", "bọ xít", "ruồi vàng",
+    "sâu đục thân", "sâu cuốn lá", "rầy nâu", "côn trùng", "chuột",
+]
+SYMPTOM_KEYWORDS = [
+    "đốm", "vàng lá", "héo", "cháy lá", "cháy mép", "thối", "nấm", "xoăn", "khô lá", "rụng",
+    "vết", "mốc", "phấn trắng", "gỉ", "rỉ", "loét", "sần", "teo", "úa", "thâm", "chấm",
+]
+SYMPTOM_PATTERNS = ["bị gì", "bệnh gì", "làm sao", "bị sao", "lá bị", "cây bị", "quả bị", "có vết", "xuất hiện"]
+KNOWLEDGE_KEYWORDS = [
+    "cách", "phòng", "trị", "chữa", "thuốc", "nguyên nhân", "chăm sóc", "bón", "phân", "tưới",
+    "trồng", "thu hoạch", "giống", "kỹ thuật", "là gì", "tác hại", "lây", "xử lý",
+]
+
+# Câu mẫu cho phân loại nearest-centroid
+SEED_EXAMPLES = {
+    "chitchat": [
+        "xin chào bạn", "cảm ơn bạn nhiều", "bạn là ai vậy", "hôm nay bạn thế nào",
+        "tạm biệt nhé", "bạn giỏi quá", "kể chuyện cười đi", "tôi buồn quá",
+    ],
+    "text_disease": [
+        "lá lúa có vết hình thoi màu xám", "lá cà chua bị vàng và xoăn lại",
+        "cây ngô có đốm nâu trên lá", "quả táo bị thối đen", "lá nho có đốm trắng như phấn",
+        "cây bị héo rũ từ ngọn", "mép lá bị cháy khô", "thân cây có vết loét chảy nhựa",
+    ],
+    "normal_qa": [
+        "cách phòng bệnh đạo ôn cho lúa", "nên bón phân gì cho cà chua", "kỹ thuật trồng khoai tây",
+        "thuốc trị bệnh sương mai", "khi nào thu hoạch ngô", "nguyên nhân gây bệnh bạc lá",
+        "cách chăm sóc cây táo mùa đông", "tưới nước cho dâu tây thế nào",
+    ],
+}
+
+
+@dataclass
+class RouteDecision:
+    query_type: str
+    reason: str
+    confidence: float
+
+
+def normalize(text: str) -> str:
+    text = unicodedata.normalize("NFC", text or "").lower()
+    text = re.sub(r"[^\w\s]", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def _contains_phrase(text: str, phrase: str) -> bool:
+    return re.search(rf"(?<!\w){re.escape(phrase)}(?!\w)", text) is not None
+
+
+def _contains_any(text: str, phrases: List[str]) -> bool:
+    return any(_contains_phrase(text, phrase) for phrase in phrases)
+
+
+# Tiền tố 2 âm tiết bị cắt giữa chừng, không phải tên bệnh ("đốm vi khuẩn" -> "đốm vi")
+DISEASE_TERM_STOPLIST = {"đốm vi", "bọ cánh", "tomato yellow", "f hại"}
+
+
+def _is_chitchat(text: str) -> bool:
+    """Cả câu chỉ gồm các cụm chào hỏi/cảm ơn (và từ đệm), không kèm nội dung khác."""
+    rest = text
+    for phrase in sorted(CHITCHAT_PHRASES + CHITCHAT_FILLERS, key=len, reverse=True):
+        rest = re.sub(rf"(?<!\w){re.escape(phrase)}(?!\w)", " ", rest)
+    return _contains_any(text, CHITCHAT_PHRASES) and not rest.strip()
+
+
+def load_disease_terms(json_path: str = PLANT_JSON_PATH) -> Set[str]:
+    """Tên bệnh rút gọn (vd. 'đạo ôn', 'bạc lá') và tên khoa học từ plant.json."""
+    try:
+        with open(json_path, "r", encoding="utf-8") as f:
+            items = json.load(f).get("danh_sach_benh", [])
+    except Exception as e:
+        logger.warning(f"⚠️ Không đọc được {json_path} cho fast router: {e}")
+        return set()
+
+    terms = set()
+    for item in items:
+        name = item.get("ten_benh", "")
+        if "khỏe mạnh" in name.lower():
+            continue
+        aliases = re.findall(r"\(([^)]*)\)", name)
+        for raw in [re.sub(r"\([^)]*\)", "", name)] + aliases:
+            core = normalize(raw)
+            core = re.sub(r"^(bệnh|còn gọi)\s+", "", core)
+            core = re.split(r"\s(?:trên\s)?cây\s|\sgây hại|\sdo\s", core)[0].strip()
+            syllables = core.split()
+            if len(syllables) >= 2:
+                terms.add(core)
+                terms.add(" ".join(syllables[:2]))
+        scientific = normalize(item.get("ten_khoa_hoc", "")).split()
+        if len(scientific) >= 2:
+            terms.add(" ".join(scientific[:2]))
+    # Bỏ cụm vô nghĩa: tiền tố bị cắt và cụm có âm tiết một ký tự (lỗi gõ trong dữ liệu)
+    return {term for term in terms
+            if term not in DISEASE_TERM_STOPLIST and all(len(syllable) > 1 for syllable in term.split())}
+
+
+class FastRouter:
+    def __init__(self, embeddings_getter=None, min_similarity: float = FAST_ROUTER_MIN_SIMILARITY,
+                 min_margin: float = FAST_ROUTER_MIN_MARGIN, use_centroid: bool = FAST_ROUTER_CENTROID):
+        self.disease_terms = load_disease_terms()
+        self.embeddings_getter = embeddings_getter
+        self.use_centroid = use_centroid
+        self.min_similarity = min_similarity
+        self.min_margin = min_margin
+        self._labels: List[str] = []
+        self._centroids: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+
+    def _rule_route(self, text: str, has_history: bool) -> Optional[RouteDecision]:
+        has_crop = _contains_any(text, CROP_KEYWORDS)
+        has_disease = _contains_any(text, list(self.disease_terms)) or _contains_any(text, PEST_KEYWORDS)
+        has_symptom = _contains_any(text, SYMPTOM_KEYWORDS)
+        has_knowledge = _contains_any(text, KNOWLEDGE_KEYWORDS)
+
+        is_chitchat = _is_chitchat(text)
+
+        # Với câu có lịch sử, chỉ định tuyến khi câu hỏi tự đủ nghĩa (nêu tên bệnh/cây) hoặc chỉ là
+        # câu chào/cảm ơn; câu tiếp nối ("ok vậy còn sâu đục thân?") cần LLM viết lại từ lịch sử
+        if has_history and not (has_disease or has_crop or is_chitchat):
+            return None
+        if is_chitchat:
+            return RouteDecision("chitchat", "chitchat phrase", 1.0)
+        if has_disease and has_knowledge:
+            return RouteDecision("normal_qa", "disease name + knowledge intent", 0.9)
+        if has_symptom and (has_crop or _contains_any(text, SYMPTOM_PATTERNS)) and not has_knowledge:
+            return RouteDecision("text_disease", "symptom description", 0.9)
+        return None
+
+    def _ensure_centroids(self, embeddings) -> bool:
+        if self._centroids is not None:
+            return True
+        with self._lock:
+            if self._centroids is None:
+                labels, centroids = [], []
+                for label, examples in SEED_EXAMPLES.items():
+                    vectors = np.asarray(embeddings.embed_documents(examples), dtype=np.float32)
+                    centroid = vectors.mean(axis=0)
+                    centroids.append(centroid / (np.linalg.norm(centroid) or 1.0))
+                    labels.append(label)
+                self._labels = labels
+                self._centroids = np.stack(centroids)
+        return True
+
+    def _centroid_route(self, text: str) -> Optional[RouteDecision]:
+        embeddings = self.embeddings_getter() if self.embeddings_getter else None
+        if embeddings is None:
+            return None
+        self._ensure_centroids(embeddings)
+        vector = np.asarray(embeddings.embed_query(text), dtype=np.float32)
+        vector /= np.linalg.norm(vector) or 1.0
+        scores = self._centroids @ vector
+        order = np.argsort(scores)[::-1]
+        best, second = float(scores[order[0]]), float(scores[order[1]])
+        if best >= self.min_similarity and best - second >= self.min_margin:
+            return RouteDecision(self._labels[order[0]], "embedding centroid", best)
+        return None
+
+    def route(self, query: str, has_history: bool = False) -> Optional[RouteDecision]:
+        """Trả về RouteDecision nếu đủ tự tin, None nếu cần LLM phân loại."""
+        text = normalize(query)
+        if not text:
+            return None
+        decision = self._rule_route(text, has_history)
+        if decision or has_history or not self.use_centroid:
+            return decision
+        try:
+            return self._centroid_route(text)
+        except Exception as e:
+            logger.warning(f"⚠️ Fast router bỏ qua bước embedding: {e}")
+            return None
+
+
+def load_eval_set(json_path: str = ROUTER_EVAL_PATH) -> List[dict]:
+    """Các câu {"query", "expected"}; expected "llm" là câu router nên để LLM phân loại."""
+    with open(json_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def evaluate_routes(router: FastRouter, items: List[dict]) -> dict:
+    """
+    Precision (tỉ lệ đúng trong các câu được định tuyến vào route) và coverage (tỉ lệ câu của
+    route được định tuyến nhanh) cho từng route; câu trả về None được tính là "llm".
+    """
+    report = {}
+    decisions = []
+    for item in items:
+        decision = router.route(item["query"])
+        decisions.append((item["expected"], decision.query_type if decision else "llm"))
+    for route in SEED_EXAMPLES:
+        routed = [expected for expected, got in decisions if got == route]
+        total = sum(expected == route for expected, _ in decisions)
+        correct = sum(expected == route for expected in routed)
+        report[route] = {
+            "routed": len(routed),
+            "precision": correct / len(routed) if routed else 1.0,
+            "coverage": correct / total if total else 0.0,
+        }
+    return report
@@ -0,0 +1,121 @@
+"""
+Tầng rerank bằng CrossEncoder: lấy RERANK_CANDIDATES ứng viên từ tìm kiếm lai, chấm điểm
+từng cặp (câu hỏi, chunk) qua một MicroBatcher dùng chung cho mọi request, và cache điểm
+theo (id chunk, câu hỏi đã chuẩn hóa) nên các lượt hỏi lặp lại không phải chạy model.
+"""
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Sequence, Tuple
+
+from agents.batch_inference import MicroBatcher
+from agents.model_backends import load_cross_encoder
+from model_registry import registry
+from model_server import get_model_client, RERANKER_MODEL, RERANKER_BACKEND, RERANKER_ONNX_DIR
+
+logger = logging.getLogger(__name__)
+
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "8"))
+RERANK_TOP_N = int(os.getenv("RERANK_TOP_N", "1"))
+RERANK_THRESHOLD = float(os.getenv("RERANK_THRESHOLD", "0.0"))
+RERANK_MAX_BATCH_SIZE = int(os.getenv("RERANK_MAX_BATCH_SIZE", "32"))
+RERANK_MAX_WAIT_MS = float(os.getenv("RERANK_MAX_WAIT_MS", "5"))
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "4096"))
+
+
+def _load_reranker():
+    model_client = get_model_client()
+    if model_client:
+        # Reranker nằm trên model server dùng chung giữa các worker
+        model_client.wait_ready()
+        return model_client.reranker()
+    return load_cross_encoder(RERANKER_BACKEND, RERANKER_MODEL, onnx_dir=RERANKER_ONNX_DIR)
+
+
+def _warmup_reranker(model):
+    model.predict([["khởi động", "khởi động"]])
+
+
+registry.register("reranker", _load_reranker, warmup=_warmup_reranker)
+
+
+def _normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+def _chunk_key(doc) -> str:
+    # Chunk từ Chroma có id; các nguồn khác (web, label index) dùng hash nội dung
+    return getattr(doc, "id", None) or hashlib.sha1(doc.page_content.encode("utf-8")).hexdigest()
+
+
+def _score_pairs(pairs: List[Tuple[str, str]]) -> List[float]:
+    return [float(score) for score in registry.get("reranker").predict([list(pair) for pair in pairs])]
+
+
+class Reranker:
+    """
+    Chấm điểm (câu hỏi, chunk) bằng CrossEncoder với cache LRU theo (id chunk, câu hỏi chuẩn hóa).
+    Các cặp chưa có trong cache của mọi request đồng thời được gom vào cùng một batch,
+    model chỉ chạy trên một luồng nên độ trễ không tăng vọt khi nhiều request cùng rerank.
+    """
+
+    def __init__(self, max_batch_size: int = RERANK_MAX_BATCH_SIZE, max_wait_ms: float = RERANK_MAX_WAIT_MS,
+                 cache_size: int = RERANK_CACHE_SIZE):
+        self.batcher = MicroBatcher(_score_pairs, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms,
+                                    name="reranker")
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[tuple, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def score(self, query: str, docs: Sequence) -> List[float]:
+        normalized = _normalize_query(query)
+        keys = [(_chunk_key(doc), normalized) for doc in docs]
+        scores: List[Optional[float]] = [None] * len(docs)
+        with self._lock:
+            for i, key in enumerate(keys):
+                score = self._cache.get(key)
+                if score is not None:
+                    self._cache.move_to_end(key)
+                    scores[i] = score
+        missing = [i for i, score in enumerate(scores) if score is None]
+        futures = [self.batcher.submit((query, docs[i].page_content)) for i in missing]
+        for i, future in zip(missing, futures):
+            scores[i] = future.result()
+        with self._lock:
+            self.hits += len(docs) - len(missing)
+            self.misses += len(missing)
+            if self.cache_size > 0:
+                for i in missing:
+                    self._cache[keys[i]] = scores[i]
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return scores
+
+    def rerank(self, query: str, docs: Sequence, top_n: int = RERANK_TOP_N,
+               threshold: float = RERANK_THRESHOLD) -> List[Tuple[object, float]]:
+        """Trả về tối đa top_n (doc, score) có score > threshold, xếp giảm dần."""
+        if not docs:
+            return []
+        scored = sorted(zip(docs, self.score(query, docs)), key=lambda item: item[1], reverse=True)
+        return [(doc, score) for doc, score in scored if score > threshold][:top_n]
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "cache_size": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "average_batch_size": self.batcher.average_batch_size,
+        }
+
+
+reranker = Reranker()
@@ -1,13 +1,17 @@
 import os
 import logging
-import traceback
+from typing import Optional
 from dotenv import load_dotenv
 from langchain_chroma import Chroma
 from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.document_loaders import PyPDFLoader, TextLoader, UnstructuredFileLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-import asyncio
-from fastapi.concurrency import run_in_threadpool
+from langchain_core.documents import Document
+from model_server import get_model_client
+from model_registry import registry, ModelLoadError
+from agents.label_index import LabelIndex, build_label_index, save_label_index
+from agents.lexical_index import BM25Index, reciprocal_rank_fusion
+from agents.crops import crop_filter, crop_metadata, extract_crops
+from agents.embedding_cache import with_embedding_cache
+from agents.manifest import chunk_id
 
 logging.basicConfig(
     level=logging.INFO,
@@ -18,120 +22,191 @@ logger = logging.getLogger(__name__)
 load_dotenv()
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
-JSON_FILE_PATH = os.path.join(current_dir, "..", "data", "plant.json")
+JSON_FILE_PATH = os.getenv("JSON_FILE_PATH", os.path.normpath(os.path.join(current_dir, "..", "data", "plant.json")))
 CHROMA_DB_PATH = os.path.join(current_dir, "chroma_db_storage")
 EMBED_MODEL = os.getenv("EMBED_MODEL", "AITeamVN/Vietnamese_Embedding")
+# Tìm kiếm lai: số kết quả lấy từ vector / BM25 và số ứng viên sau khi trộn RRF
+HYBRID_VECTOR_K = int(os.getenv("HYBRID_VECTOR_K", "4"))
+HYBRID_LEXICAL_K = int(os.getenv("HYBRID_LEXICAL_K", "4"))
+HYBRID_TOP_K = int(os.getenv("HYBRID_TOP_K", "4"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+LEXICAL_RESYNC_SECONDS = float(os.getenv("LEXICAL_RESYNC_SECONDS", "60"))
 
 if not CHROMA_DB_PATH or not EMBED_MODEL:
     raise ValueError("CHROMA_DB_PATH hoặc EMBED_MODEL chưa được thiết lập trong .env")
 
-try:
-    logger.info(f"Đang khởi tạo mô hình embedding: {EMBED_MODEL}")
-    embeddings = HuggingFaceEmbeddings(
-        model_name=EMBED_MODEL,
-        model_kwargs={'device': 'cpu'},
-        encode_kwargs={'normalize_embeddings': True}
-    )
-    logger.info("✅ Embedding model đã sẵn sàng.")
-
+def _load_embeddings():
+    model_client = get_model_client()
+    if model_client:
+        # Embedding được tính trên model server dùng chung, không load model trong worker này
+        model_client.wait_ready()
+        embeddings = model_client.embeddings()
+    else:
+        logger.info(f"Đang khởi tạo mô hình embedding: {EMBED_MODEL}")
+        embeddings = HuggingFaceEmbeddings(
+            model_name=EMBED_MODEL,
+            model_kwargs={'device': 'cpu'},
+            encode_kwargs={'normalize_embeddings': True}
+        )
+    # Cache trên đĩa dùng chung cho nạp tài liệu, truy vấn và answer cache; trúng cache thì không gọi model
+    return with_embedding_cache(embeddings, EMBED_MODEL)
+
+
+def _warmup_embeddings(embeddings):
+    # Gọi thẳng model (bỏ qua cache) để warm-up thực sự chạy forward pass
+    getattr(embeddings, "inner", embeddings).embed_query("khởi động")
+
+
+def _load_vector_store():
     logger.info(f"📦 Đang load/tạo vector store tại: {CHROMA_DB_PATH}")
-    vector_store = Chroma(
+    store = Chroma(
         persist_directory=CHROMA_DB_PATH,
-        embedding_function=embeddings,
+        embedding_function=registry.get("embeddings"),
         collection_metadata={"hnsw:space": "cosine"}
     )
-    logger.info(f"✅ Vector store OK. Tổng số vector hiện có: {vector_store._collection.count()}")
+    logger.info(f"✅ Vector store OK. Tổng số vector hiện có: {store._collection.count()}")
+    return store
 
-except Exception as e:
-    logger.critical(f"❌ LỖI NGHIÊM TRỌNG khi khởi tạo vector store hoặc embedding: {e}")
-    traceback.print_exc()
-    embeddings = None
-    vector_store = None
 
-# --- 3. HÀM XỬ LÝ TÀI LIỆU ---
+def _load_label_index():
+    index = LabelIndex(CHROMA_DB_PATH)
+    if not os.path.exists(index.path):
+        # Kho được build trước khi có chỉ mục nhãn: dựng lại từ các chunk plant.json trong Chroma
+        logger.info("📇 Chưa có chỉ mục nhãn, đang dựng từ vector store...")
+        data = registry.get("vector_store").get(include=["documents", "metadatas"])
+        chunks = [Document(page_content=content, metadata=metadata or {})
+                  for content, metadata in zip(data["documents"], data["metadatas"])]
+        label_index = build_label_index(chunks)
+        if label_index:
+            save_label_index(label_index, CHROMA_DB_PATH)
+    return index
+
+
+def _load_lexical_index():
+    index = BM25Index(resync_seconds=LEXICAL_RESYNC_SECONDS)
+    index.sync_with(registry.get("vector_store")._collection, force=True)
+    logger.info(f"✅ Chỉ mục BM25 OK: {index.stats()}")
+    return index
 
-def load_document(temp_file_path: str, original_filename: str):
-    """Tải tài liệu từ file PDF, TXT hoặc định dạng khác."""
-    logger.info(f"📄 Đang tải file: {original_filename}")
 
+registry.register("embeddings", _load_embeddings, warmup=_warmup_embeddings)
+registry.register("vector_store", _load_vector_store)
+registry.register("label_index", _load_label_index)
+registry.register("lexical_index", _load_lexical_index)
+
+
+def get_embeddings():
+    """Embedding model dùng chung (load lười). Trả về None nếu không khởi tạo được."""
     try:
-        if original_filename.lower().endswith(".pdf"):
-            loader = PyPDFLoader(temp_file_path)
-        elif original_filename.lower().endswith(".txt"):
-            loader = TextLoader(temp_file_path, encoding="utf-8")
-        else:
-            loader = UnstructuredFileLoader(temp_file_path)
-
-        docs = loader.load()
-        if not docs:
-            logger.warning(f"⚠️ File {original_filename} không trích xuất được nội dung (có thể là PDF scan hoặc rỗng).")
-        else:
-            logger.info(f"✅ Đã tải {len(docs)} tài liệu từ {original_filename}.")
-        return docs
+        return registry.get("embeddings")
+    except ModelLoadError as e:
+        logger.critical(f"❌ LỖI NGHIÊM TRỌNG khi khởi tạo embedding: {e}")
+        return None
 
-    except Exception as e:
-        logger.error(f"❌ Lỗi khi đọc file {original_filename}: {e}")
-        traceback.print_exc()
-        return []
-
-def split_documents(documents: list):
-    """Chia tài liệu thành các đoạn nhỏ để embedding."""
-    if not documents:
-        logger.warning("⚠️ Không có tài liệu nào để chia.")
-        return []
-
-    logger.info(f"✂️ Đang chia {len(documents)} tài liệu...")
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=600,
-        chunk_overlap=100,
-        add_start_index=True
-    )
 
-    splits = text_splitter.split_documents(documents)
-    logger.info(f"✅ Đã chia thành {len(splits)} đoạn văn bản.")
-    return splits
-def add_documents_to_store(documents: list):
-    """Thêm các đoạn văn bản đã chia vào ChromaDB."""
-    global vector_store
-    if not vector_store or not embeddings:
-        logger.error("❌ Vector store hoặc Embeddings chưa được khởi tạo. Dừng lại.")
-        return
-
-    if not documents:
-        logger.warning("⚠️ Không có tài liệu nào để thêm vào vector store.")
-        return
-
-    # Lọc bỏ các đoạn rỗng
-    non_empty_docs = [doc for doc in documents if doc.page_content.strip()]
-    if not non_empty_docs:
-        logger.warning("⚠️ Tất cả các đoạn văn bản đều trống. Không tạo embedding.")
-        return
-
-    logger.info(f"🧠 Đang thêm {len(non_empty_docs)} đoạn hợp lệ vào ChromaDB...")
+def get_vector_store():
+    """Chroma vector store dùng chung (load lười). Trả về None nếu không khởi tạo được."""
     try:
-        vector_store.add_documents(non_empty_docs)
-        logger.info(f"✅ Thêm thành công! Tổng số vector hiện có: {vector_store._collection.count()}")
-    except Exception as e:
-        logger.error(f"❌ Lỗi khi thêm tài liệu vào ChromaDB: {e}")
-        traceback.print_exc()
-
-async def process_document_background(temp_path: str, original_name: str):
-    """Chạy nền để xử lý tài liệu được upload."""
-    logger.info(f"🔄 Bắt đầu xử lý nền cho file: {original_name}")
+        return registry.get("vector_store")
+    except ModelLoadError as e:
+        logger.critical(f"❌ LỖI NGHIÊM TRỌNG khi khởi tạo vector store: {e}")
+        return None
+
+
+def get_lexical_index():
+    """Chỉ mục BM25 dùng chung (load lười). Trả về None nếu không khởi tạo được."""
     try:
-        docs = await run_in_threadpool(load_document, temp_path, original_name)
-        if not docs:
-            logger.warning(f"⚠️ Không trích xuất được nội dung từ file {original_name}. Bỏ qua.")
-            return
-
-        splits = await run_in_threadpool(split_documents, docs)
-
-        await run_in_threadpool(add_documents_to_store, splits)
-        logger.info(f"🎉 Xử lý file {original_name} hoàn tất.")
-    except Exception as e:
-        logger.error(f"❌ Lỗi chạy nền khi xử lý {original_name}: {e}")
-        traceback.print_exc()
-    finally:
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
-            logger.info(f"🧹 Đã xóa file tạm: {temp_path}")
+        return registry.get("lexical_index")
+    except ModelLoadError as e:
+        logger.error(f"❌ Không khởi tạo được chỉ mục BM25: {e}")
+        return None
+
+
+def _top_up(docs: list, search_all, k: int) -> list:
+    """Bổ sung kết quả không lọc khi phân vùng cây trồng không đủ k chunk (vd. kho cũ chưa gắn metadata)."""
+    if len(docs) >= k:
+        return docs
+    seen = {doc.id for doc in docs}
+    return docs + [doc for doc in search_all() if doc.id not in seen][:k - len(docs)]
+
+
+def hybrid_search(query: str, k: int = HYBRID_TOP_K, vector_k: Optional[int] = None,
+                  lexical_k: Optional[int] = None, vector_store=None, lexical_index=None,
+                  crops: Optional[list] = None) -> list:
+    """
+    Tìm kiếm vector + BM25, trộn bằng Reciprocal Rank Fusion, trả về tối đa k Document.
+    Mặc định mỗi nguồn lấy max(HYBRID_*_K, k) kết quả. Có `crops` thì cả hai nguồn chỉ tìm
+    trong chunk của các cây trồng đó, thiếu thì bổ sung bằng kết quả không lọc.
+    """
+    vector_k = max(HYBRID_VECTOR_K, k) if vector_k is None else vector_k
+    lexical_k = max(HYBRID_LEXICAL_K, k) if lexical_k is None else lexical_k
+    if vector_store is None:
+        vector_store = get_vector_store()
+    where = crop_filter(crops or [])
+    vector_docs = []
+    if vector_k > 0:
+        vector_docs = vector_store.similarity_search(query, k=vector_k, filter=where)
+        if where:
+            vector_docs = _top_up(vector_docs, lambda: vector_store.similarity_search(query, k=vector_k), vector_k)
+    if lexical_index is None:
+        lexical_index = get_lexical_index()
+    if lexical_index is None or lexical_k <= 0:
+        return vector_docs[:k]
+    lexical_index.sync_with(vector_store._collection)
+    lexical_docs = [doc for doc, _ in lexical_index.search(query, k=lexical_k, crops=crops)]
+    if crops:
+        lexical_docs = _top_up(lexical_docs, lambda: [doc for doc, _ in lexical_index.search(query, k=lexical_k)],
+                               lexical_k)
+
+    docs_by_id = {doc.id: doc for doc in lexical_docs}
+    docs_by_id.update({doc.id: doc for doc in vector_docs if doc.id})
+    fused = reciprocal_rank_fusion(
+        [[doc.id for doc in vector_docs if doc.id], [doc.id for doc in lexical_docs]], k=RRF_K)
+    return [docs_by_id[doc_id] for doc_id, _ in fused[:k]]
+
+
+def get_label_index():
+    """Chỉ mục class id -> chunk tri thức (load lười). Trả về None nếu không khởi tạo được."""
+    try:
+        return registry.get("label_index")
+    except ModelLoadError as e:
+        logger.error(f"❌ Không khởi tạo được chỉ mục nhãn: {e}")
+        return None
+
+# --- 3. HÀM XỬ LÝ TÀI LIỆU ---
+
+def _chroma_metadata(metadata: Optional[dict]) -> Optional[dict]:
+    # Chroma chỉ nhận giá trị vô hướng (str, int, float, bool)
+    cleaned = {key: value for key, value in (metadata or {}).items() if isinstance(value, (str, int, float, bool))}
+    return cleaned or None
+
+
+def upsert_chunks(vector_store, chunks: list, vectors: Optional[list] = None, ids: Optional[list] = None,
+                  lexical_index=None) -> list:
+    """
+    Ghi một lô chunk vào Chroma (kèm embedding đã tính sẵn nếu có) và chỉ mục BM25 nếu được truyền vào.
+    Id mặc định là hash của (source, nội dung) nên ghi lại cùng chunk chỉ thay thế bản cũ.
+    Chunk chưa có metadata cây trồng được nhận diện từ nội dung. Trả về danh sách id.
+    """
+    if ids is None:
+        ids = [chunk_id(doc.metadata.get("source", ""), doc.page_content) for doc in chunks]
+    # Chunk trùng nội dung trong cùng lô chỉ ghi một lần
+    unique = {}
+    for i, doc_id in enumerate(ids):
+        unique.setdefault(doc_id, i)
+    if len(unique) < len(ids):
+        keep = list(unique.values())
+        ids = [ids[i] for i in keep]
+        chunks = [chunks[i] for i in keep]
+        vectors = [vectors[i] for i in keep] if vectors is not None else None
+    for doc in chunks:
+        if "crops" not in doc.metadata:
+            doc.metadata.update(crop_metadata(extract_crops(doc.page_content)))
+    texts = [doc.page_content for doc in chunks]
+    if vectors is None:
+        vectors = vector_store.embeddings.embed_documents(texts)
+    vector_store._collection.upsert(ids=ids, embeddings=vectors, documents=texts,
+                                    metadatas=[_chroma_metadata(doc.metadata) for doc in chunks])
+    if lexical_index is not None:
+        lexical_index.add(ids, chunks)
+    return ids
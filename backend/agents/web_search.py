@@ -0,0 +1,234 @@
+"""
+Tìm kiếm web (Tavily) làm phương án dự phòng khi kho tri thức không có đoạn phù hợp.
+Gọi thẳng REST API của Tavily bằng httpx bất đồng bộ với ngân sách thời gian cứng,
+cache kết quả theo câu hỏi đã chuẩn hóa trong SQLite (có TTL) và gộp các lượt tra cứu
+trùng nhau đang chạy. Tùy chọn WEB_SEARCH_WRITE_BACK=1 ghi các kết quả hữu ích vào ChromaDB
+(metadata origin=web_search) để lần sau tìm thấy tại chỗ; mặc định tắt vì nội dung web chưa
+được kiểm duyệt và không hết hạn như cache.
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+import httpx
+from dotenv import load_dotenv
+from fastapi.concurrency import run_in_threadpool
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+TAVILY_API_URL = os.getenv("TAVILY_API_URL", "https://api.tavily.com/search")
+WEB_SEARCH_MAX_RESULTS = int(os.getenv("WEB_SEARCH_MAX_RESULTS", "1"))
+# Quá thời gian này lượt hỏi tiếp tục không có context web (request vẫn chạy nền để điền cache)
+WEB_SEARCH_BUDGET_SECONDS = float(os.getenv("WEB_SEARCH_BUDGET_SECONDS", "4"))
+WEB_SEARCH_TIMEOUT_SECONDS = float(os.getenv("WEB_SEARCH_TIMEOUT_SECONDS", "15"))
+WEB_SEARCH_CACHE_PATH = os.getenv("WEB_SEARCH_CACHE_PATH", os.path.join(current_dir, "web_search_cache.sqlite3"))
+WEB_SEARCH_CACHE_TTL_SECONDS = float(os.getenv("WEB_SEARCH_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+WEB_SEARCH_WRITE_BACK = os.getenv("WEB_SEARCH_WRITE_BACK", "0") == "1"
+WEB_SEARCH_WRITE_BACK_MIN_SCORE = float(os.getenv("WEB_SEARCH_WRITE_BACK_MIN_SCORE", "0.5"))
+WEB_SEARCH_WRITE_BACK_MIN_CHARS = int(os.getenv("WEB_SEARCH_WRITE_BACK_MIN_CHARS", "200"))
+
+
+def _normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+class WebSearchCache:
+    """Cache kết quả tìm kiếm trong SQLite: normalized query -> danh sách kết quả (JSON)."""
+
+    def __init__(self, path: str = WEB_SEARCH_CACHE_PATH, ttl_seconds: float = WEB_SEARCH_CACHE_TTL_SECONDS):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS web_search_cache ("
+                         "query TEXT PRIMARY KEY, results TEXT NOT NULL, created_at REAL NOT NULL)")
+            # Dọn các bản ghi hết hạn mỗi lần mở cache (mỗi lần khởi động worker)
+            conn.execute("DELETE FROM web_search_cache WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def get(self, query: str) -> Optional[List[dict]]:
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT results, created_at FROM web_search_cache WHERE query = ?", (query,)).fetchone()
+        if row is None or time.time() - row[1] > self.ttl_seconds:
+            return None
+        return json.loads(row[0])
+
+    def put(self, query: str, results: List[dict]):
+        with self._lock:
+            conn = self._connect()
+            conn.execute("INSERT OR REPLACE INTO web_search_cache (query, results, created_at) VALUES (?, ?, ?)",
+                         (query, json.dumps(results, ensure_ascii=False), time.time()))
+            conn.commit()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def _write_back(query: str, results: List[dict]):
+    """
+    Lưu các kết quả web đủ tốt vào ChromaDB (chạy nền). Mỗi URL là một nguồn trong manifest:
+    chia chunk như tài liệu upload, nội dung không đổi thì bỏ qua, đổi thì thay thế bản cũ.
+    """
+    from agents.document_parser import make_text_splitter
+    from agents.ingestion import manifest, sync_document, text_hash
+    from agents.vector_store import get_lexical_index, get_vector_store
+
+    results = [
+        result for result in results
+        if result.get("score", 0.0) >= WEB_SEARCH_WRITE_BACK_MIN_SCORE
+        and len(result.get("content", "")) >= WEB_SEARCH_WRITE_BACK_MIN_CHARS
+    ]
+    if not results:
+        return
+    vector_store = get_vector_store()
+    if vector_store is None:
+        logger.error("❌ Vector store chưa được khởi tạo, không lưu được kết quả web.")
+        return
+    splitter = make_text_splitter()
+    saved = 0
+    for result in results:
+        document = Document(page_content=result["content"],
+                            metadata={"source": result["url"], "origin": "web_search", "query": query})
+        try:
+            stats = sync_document(result["url"], splitter.split_documents([document]), text_hash(result["content"]),
+                                  vector_store, manifest, lexical_index=get_lexical_index())
+        except Exception as e:
+            logger.error(f"❌ Lỗi khi lưu kết quả web {result['url']}: {e}")
+            continue
+        saved += not stats["skipped"]
+    if saved:
+        logger.info(f"🌐 Đã lưu {saved} kết quả web vào kho tri thức cho: '{query}'")
+
+
+class WebSearchClient:
+    """
+    `search(query)` không bao giờ ném lỗi và không chờ quá `budget_seconds`: hết thời gian,
+    lỗi mạng hoặc thiếu API key đều trả về danh sách rỗng. Các lượt gọi cùng câu hỏi
+    (đã chuẩn hóa) trong lúc một request đang chạy dùng chung kết quả của request đó.
+    """
+
+    def __init__(self, api_url: str = TAVILY_API_URL, api_key: Optional[str] = None,
+                 max_results: int = WEB_SEARCH_MAX_RESULTS, budget_seconds: float = WEB_SEARCH_BUDGET_SECONDS,
+                 timeout: float = WEB_SEARCH_TIMEOUT_SECONDS, cache: Optional[WebSearchCache] = None,
+                 write_back: bool = WEB_SEARCH_WRITE_BACK):
+        self.api_url = api_url
+        self.api_key = api_key
+        self.max_results = max_results
+        self.budget_seconds = budget_seconds
+        self.timeout = timeout
+        self.cache = cache if cache is not None else WebSearchCache()
+        self.write_back = write_back
+        self._http: Optional[httpx.AsyncClient] = None
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._background: set = set()
+        self.stats_counters = {"cache_hits": 0, "coalesced": 0, "requests": 0, "timeouts": 0, "errors": 0}
+
+    def _client(self) -> httpx.AsyncClient:
+        if self._http is None:
+            self._http = httpx.AsyncClient(timeout=self.timeout)
+        return self._http
+
+    async def _fetch(self, query: str) -> List[dict]:
+        api_key = self.api_key or os.getenv("TAVILY_API_KEY")
+        if not api_key:
+            raise RuntimeError("TAVILY_API_KEY chưa được thiết lập")
+        self.stats_counters["requests"] += 1
+        response = await self._client().post(
+            self.api_url,
+            json={"api_key": api_key, "query": query, "max_results": self.max_results, "search_depth": "basic"},
+            headers={"Authorization": f"Bearer {api_key}"},
+        )
+        response.raise_for_status()
+        return [
+            {"content": item.get("content", ""), "url": item.get("url", "Web"), "score": item.get("score", 0.0)}
+            for item in response.json().get("results", [])[:self.max_results]
+        ]
+
+    async def _lookup(self, key: str, query: str) -> List[dict]:
+        try:
+            results = await self._fetch(query)
+            # Không cache kết quả rỗng: lần hỏi sau thử lại thay vì trả rỗng suốt TTL
+            if results:
+                try:
+                    await run_in_threadpool(self.cache.put, key, results)
+                except Exception as e:
+                    logger.error(f"❌ Lỗi ghi cache tìm kiếm web: {e}")
+        finally:
+            # Chỉ bỏ khỏi in-flight sau khi đã ghi cache để lượt gọi kế tiếp không gọi API lần nữa
+            self._inflight.pop(key, None)
+        if self.write_back and results:
+            self._spawn(run_in_threadpool(_write_back, query, results))
+        return results
+
+    def _spawn(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def search(self, query: str) -> List[dict]:
+        """Danh sách {"content", "url", "score"}, rỗng nếu không có kết quả trong ngân sách thời gian."""
+        key = _normalize_query(query)
+        if not key:
+            return []
+        try:
+            cached = await run_in_threadpool(self.cache.get, key)
+        except Exception as e:
+            logger.error(f"❌ Lỗi đọc cache tìm kiếm web: {e}")
+            cached = None
+        if cached is not None:
+            self.stats_counters["cache_hits"] += 1
+            return cached
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._lookup(key, query))
+            self._inflight[key] = task
+            # Lấy exception của task nếu không còn ai chờ (đã hết ngân sách thời gian)
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        else:
+            self.stats_counters["coalesced"] += 1
+        try:
+            # shield: hết ngân sách chỉ bỏ chờ, request vẫn chạy tiếp để điền cache cho lần sau
+            return await asyncio.wait_for(asyncio.shield(task), timeout=self.budget_seconds)
+        except asyncio.TimeoutError:
+            self.stats_counters["timeouts"] += 1
+            logger.warning(f"⏱️ Tìm kiếm web vượt quá {self.budget_seconds}s, bỏ qua: '{query}'")
+        except Exception as e:
+            self.stats_counters["errors"] += 1
+            logger.error(f"❌ Lỗi tìm kiếm web: {e}")
+        return []
+
+    def stats(self) -> dict:
+        return {**self.stats_counters, "inflight": len(self._inflight)}
+
+    async def aclose(self):
+        for task in list(self._inflight.values()) + list(self._background):
+            task.cancel()
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+        self.cache.close()
+
+
+web_search = WebSearchClient()
@@ -8,7 +8,8 @@ import logging
 from typing import List, Optional
 from datetime import datetime
 from fastapi import FastAPI, Depends, HTTPException, status, BackgroundTasks, UploadFile, File
-from fastapi.responses import StreamingResponse, RedirectResponse
+from fastapi.responses import StreamingResponse, RedirectResponse, JSONResponse
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel, Field
 from contextlib import asynccontextmanager
 from starlette.requests import Request
@@ -17,7 +18,8 @@ from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy import select
 import shutil
 import os
-from agents.vector_store import process_document_background
+from ingestion_queue import ingestion_queue
+from agents.document_parser import shutdown_parse_pool
 formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -27,11 +29,19 @@ if not logger.handlers:
     logger.addHandler(console_handler)
 
 logger.propagate = False
+# Load model song song trong nền khi khởi động (0 = chỉ load khi có request đầu tiên cần tới)
+PRELOAD_MODELS = os.getenv("PRELOAD_MODELS", "1") == "1"
 from sqladmin import Admin
 from sqladmin.authentication import AuthenticationBackend
 from admin import UserAdmin, ConversationAdmin, ChatMessageAdmin, DiseaseDetectionAdmin, FeedbackAdmin, RAGManagerView
 from database import Base, engine, get_db_session, AsyncSession, User, Conversation, ChatMessage, DiseaseDetection,Feedback
 from chatbot_service import AgricultureChatbot
+from graph import cache_stats
+from worker_pools import shutdown_pools
+from model_registry import registry
+from llm_clients import llm_clients
+from agents.web_search import web_search
+from checkpointer import checkpointer
 
 
 # --- 2. CẤU HÌNH ADMIN AUTH ---
@@ -78,7 +88,19 @@ async def lifespan(app: FastAPI):
     logger.info("DB tables OK.")
     os.makedirs("../temp_uploads", exist_ok=True)
     os.makedirs("../temp_images", exist_ok=True)
+    # Không chờ model load xong: các endpoint chỉ dùng DB phục vụ được ngay, /ready báo trạng thái
+    preload_task = asyncio.create_task(registry.load_all()) if PRELOAD_MODELS else None
+    prune_task = asyncio.create_task(checkpointer.run_pruner())
+    ingestion_queue.start()
     yield
+    await ingestion_queue.stop()
+    shutdown_parse_pool()
+    if preload_task and not preload_task.done():
+        preload_task.cancel()
+    prune_task.cancel()
+    shutdown_pools()
+    await llm_clients.aclose()
+    await web_search.aclose()
     logger.info("Shutdown.")
 
 
@@ -318,6 +340,8 @@ async def delete_conversation(
     # 3. Xóa (database.py đã có 'cascade="all, delete-orphan"')
     await db.delete(convo)
     await db.commit()
+    # Xóa luôn state của graph cho hội thoại này
+    await checkpointer.adelete_thread(conversation_id)
 
     return {"message": "Conversation deleted successfully", "conversation_id": conversation_id}
 
@@ -375,7 +399,8 @@ async def upload_document(
         raise HTTPException(status_code=400, detail="Loại file không hợp lệ. Chỉ chấp nhận .pdf, .txt, .md, .docx")
 
     temp_dir = "../temp_uploads"
-    temp_path = os.path.join(temp_dir, f"{uuid.uuid4()}_{file.filename}")
+    # Lưu đường dẫn tuyệt đối vào bảng ingestion_jobs: worker có thể xử lý file sau khi restart
+    temp_path = os.path.abspath(os.path.join(temp_dir, f"{uuid.uuid4()}_{file.filename}"))
 
     try:
         with open(temp_path, "wb") as buffer:
@@ -386,9 +411,45 @@ async def upload_document(
     finally:
         file.file.close()
 
-    asyncio.create_task(process_document_background(temp_path, file.filename))
-    logger.info(f"Admin {admin_user} đã tải lên file: {file.filename}. Đang xử lý trong nền.")
-    return {"message": f"Đã nhận file '{file.filename}'. Quá trình xử lý (embedding) đang chạy trong nền."}
+    job = await ingestion_queue.enqueue(temp_path, file.filename, uploaded_by=admin_user)
+    logger.info(f"Admin {admin_user} đã tải lên file: {file.filename}. Đã đưa vào hàng đợi nạp tài liệu.")
+    return {"message": f"Đã nhận file '{file.filename}'. File đang chờ xử lý (embedding) trong hàng đợi.",
+            "job_id": job["job_id"], "job": job}
+
+
+@app.get("/api/ingestion-jobs", tags=["Admin RAG Management"])
+async def list_ingestion_jobs(limit: int = 50, status: Optional[str] = None,
+                              admin_user: str = Depends(get_admin_user)):
+    """Các tác vụ nạp tài liệu gần nhất: trạng thái, số trang/chunk đã xử lý, thời gian."""
+    return await ingestion_queue.list(limit=min(max(limit, 1), 500), status=status)
+
+
+@app.get("/api/ingestion-jobs/{job_id}", tags=["Admin RAG Management"])
+async def get_ingestion_job(job_id: str, admin_user: str = Depends(get_admin_user)):
+    job = await ingestion_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Không tìm thấy tác vụ nạp tài liệu.")
+    return job
+
+
+@app.post("/api/ingestion-jobs/{job_id}/cancel", tags=["Admin RAG Management"])
+async def cancel_ingestion_job(job_id: str, admin_user: str = Depends(get_admin_user)):
+    """Hủy tác vụ: đang chờ thì hủy ngay, đang chạy thì dừng sau lô hiện tại và xóa chunk đã ghi."""
+    job = await ingestion_queue.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Không tìm thấy tác vụ nạp tài liệu.")
+    return job
+
+
+@app.get("/ready", tags=["Health"])
+async def ready():
+    """Trạng thái load của từng model (503 cho tới khi tất cả sẵn sàng) và tỉ lệ hit của các cache."""
+    is_ready = registry.is_ready()
+    caches = await run_in_threadpool(cache_stats)
+    return JSONResponse(
+        status_code=status.HTTP_200_OK if is_ready else status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"ready": is_ready, "models": registry.status(), "caches": caches}
+    )
 
 
 @app.get("/", include_in_schema=False)
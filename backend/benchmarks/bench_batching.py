@@ -0,0 +1,69 @@
+"""
+Benchmark micro-batching cho model phân loại bệnh.
+
+Chạy từ thư mục backend:
+    python -m benchmarks.bench_batching --requests 64 --concurrency 16 --batch-sizes 1 2 4 8 16
+"""
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+
+from agents.batch_inference import MicroBatcher
+from agents.predict_image import predict_batch
+
+
+def run(batch_size: int, max_wait_ms: float, n_requests: int, concurrency: int):
+    batcher = MicroBatcher(predict_batch, max_batch_size=batch_size, max_wait_ms=max_wait_ms,
+                           name=f"bench-{batch_size}")
+    inputs = [torch.randn(3, 224, 224) for _ in range(n_requests)]
+    latencies = []
+
+    def one(x):
+        start = time.perf_counter()
+        batcher(x)
+        latencies.append(time.perf_counter() - start)
+
+    # Warm-up
+    batcher(inputs[0])
+    batcher.batches_run = batcher.items_run = 0
+    latencies.clear()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, inputs))
+    elapsed = time.perf_counter() - start
+    batcher.close()
+
+    latencies.sort()
+    return {
+        "batch_size": batch_size,
+        "images_per_sec": n_requests / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        "avg_batch": batcher.average_batch_size or 1.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    print(f"torch threads: {torch.get_num_threads()} | requests: {args.requests} | concurrency: {args.concurrency}")
+    print(f"{'batch':>6} {'img/s':>10} {'p50 ms':>10} {'p95 ms':>10} {'avg batch':>10}")
+    baseline = None
+    for batch_size in args.batch_sizes:
+        r = run(batch_size, args.max_wait_ms, args.requests, args.concurrency)
+        baseline = baseline or r["images_per_sec"]
+        print(f"{r['batch_size']:>6} {r['images_per_sec']:>10.2f} {r['p50_ms']:>10.1f} {r['p95_ms']:>10.1f} "
+              f"{r['avg_batch']:>10.2f}  (x{r['images_per_sec'] / baseline:.2f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Đo chi phí mỗi lượt chat khi tạo ChatCohere mới cho mỗi lần gọi (cách cũ trong graph.py)
+so với dùng LLMClientRegistry (client và connection pool dùng chung).
+
+Dùng một stub HTTP server cục bộ giả lập endpoint /v2/chat của Cohere; `--connect-delay-ms`
+giả lập thời gian bắt tay TCP + TLS tới API thật cho mỗi kết nối mới.
+
+Chạy từ thư mục backend:
+    python -m benchmarks.bench_llm_clients --turns 50 --connect-delay-ms 60 --latency-ms 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+os.environ.setdefault("COHERE_API_KEY", "bench-key")
+
+from langchain_cohere import ChatCohere
+from langchain_core.messages import HumanMessage
+
+from llm_clients import LLMClientRegistry, COHERE_MODEL
+
+# Mỗi lượt: 1 lần phân loại (process_user_query) + 1 lần sinh câu trả lời
+CALLS_PER_TURN = [0, 0.3]
+
+
+class StubCohereHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    connect_delay = 0.0
+    latency = 0.0
+    connections = 0
+    requests = 0
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with self.lock:
+            StubCohereHandler.connections += 1
+        time.sleep(self.connect_delay)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with self.lock:
+            StubCohereHandler.requests += 1
+        time.sleep(self.latency)
+        body = json.dumps({
+            "id": "bench",
+            "finish_reason": "COMPLETE",
+            "message": {"role": "assistant", "content": [{"type": "text", "text": "Xin chào"}]},
+            "usage": {"billed_units": {"input_tokens": 10, "output_tokens": 2},
+                      "tokens": {"input_tokens": 10, "output_tokens": 2}},
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub(connect_delay_ms: float, latency_ms: float) -> ThreadingHTTPServer:
+    StubCohereHandler.connect_delay = connect_delay_ms / 1000
+    StubCohereHandler.latency = latency_ms / 1000
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubCohereHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def reset_counters():
+    StubCohereHandler.connections = 0
+    StubCohereHandler.requests = 0
+
+
+async def run_turns(get_llm, turns: int, limit=None):
+    messages = [HumanMessage(content="cách trị bệnh đạo ôn lúa")]
+    start = time.perf_counter()
+    for _ in range(turns):
+        for temperature in CALLS_PER_TURN:
+            llm = get_llm(temperature)
+            if limit is not None:
+                async with limit():
+                    await llm.ainvoke(messages)
+            else:
+                await llm.ainvoke(messages)
+    return (time.perf_counter() - start) / turns * 1000
+
+
+def time_construction(repeats: int, base_url: str) -> float:
+    start = time.perf_counter()
+    for _ in range(repeats):
+        ChatCohere(model=COHERE_MODEL, temperature=0, base_url=base_url)
+    return (time.perf_counter() - start) / repeats * 1000
+
+
+async def main_async(args) -> int:
+    server = start_stub(args.connect_delay_ms, args.latency_ms)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    print(f"Tạo ChatCohere: {time_construction(args.repeats, base_url):.2f} ms/lần")
+
+    reset_counters()
+    per_call_ms = await run_turns(
+        lambda temperature: ChatCohere(model=COHERE_MODEL, temperature=temperature, base_url=base_url),
+        args.turns)
+    per_call_connections = StubCohereHandler.connections
+
+    registry = LLMClientRegistry(base_url=base_url)
+    reset_counters()
+    shared_ms = await run_turns(lambda temperature: registry.chat_model(temperature=temperature),
+                                args.turns, registry.limit)
+    shared_connections = StubCohereHandler.connections
+    await registry.aclose()
+    server.shutdown()
+
+    print(f"{'chế độ':<12} {'ms/lượt':>9} {'kết nối mới':>12}")
+    print(f"{'mỗi lần gọi':<12} {per_call_ms:>9.1f} {per_call_connections:>12}")
+    print(f"{'dùng chung':<12} {shared_ms:>9.1f} {shared_connections:>12}")
+    print(f"Tiết kiệm: {per_call_ms - shared_ms:.1f} ms/lượt ({per_call_ms / shared_ms:.2f}x)")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=50)
+    parser.add_argument("--repeats", type=int, default=50, help="Số lần đo chi phí tạo ChatCohere")
+    parser.add_argument("--connect-delay-ms", type=float, default=60,
+                        help="Độ trễ giả lập cho mỗi kết nối mới (TCP + TLS)")
+    parser.add_argument("--latency-ms", type=float, default=20, help="Độ trễ giả lập cho mỗi request")
+    return asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+"""
+Đo việc đọc + chia chunk tài liệu: cách cũ (loader của LangChain trong thread pool, giữ GIL)
+so với process pool của agents/document_parser.py, trên bộ data/Plant_pdf nhân bản `--replicas` lần.
+
+Trong lúc đọc, một coroutine ngủ 10 ms liên tục để đo độ trễ của event loop (độ trễ mà request
+chat phải chịu khi server đang nạp tài liệu). Kết quả chunk của hai cách được so khớp.
+Lưu ý: phần lớn PDF trong data/Plant_pdf là bản scan (ít trang có lớp văn bản), chi phí chủ yếu
+là phân tích cấu trúc PDF, số chunk ít.
+
+Chạy từ thư mục backend:
+    python -m benchmarks.bench_parsing --replicas 100 --workers 4
+"""
+import argparse
+import asyncio
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from agents.document_parser import (PARSE_PAGES_PER_TASK, PARSE_WORKERS, iter_document_chunks, make_loader,
+                                    make_text_splitter, shutdown_parse_pool)
+
+LOOP_TICK_SECONDS = 0.01
+
+
+def replicate(src_dir: str, dst_dir: str, replicas: int) -> list:
+    names = sorted(name for name in os.listdir(src_dir) if name.lower().endswith((".pdf", ".txt", ".md", ".docx")))
+    paths = []
+    for i in range(replicas):
+        for name in names:
+            path = os.path.join(dst_dir, f"{i:03d}_{name}")
+            try:
+                os.link(os.path.join(src_dir, name), path)
+            except OSError:
+                shutil.copyfile(os.path.join(src_dir, name), path)
+            paths.append(path)
+    return paths
+
+
+def old_parse(path: str):
+    """Cách cũ: lazy_load từng trang và chia chunk ngay trong thread."""
+    splitter = make_text_splitter()
+    pages, chunks = 0, []
+    for page in make_loader(path, os.path.basename(path)).lazy_load():
+        pages += 1
+        page.metadata["source"] = os.path.basename(path)
+        chunks.extend(splitter.split_documents([page]))
+    return pages, chunks
+
+
+def new_parse(path: str, workers: int, pages_per_task: int):
+    pages, chunks = 0, []
+    for page_count, part in iter_document_chunks(path, os.path.basename(path), workers=workers,
+                                                 pages_per_task=pages_per_task):
+        pages += page_count
+        chunks.extend(part)
+    return pages, chunks
+
+
+async def run(paths: list, parse, concurrency: int):
+    lags = []
+    done = asyncio.Event()
+
+    async def ticker():
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(LOOP_TICK_SECONDS)
+            lags.append((time.perf_counter() - start - LOOP_TICK_SECONDS) * 1000)
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(path):
+        async with semaphore:
+            return await asyncio.to_thread(parse, path)
+
+    tick_task = asyncio.create_task(ticker())
+    start = time.perf_counter()
+    results = await asyncio.gather(*(one(path) for path in paths))
+    wall = time.perf_counter() - start
+    done.set()
+    await tick_task
+    return wall, results, np.array(lags or [0.0])
+
+
+def report(name: str, paths: list, wall: float, results: list, lags: np.ndarray):
+    pages = sum(p for p, _ in results)
+    chunks = sum(len(c) for _, c in results)
+    print(f"{name:<18} {wall:>8.2f} {len(paths) / wall:>8.1f} {pages / wall:>9.1f} {chunks:>7} "
+          f"{np.percentile(lags, 50):>8.1f} {np.percentile(lags, 99):>8.1f} {lags.max():>8.1f}")
+
+
+def signature(results: list) -> list:
+    return [[(c.page_content, c.metadata) for c in chunks] for _, chunks in results]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--src", default=os.path.join("data", "Plant_pdf"))
+    parser.add_argument("--replicas", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=PARSE_WORKERS, help="Số process đọc tài liệu")
+    parser.add_argument("--pages-per-task", type=int, default=PARSE_PAGES_PER_TASK)
+    parser.add_argument("--concurrency", type=int, default=4, help="Số tài liệu được đọc đồng thời")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        paths = replicate(args.src, tmp_dir, args.replicas)
+        print(f"{len(paths)} tài liệu, {args.workers} process, {args.concurrency} tài liệu đồng thời")
+        print(f"{'cách':<18} {'wall s':>8} {'doc/s':>8} {'trang/s':>9} {'chunk':>7} "
+              f"{'lag p50':>8} {'lag p99':>8} {'lag max':>8}  (ms)")
+
+        wall, old_results, lags = asyncio.run(run(paths, old_parse, args.concurrency))
+        report("thread (cũ)", paths, wall, old_results, lags)
+
+        # Khởi động process con trước để không tính thời gian spawn
+        new_parse(paths[0], args.workers, args.pages_per_task)
+        wall, new_results, lags = asyncio.run(run(
+            paths, lambda path: new_parse(path, args.workers, args.pages_per_task), args.concurrency))
+        report("process pool", paths, wall, new_results, lags)
+        shutdown_parse_pool()
+
+    print(f"Kết quả chunk giống nhau: {signature(old_results) == signature(new_results)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
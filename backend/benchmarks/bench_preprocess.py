@@ -0,0 +1,75 @@
+"""
+Microbenchmark giải mã + tiền xử lý ảnh: pipeline cũ (giải mã đầy đủ + `transform`)
+so với pipeline nhanh (JPEG draft mode + `preprocess`).
+
+Chạy từ thư mục backend:
+    python -m benchmarks.bench_preprocess --megapixels 1 4 12 --repeats 10
+"""
+import argparse
+import io
+import sys
+import time
+
+import numpy as np
+from PIL import Image, ImageFilter
+
+from agents.predict_image import transform, open_image, preprocess
+
+
+def make_jpeg(megapixels: float, quality: int = 90) -> bytes:
+    """Tạo ảnh JPEG giả lập ảnh chụp điện thoại (tỉ lệ 4:3, có chi tiết và vùng mịn)."""
+    height = int((megapixels * 1e6 * 3 / 4) ** 0.5)
+    width = int(height * 4 / 3)
+    rng = np.random.default_rng(0)
+    base = rng.integers(0, 255, size=(height // 16 + 1, width // 16 + 1, 3), dtype=np.uint8)
+    image = Image.fromarray(base).resize((width, height), Image.BICUBIC).filter(ImageFilter.DETAIL)
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def legacy(data: bytes):
+    with Image.open(io.BytesIO(data)) as image:
+        return transform(image.convert("RGB"))
+
+
+def fast(data: bytes):
+    with open_image(io.BytesIO(data)) as image:
+        return preprocess(image)
+
+
+def timeit(fn, data: bytes, repeats: int) -> float:
+    fn(data)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn(data)
+    return (time.perf_counter() - start) / repeats * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--megapixels", type=float, nargs="+", default=[1, 4, 12])
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--tolerance", type=float, default=0.05,
+                        help="Sai khác tuyệt đối trung bình tối đa cho phép (đơn vị sau chuẩn hóa)")
+    args = parser.parse_args()
+
+    print(f"{'MP':>5} {'cũ ms':>9} {'nhanh ms':>9} {'cũ ms/MP':>9} {'nhanh ms/MP':>12} {'x':>6} "
+          f"{'mean |Δ|':>9} {'max |Δ|':>8}")
+    failed = False
+    for megapixels in args.megapixels:
+        data = make_jpeg(megapixels)
+        legacy_ms = timeit(legacy, data, args.repeats)
+        fast_ms = timeit(fast, data, args.repeats)
+        diff = (legacy(data) - fast(data)).abs()
+        mean_diff, max_diff = diff.mean().item(), diff.max().item()
+        failed |= mean_diff > args.tolerance
+        print(f"{megapixels:>5.1f} {legacy_ms:>9.1f} {fast_ms:>9.1f} {legacy_ms / megapixels:>9.2f} "
+              f"{fast_ms / megapixels:>12.2f} {legacy_ms / fast_ms:>6.1f} {mean_diff:>9.4f} {max_diff:>8.3f}")
+    if failed:
+        print(f"❌ Sai khác trung bình vượt ngưỡng {args.tolerance}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+"""
+Đo recall và độ trễ của tìm kiếm vector, BM25, tìm kiếm lai (RRF) và tìm kiếm lai có lọc
+theo cây trồng nhận diện từ câu hỏi trên plant.json.
+
+Mỗi bản ghi bệnh sinh ra ba câu hỏi: tên khoa học, tên bệnh và một câu dấu hiệu nhận biết.
+Một câu hỏi được tính là trúng nếu trong k kết quả đầu có chunk của đúng bản ghi đó.
+Collection Chroma được dựng tạm trong thư mục riêng, không đụng tới kho đang chạy.
+
+Chạy từ thư mục backend:
+    python -m benchmarks.bench_retrieval --k 1 2 4
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from langchain_chroma import Chroma
+
+from agents.crops import extract_crops
+from agents.document_parser import make_text_splitter
+from agents.lexical_index import BM25Index
+from agents.vector_store import JSON_FILE_PATH, get_embeddings, hybrid_search
+from load_json import load_documents_from_json
+
+
+def make_queries(json_path: str):
+    with open(json_path, "r", encoding="utf-8") as f:
+        items = json.load(f).get("danh_sach_benh", [])
+    queries = []
+    for item in items:
+        scientific = " ".join(item.get("ten_khoa_hoc", "").split()[:2])
+        sign = item.get("dau_hieu_de_nhan_biet", "").split(".")[0]
+        for kind, text in (("tên khoa học", scientific), ("tên bệnh", item.get("ten_benh", "")),
+                           ("dấu hiệu", sign)):
+            if text.strip():
+                queries.append((kind, text, str(item.get("id"))))
+    return queries
+
+
+def evaluate(search, queries, k_values):
+    hits = {kind: {k: 0 for k in k_values} for kind, _, _ in queries}
+    counts = {kind: 0 for kind, _, _ in queries}
+    latencies = []
+    max_k = max(k_values)
+    for kind, text, record_id in queries:
+        start = time.perf_counter()
+        docs = search(text, max_k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        ranked_ids = [str(doc.metadata.get("id")) for doc in docs]
+        counts[kind] += 1
+        for k in k_values:
+            hits[kind][k] += record_id in ranked_ids[:k]
+    recall = {kind: {k: hits[kind][k] / counts[kind] for k in k_values} for kind in counts}
+    return recall, float(np.mean(latencies)), float(np.percentile(latencies, 95))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--json", default=JSON_FILE_PATH)
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+
+    documents = load_documents_from_json(args.json)
+    # Cùng cách chia chunk với kho tri thức thật (load_json.py, tài liệu upload)
+    chunks = make_text_splitter().split_documents(documents)
+    queries = make_queries(args.json)
+    embeddings = get_embeddings()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        start = time.perf_counter()
+        store = Chroma.from_documents(chunks, embeddings, persist_directory=os.path.join(tmp_dir, "chroma"),
+                                      collection_metadata={"hnsw:space": "cosine"})
+        print(f"Dựng Chroma: {len(chunks)} chunk trong {time.perf_counter() - start:.1f}s")
+        start = time.perf_counter()
+        index = BM25Index()
+        index.sync_with(store._collection, force=True)
+        print(f"Dựng BM25: {index.stats()} trong {(time.perf_counter() - start) * 1000:.0f} ms")
+        print(f"{len(queries)} câu hỏi\n")
+
+        methods = {
+            "vector": lambda q, k: store.similarity_search(q, k=k),
+            "bm25": lambda q, k: [doc for doc, _ in index.search(q, k=k)],
+            "lai (RRF)": lambda q, k: hybrid_search(q, k=k, vector_k=k, lexical_k=k,
+                                                    vector_store=store, lexical_index=index),
+            "lai+cây": lambda q, k: hybrid_search(q, k=k, vector_k=k, lexical_k=k, vector_store=store,
+                                                  lexical_index=index, crops=extract_crops(q)),
+        }
+        kinds = list(dict.fromkeys(kind for kind, _, _ in queries))
+        header = " ".join(f"{kind[:12]}@{k:<3}" for kind in kinds for k in args.k)
+        print(f"{'phương pháp':<11} {header} {'ms tb':>7} {'ms p95':>7}")
+        for name, search in methods.items():
+            recall, mean_ms, p95_ms = evaluate(search, queries, args.k)
+            row = " ".join(f"{recall[kind][k]:>{len(kind[:12]) + 4}.2f}" for kind in kinds for k in args.k)
+            print(f"{name:<11} {row} {mean_ms:>7.2f} {p95_ms:>7.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
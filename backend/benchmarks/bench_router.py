@@ -0,0 +1,58 @@
+"""
+Hiệu chỉnh ngưỡng của fast router trên tập câu hỏi đã gán nhãn data/router_eval.json.
+
+In precision/coverage của từng route khi chỉ dùng luật từ khóa, và khi thêm phân loại
+nearest-centroid với từng cặp (min_similarity, min_margin). Chỉ bật FAST_ROUTER_CENTROID=1 với
+cặp ngưỡng đạt precision mục tiêu cho mọi route trên embedding model đang dùng.
+
+Chạy từ thư mục backend:
+    python -m benchmarks.bench_router --similarity 0.5 0.55 0.6 0.65 --margin 0.03 0.05 0.08 --target 0.95
+"""
+import argparse
+
+from agents.query_router import FastRouter, evaluate_routes, load_eval_set, ROUTER_EVAL_PATH
+from agents.vector_store import get_embeddings
+
+
+def format_report(report: dict) -> str:
+    return "  ".join(f"{route}: P={stats['precision']:.2f} C={stats['coverage']:.2f} (n={stats['routed']})"
+                     for route, stats in report.items())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--eval", default=ROUTER_EVAL_PATH)
+    parser.add_argument("--similarity", type=float, nargs="+", default=[0.5, 0.55, 0.6, 0.65, 0.7])
+    parser.add_argument("--margin", type=float, nargs="+", default=[0.03, 0.05, 0.08, 0.1])
+    parser.add_argument("--target", type=float, default=0.95, help="Precision tối thiểu cho mọi route")
+    args = parser.parse_args()
+
+    items = load_eval_set(args.eval)
+    print(f"{len(items)} câu hỏi gán nhãn từ {args.eval}\n")
+    print(f"Chỉ luật từ khóa          {format_report(evaluate_routes(FastRouter(use_centroid=False), items))}")
+
+    embeddings = get_embeddings()
+    if embeddings is None:
+        print("Không load được embedding model, bỏ qua phân loại nearest-centroid.")
+        return
+    router = FastRouter(embeddings_getter=lambda: embeddings, use_centroid=True)
+    passing = []
+    for min_similarity in args.similarity:
+        for min_margin in args.margin:
+            router.min_similarity, router.min_margin = min_similarity, min_margin
+            report = evaluate_routes(router, items)
+            ok = all(stats["precision"] >= args.target for stats in report.values())
+            if ok:
+                passing.append((sum(stats["coverage"] for stats in report.values()), min_similarity, min_margin))
+            print(f"sim>={min_similarity:.2f} margin>={min_margin:.2f} {'✓' if ok else ' '} {format_report(report)}")
+
+    if passing:
+        _, min_similarity, min_margin = max(passing)
+        print(f"\nĐề xuất: FAST_ROUTER_CENTROID=1 FAST_ROUTER_MIN_SIMILARITY={min_similarity} "
+              f"FAST_ROUTER_MIN_MARGIN={min_margin}")
+    else:
+        print(f"\nKhông cặp ngưỡng nào đạt precision >= {args.target}: giữ FAST_ROUTER_CENTROID=0")
+
+
+if __name__ == "__main__":
+    main()
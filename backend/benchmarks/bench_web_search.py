@@ -0,0 +1,130 @@
+"""
+Đo lớp tìm kiếm web (agents/web_search.py) so với cách cũ (mỗi lượt gọi Tavily một lần, đồng bộ).
+
+Một stub HTTP server cục bộ giả lập endpoint /search của Tavily với độ trễ cấu hình được.
+Kịch bản: `--concurrency` lượt hỏi cùng một câu đến đồng thời, lặp lại `--rounds` vòng
+(vòng 2 trở đi trúng cache), rồi một vòng với upstream chậm hơn ngân sách thời gian.
+
+Chạy từ thư mục backend:
+    python -m benchmarks.bench_web_search --concurrency 8 --rounds 3 --latency-ms 800
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+from agents.web_search import WebSearchCache, WebSearchClient
+
+QUERY = "cách phòng trừ bệnh đạo ôn trên lúa"
+
+
+class StubTavilyHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    latency = 0.0
+    requests = 0
+    lock = threading.Lock()
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        with self.lock:
+            StubTavilyHandler.requests += 1
+        time.sleep(self.latency)
+        body = json.dumps({
+            "query": payload.get("query"),
+            "results": [{"title": "Bệnh đạo ôn", "url": "https://example.org/dao-on",
+                         "content": "Bệnh đạo ôn do nấm Pyricularia oryzae gây ra. " * 10, "score": 0.9}],
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub() -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubTavilyHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def old_search(api_url: str, query: str) -> list:
+    """Cách cũ: một request đồng bộ cho mỗi lượt hỏi, không cache, không giới hạn thời gian."""
+    response = httpx.post(api_url, json={"api_key": "bench", "query": query, "max_results": 1}, timeout=60)
+    return response.json()["results"]
+
+
+async def run_round(search, concurrency: int):
+    async def one():
+        start = time.perf_counter()
+        results = await search(QUERY)
+        return (time.perf_counter() - start) * 1000, bool(results)
+
+    before = StubTavilyHandler.requests
+    start = time.perf_counter()
+    outcomes = await asyncio.gather(*(one() for _ in range(concurrency)))
+    wall_ms = (time.perf_counter() - start) * 1000
+    latencies = sorted(ms for ms, _ in outcomes)
+    answered = sum(ok for _, ok in outcomes)
+    return wall_ms, latencies[-1], answered, StubTavilyHandler.requests - before
+
+
+def report(name: str, row):
+    wall_ms, max_ms, answered, upstream = row
+    print(f"{name:<28} {wall_ms:>9.1f} {max_ms:>9.1f} {answered:>9} {upstream:>10}")
+
+
+async def main_async(args) -> int:
+    logging.disable(logging.WARNING)
+    server = start_stub()
+    api_url = f"http://127.0.0.1:{server.server_address[1]}/search"
+    StubTavilyHandler.latency = args.latency_ms / 1000
+    print(f"{'kịch bản':<28} {'wall ms':>9} {'max ms':>9} {'có kết quả':>9} {'gọi API':>10}")
+
+    for i in range(args.rounds):
+        report(f"cũ, vòng {i + 1}",
+               await run_round(lambda q: asyncio.to_thread(old_search, api_url, q), args.concurrency))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        def new_client(name: str) -> WebSearchClient:
+            return WebSearchClient(api_url=api_url, api_key="bench", budget_seconds=args.budget_ms / 1000,
+                                   cache=WebSearchCache(os.path.join(tmp_dir, name)), write_back=False)
+
+        client = new_client("cache.sqlite3")
+        for i in range(args.rounds):
+            report(f"mới, vòng {i + 1}", await run_round(client.search, args.concurrency))
+        print(f"Thống kê: {client.stats()}")
+        await client.aclose()
+
+        # Upstream chậm hơn ngân sách, cache rỗng
+        StubTavilyHandler.latency = args.slow_latency_ms / 1000
+        client = new_client("slow.sqlite3")
+        report(f"mới, upstream {args.slow_latency_ms:.0f} ms", await run_round(client.search, args.concurrency))
+        await client.aclose()
+    server.shutdown()
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=8, help="Số lượt hỏi cùng câu đến đồng thời")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--latency-ms", type=float, default=800, help="Độ trễ giả lập của Tavily")
+    parser.add_argument("--slow-latency-ms", type=float, default=10000, help="Độ trễ khi upstream bị chậm")
+    parser.add_argument("--budget-ms", type=float, default=4000, help="Ngân sách thời gian của lớp mới")
+    return asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
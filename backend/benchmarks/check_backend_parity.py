@@ -0,0 +1,105 @@
+"""
+Kiểm tra độ khớp dự đoán và đo tốc độ của các backend suy luận so với eager.
+
+Chạy từ thư mục backend, trỏ tới một thư mục ảnh giữ lại (held-out), có thể có thư mục con:
+    python -m benchmarks.check_backend_parity --images ../data/holdout --backends onnx onnx-int8
+
+Script trả về mã lỗi 1 nếu tỉ lệ trùng nhãn top-1 của backend nào thấp hơn --min-agreement.
+"""
+import argparse
+import os
+import sys
+import time
+
+import torch
+
+from agents.model_backends import load_backend, eager_runner
+from agents.predict_image import load_model, open_image, preprocess, class_names, ONNX_MODEL_PATH
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+
+def load_images(folder: str, limit: int):
+    paths = []
+    for root, _, files in os.walk(folder):
+        for name in sorted(files):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                paths.append(os.path.join(root, name))
+    paths = sorted(paths)[:limit] if limit else sorted(paths)
+    tensors = []
+    for path in paths:
+        with open_image(path) as image:
+            tensors.append(preprocess(image))
+    return paths, tensors
+
+
+def predict_all(runner, tensors, batch_size: int):
+    probs = []
+    for i in range(0, len(tensors), batch_size):
+        with torch.no_grad():
+            logits = runner(torch.stack(tensors[i:i + batch_size]))
+        probs.append(torch.softmax(logits, dim=1))
+    return torch.cat(probs)
+
+
+def measure(runner, tensors, batch_size: int, repeats: int):
+    x = torch.stack((tensors * batch_size)[:batch_size])
+    runner(x)  # warm-up
+    start = time.perf_counter()
+    for _ in range(repeats):
+        runner(x)
+    elapsed = time.perf_counter() - start
+    return elapsed / repeats * 1000, batch_size * repeats / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", required=True, help="Thư mục ảnh held-out")
+    parser.add_argument("--backends", nargs="+", default=["onnx", "onnx-int8"])
+    parser.add_argument("--limit", type=int, default=0, help="Số ảnh tối đa (0 = tất cả)")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--min-agreement", type=float, default=0.99)
+    args = parser.parse_args()
+
+    paths, tensors = load_images(args.images, args.limit)
+    if not tensors:
+        print(f"Không tìm thấy ảnh nào trong {args.images}")
+        return 1
+    print(f"Ảnh held-out: {len(tensors)} | torch threads: {torch.get_num_threads()}")
+
+    model = load_model()
+    reference = eager_runner(model)
+    ref_probs = predict_all(reference, tensors, args.batch_size)
+    ref_conf, ref_pred = ref_probs.max(dim=1)
+
+    runners = [("eager", reference)]
+    for name in args.backends:
+        used, runner = load_backend(name, model, onnx_path=ONNX_MODEL_PATH)
+        if used != name:
+            print(f"⚠️ Backend {name} không khởi tạo được, bỏ qua.")
+            continue
+        runners.append((name, runner))
+
+    print(f"\n{'backend':>10} {'top-1 khớp':>11} {'max |Δconf|':>12} {'ms/ảnh (b=1)':>13} "
+          f"{'ms/batch':>10} {'ảnh/s':>8}")
+    failed = False
+    for name, runner in runners:
+        probs = predict_all(runner, tensors, args.batch_size)
+        conf, pred = probs.max(dim=1)
+        agreement = (pred == ref_pred).float().mean().item()
+        max_delta = (conf - ref_conf).abs().max().item()
+        single_ms, _ = measure(runner, tensors, 1, args.repeats)
+        batch_ms, throughput = measure(runner, tensors, args.batch_size, args.repeats)
+        print(f"{name:>10} {agreement:>10.2%} {max_delta:>12.4f} {single_ms:>13.1f} "
+              f"{batch_ms:>10.1f} {throughput:>8.1f}")
+        if agreement < args.min_agreement:
+            failed = True
+            for path, a, b in zip(paths, pred.tolist(), ref_pred.tolist()):
+                if a != b:
+                    print(f"    {os.path.basename(path)}: eager={class_names[b]} | {name}={class_names[a]}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
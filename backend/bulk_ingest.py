@@ -0,0 +1,157 @@
+"""
+Nạp hàng loạt tài liệu (JSON/PDF/TXT/MD/DOCX) từ các thư mục vào kho tri thức đang có.
+
+- Nhiều tài liệu được xử lý song song (--jobs); mỗi tài liệu đọc + chia chunk trong process pool
+  và embedding theo lô (--batch-size) trên --embed-workers luồng, giống upload qua trang admin.
+- Đồng bộ theo manifest: file không đổi bị bỏ qua, chỉ chunk mới được embedding, chunk không
+  còn trong file bị xóa. Chạy lại nhiều lần an toàn.
+- Source của PDF/TXT/MD/DOCX là tên file (trùng với upload qua admin, file cùng tên thay thế
+  nhau); source của JSON là đường dẫn file như load_json.py.
+
+Chạy từ thư mục backend:
+    python bulk_ingest.py data --jobs 2
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional
+
+from agents.document_parser import make_text_splitter
+from agents.ingestion import (INGEST_BATCH_SIZE, INGEST_EMBED_WORKERS, document_hash, ingest_file, manifest,
+                              sync_document)
+from agents.label_index import build_label_index, merge_label_index
+from agents.vector_store import CHROMA_DB_PATH, get_vector_store
+from load_json import load_documents_from_json
+
+SUPPORTED_EXTENSIONS = (".json", ".pdf", ".txt", ".md", ".docx")
+STAT_FIELDS = ("pages", "chunks", "embedded", "unchanged", "deleted")
+
+
+def collect_files(paths: list) -> list:
+    """Các file được hỗ trợ trong `paths` (file hoặc thư mục, duyệt đệ quy), bỏ file trùng source."""
+    files = []
+    for path in paths:
+        if os.path.isfile(path):
+            files.append(os.path.abspath(path))
+            continue
+        for root, dirs, names in os.walk(path):
+            dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+            files.extend(os.path.abspath(os.path.join(root, name)) for name in sorted(names)
+                         if name.lower().endswith(SUPPORTED_EXTENSIONS) and not name.startswith("."))
+
+    selected, sources = [], {}
+    for file_path in files:
+        source = source_of(file_path)
+        if source in sources:
+            if sources[source] != file_path:
+                print(f"⚠️ Bỏ qua {file_path}: trùng tên với {sources[source]}")
+            continue
+        sources[source] = file_path
+        selected.append(file_path)
+    return selected
+
+
+def source_of(file_path: str) -> str:
+    return file_path if file_path.lower().endswith(".json") else os.path.basename(file_path)
+
+
+def ingest_json(file_path: str, vector_store, batch_size: int, embed_workers: int,
+                label_chunks: Optional[dict] = None) -> dict:
+    """Nạp một file JSON; chunk của file đã đọc lại được ghi vào `label_chunks` để build chỉ mục nhãn."""
+    documents, chunks = [], []
+
+    def iter_chunks():
+        # Chỉ đọc file khi hash khác lần nạp trước (sync_document bỏ qua file không đổi trước khi lấy chunk)
+        documents.extend(load_documents_from_json(file_path))
+        chunks.extend(make_text_splitter().split_documents(documents))
+        yield from chunks
+
+    stats = sync_document(file_path, iter_chunks(), document_hash(file_path), vector_store, manifest,
+                          batch_size=batch_size, workers=embed_workers)
+    if label_chunks is not None and not stats["skipped"]:
+        label_chunks[file_path] = chunks
+    return {**stats, "pages": len(documents)}
+
+
+def ingest_one(file_path: str, vector_store, batch_size: int, embed_workers: int,
+               label_chunks: Optional[dict] = None) -> dict:
+    if file_path.lower().endswith(".json"):
+        return ingest_json(file_path, vector_store, batch_size, embed_workers, label_chunks)
+    return ingest_file(file_path, source_of(file_path), batch_size=batch_size, workers=embed_workers,
+                       vector_store=vector_store)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="*", default=[os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")],
+                        help="File hoặc thư mục cần nạp (mặc định: backend/data)")
+    parser.add_argument("--jobs", type=int, default=2, help="Số tài liệu xử lý song song")
+    parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE, help="Số chunk mỗi lô embedding")
+    parser.add_argument("--embed-workers", type=int, default=INGEST_EMBED_WORKERS,
+                        help="Số lô embedding chạy song song cho mỗi tài liệu")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    files = collect_files(args.paths)
+    if not files:
+        print("Không tìm thấy tài liệu nào để nạp.")
+        return 1
+    print(f"Tìm thấy {len(files)} tài liệu. Đang khởi tạo vector store tại: {CHROMA_DB_PATH}")
+    vector_store = get_vector_store()
+    if vector_store is None:
+        print("Lỗi: không khởi tạo được vector store.")
+        return 1
+    count_before = vector_store._collection.count()
+
+    totals = dict.fromkeys(STAT_FIELDS, 0)
+    label_chunks = {}
+    done = skipped = failed = 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(args.jobs, 1), thread_name_prefix="bulk-ingest") as executor:
+        futures = {executor.submit(ingest_one, file_path, vector_store, args.batch_size, args.embed_workers,
+                                   label_chunks): file_path
+                   for file_path in files}
+        for i, future in enumerate(as_completed(futures), start=1):
+            file_path = futures[future]
+            name = os.path.relpath(file_path)
+            try:
+                stats = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"[{i}/{len(files)}] ❌ {name}: {e}")
+                continue
+            for field in STAT_FIELDS:
+                totals[field] += stats.get(field, 0)
+            if stats["skipped"]:
+                skipped += 1
+                print(f"[{i}/{len(files)}] ⏭️ {name}: không thay đổi")
+            elif not stats["chunks"]:
+                failed += 1
+                print(f"[{i}/{len(files)}] ⚠️ {name}: không trích xuất được nội dung (có thể là PDF scan hoặc rỗng)")
+            else:
+                done += 1
+                print(f"[{i}/{len(files)}] ✅ {name}: {stats['chunks']} chunk, {stats['embedded']} mới, "
+                      f"{stats['unchanged']} không đổi, {stats['deleted']} đã xóa")
+    wall = time.perf_counter() - start
+
+    if label_chunks:
+        # Build một lần sau khi mọi job xong: các file JSON chạy song song không ghi đè chỉ mục của nhau
+        label_index = merge_label_index(build_label_index([chunk for chunks in label_chunks.values()
+                                                           for chunk in chunks]), label_chunks, CHROMA_DB_PATH)
+        print(f"Chỉ mục nhãn: {len(label_index)} lớp có tri thức trực tiếp.")
+
+    print("\n--- HOÀN THÀNH ---")
+    print(f"Tài liệu: {done} đã nạp, {skipped} không thay đổi, {failed} lỗi/rỗng | "
+          f"{totals['pages']} trang, {totals['chunks']} chunk, {totals['embedded']} vector mới, "
+          f"{totals['unchanged']} giữ nguyên, {totals['deleted']} đã xóa")
+    print(f"Thời gian: {wall:.1f}s | {len(files) / wall:.2f} tài liệu/s | "
+          f"{totals['chunks'] / wall:.1f} chunk/s | {totals['embedded'] / wall:.1f} vector/s")
+    print(f"Tổng số vector trong kho: {count_before} -> {vector_store._collection.count()}")
+    return 1 if failed and not (done or skipped) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
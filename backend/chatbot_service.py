@@ -6,6 +6,10 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from langchain_core.messages import HumanMessage
 from database import get_db_session, Conversation, ChatMessage, DiseaseDetection
 from graph import app as langgraph_app
+from worker_pools import PoolSaturatedError
+
+# Các node sinh câu trả lời bằng LLM: token của chúng được stream thẳng về client
+STREAMING_NODES = {"chitchat", "diagnose_disease", "normal_qa"}
 
 
 class AgricultureChatbot:
@@ -55,7 +59,10 @@ class AgricultureChatbot:
                             image_data: Optional[str] = None) -> \
             AsyncGenerator[str, None]:
         """
-        Xử lý truy vấn, CHỜ KẾT QUẢ CUỐI CÙNG, lưu vào DB và trả về.
+        Xử lý truy vấn và stream kết quả qua SSE:
+        - `node`: graph bắt đầu chạy một node (báo tiến trình),
+        - `token`: từng đoạn câu trả lời của LLM ngay khi được sinh ra,
+        - `end`: câu trả lời hoàn chỉnh, chỉ gửi sau khi đã lưu vào DB.
         """
 
         # 1. LƯU TIN NHẮN NGƯỜI DÙNG
@@ -82,8 +89,18 @@ class AgricultureChatbot:
         final_state = None
 
         try:
-            print("Đang gọi graph.ainvoke...")
-            final_state = await self.graph.ainvoke(inputs, config)
+            print("Đang stream graph.astream_events...")
+            async for event in self.graph.astream_events(inputs, config, version="v2"):
+                kind = event["event"]
+                node = event.get("metadata", {}).get("langgraph_node")
+                if kind == "on_chain_start" and node and event.get("name") == node:
+                    yield f"data: {json.dumps({'event': 'node', 'node': node})}\n\n"
+                elif kind == "on_chat_model_stream" and node in STREAMING_NODES:
+                    content = event["data"]["chunk"].content
+                    if content and isinstance(content, str):
+                        yield f"data: {json.dumps({'event': 'token', 'node': node, 'content': content})}\n\n"
+            snapshot = await self.graph.aget_state(config)
+            final_state = snapshot.values if snapshot else None
             print("Graph đã chạy xong.")
 
             if final_state:
@@ -152,6 +169,11 @@ class AgricultureChatbot:
             # 4. GỬI SỰ KIỆN KẾT THÚC
             yield f"data: {json.dumps({'event': 'end', 'final_message': final_bot_response, 'conversation_id': conversation_id})}\n\n"
 
+        except PoolSaturatedError as e:
+            print(f"Hệ thống quá tải: {e}")
+            await self.db.rollback()
+            yield f"data: {json.dumps({'event': 'error', 'detail': 'Hệ thống đang bận, vui lòng thử lại sau ít phút.'})}\n\n"
+
         except Exception as e:
             print(f"\n--- LỖI NGHIÊM TRỌNG TRONG process_query (Graph hoặc DB Error) ---")
             traceback.print_exc()
@@ -0,0 +1,297 @@
+import asyncio
+import logging
+import os
+import random
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Dict, Optional, Sequence, Tuple
+
+from dotenv import load_dotenv
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects.postgresql import insert
+
+from database import AsyncSessionLocal, GraphCheckpoint
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+CHECKPOINT_HOT_THREADS = int(os.getenv("CHECKPOINT_HOT_THREADS", "256"))
+CHECKPOINT_MAX_MESSAGES = int(os.getenv("CHECKPOINT_MAX_MESSAGES", "20"))
+CHECKPOINT_TTL_DAYS = float(os.getenv("CHECKPOINT_TTL_DAYS", "30"))
+CHECKPOINT_PRUNE_INTERVAL_SECONDS = float(os.getenv("CHECKPOINT_PRUNE_INTERVAL_SECONDS", "3600"))
+# Nhiều worker cùng ghi một thread: kiểm tra checkpoint_id trong DB trước khi dùng bản trong RAM
+CHECKPOINT_VALIDATE_HOT = os.getenv("CHECKPOINT_VALIDATE_HOT", "1") == "1"
+
+# Kênh không lưu vào checkpoint: ảnh base64 chỉ cần trong lượt hiện tại
+STRIPPED_CHANNELS = ("image_data",)
+
+
+class _Record:
+    """Checkpoint mới nhất của một (thread_id, checkpoint_ns), đã serialize."""
+
+    def __init__(self, checkpoint_id: str, parent_checkpoint_id: Optional[str],
+                 checkpoint: Tuple[str, bytes], metadata: Tuple[str, bytes], writes: Optional[dict] = None):
+        self.checkpoint_id = checkpoint_id
+        self.parent_checkpoint_id = parent_checkpoint_id
+        self.checkpoint = checkpoint
+        self.metadata = metadata
+        # (task_id, idx) -> (task_id, channel, (kiểu, bytes), task_path)
+        self.writes: Dict[Tuple[str, int], tuple] = writes or {}
+
+
+class PostgresCheckpointSaver(BaseCheckpointSaver):
+    """
+    Checkpointer của LangGraph lưu trong PostgreSQL (bảng graph_checkpoints).
+
+    - Mỗi thread chỉ giữ checkpoint mới nhất (graph không dùng time-travel/interrupt),
+      ảnh base64 bị loại bỏ và `messages` chỉ giữ CHECKPOINT_MAX_MESSAGES tin gần nhất.
+    - Trong RAM chỉ giữ LRU CHECKPOINT_HOT_THREADS thread gần đây.
+    - Pending writes được ghi ngay vào cột `writes` của checkpoint hiện tại, nên worker chết
+      giữa một bước thì các task đã xong của bước đó không phải chạy lại.
+    - Thread không hoạt động quá CHECKPOINT_TTL_DAYS ngày bị xóa bởi `prune_expired`.
+    - Lỗi DB được ném ra cho graph (lượt chat báo lỗi) thay vì chỉ giữ state trong RAM.
+    Chỉ hỗ trợ API bất đồng bộ (graph được chạy bằng astream_events/aget_state) và PostgreSQL
+    (upsert bằng INSERT ... ON CONFLICT của dialect postgresql).
+    """
+
+    def __init__(self, session_factory=AsyncSessionLocal, hot_threads: int = CHECKPOINT_HOT_THREADS,
+                 max_messages: int = CHECKPOINT_MAX_MESSAGES, validate_hot: bool = CHECKPOINT_VALIDATE_HOT,
+                 serde=None):
+        super().__init__(serde=serde)
+        self.session_factory = session_factory
+        self.hot_threads = hot_threads
+        self.max_messages = max_messages
+        self.validate_hot = validate_hot
+        self._hot: "OrderedDict[Tuple[str, str], _Record]" = OrderedDict()
+
+    # --- Cache RAM ---
+
+    def _remember(self, key: Tuple[str, str], record: _Record):
+        if self.hot_threads <= 0:
+            return
+        self._hot[key] = record
+        self._hot.move_to_end(key)
+        while len(self._hot) > self.hot_threads:
+            self._hot.popitem(last=False)
+
+    def _compact(self, values: Dict[str, Any]) -> Dict[str, Any]:
+        values = {k: v for k, v in values.items() if k not in STRIPPED_CHANNELS}
+        messages = values.get("messages")
+        if self.max_messages > 0 and isinstance(messages, list) and len(messages) > self.max_messages:
+            values["messages"] = messages[-self.max_messages:]
+        return values
+
+    # --- DB ---
+
+    async def _load(self, thread_id: str, checkpoint_ns: str) -> Optional[_Record]:
+        async with self.session_factory() as session:
+            row = await session.get(GraphCheckpoint, (thread_id, checkpoint_ns))
+        if row is None:
+            return None
+        writes = {}
+        if row.writes is not None:
+            for task_id, idx, channel, value_type, value, task_path in self.serde.loads_typed(
+                    (row.writes_type, row.writes)):
+                writes[(task_id, idx)] = (task_id, channel, (value_type, value), task_path)
+        return _Record(row.checkpoint_id, row.parent_checkpoint_id, (row.checkpoint_type, row.checkpoint),
+                       (row.metadata_type, row.checkpoint_metadata), writes)
+
+    async def _latest_id(self, thread_id: str, checkpoint_ns: str) -> Optional[str]:
+        async with self.session_factory() as session:
+            return await session.scalar(select(GraphCheckpoint.checkpoint_id).where(
+                GraphCheckpoint.thread_id == thread_id, GraphCheckpoint.checkpoint_ns == checkpoint_ns))
+
+    def _dump_writes(self, record: _Record) -> Tuple[Optional[str], Optional[bytes]]:
+        if not record.writes:
+            return None, None
+        return self.serde.dumps_typed([
+            (task_id, idx, channel, value[0], value[1], task_path)
+            for (task_id, idx), (_, channel, value, task_path) in record.writes.items()
+        ])
+
+    async def _save(self, thread_id: str, checkpoint_ns: str, record: _Record):
+        writes_type, writes = self._dump_writes(record)
+        values = {
+            "checkpoint_id": record.checkpoint_id,
+            "parent_checkpoint_id": record.parent_checkpoint_id,
+            "checkpoint_type": record.checkpoint[0],
+            "checkpoint": record.checkpoint[1],
+            "metadata_type": record.metadata[0],
+            "checkpoint_metadata": record.metadata[1],
+            "writes_type": writes_type,
+            "writes": writes,
+            "updated_at": datetime.utcnow(),
+        }
+        stmt = insert(GraphCheckpoint).values(thread_id=thread_id, checkpoint_ns=checkpoint_ns, **values)
+        stmt = stmt.on_conflict_do_update(index_elements=["thread_id", "checkpoint_ns"], set_=values)
+        async with self.session_factory() as session:
+            await session.execute(stmt)
+            await session.commit()
+
+    async def _save_writes(self, thread_id: str, checkpoint_ns: str, record: _Record):
+        """Ghi pending writes vào đúng checkpoint (bỏ qua nếu worker khác đã ghi checkpoint mới hơn)."""
+        writes_type, writes = self._dump_writes(record)
+        async with self.session_factory() as session:
+            await session.execute(update(GraphCheckpoint).where(
+                GraphCheckpoint.thread_id == thread_id,
+                GraphCheckpoint.checkpoint_ns == checkpoint_ns,
+                GraphCheckpoint.checkpoint_id == record.checkpoint_id,
+            ).values(writes_type=writes_type, writes=writes, updated_at=datetime.utcnow()))
+            await session.commit()
+
+    async def _record(self, thread_id: str, checkpoint_ns: str) -> Optional[_Record]:
+        key = (thread_id, checkpoint_ns)
+        record = self._hot.get(key)
+        if record is not None:
+            if not self.validate_hot or await self._latest_id(thread_id, checkpoint_ns) == record.checkpoint_id:
+                self._hot.move_to_end(key)
+                return record
+        record = await self._load(thread_id, checkpoint_ns)
+        if record is not None:
+            self._remember(key, record)
+        else:
+            self._hot.pop(key, None)
+        return record
+
+    def _to_tuple(self, thread_id: str, checkpoint_ns: str, record: _Record) -> CheckpointTuple:
+        # Cùng thứ tự áp dụng writes như khi graph chạy: (task_path, task_id, idx)
+        writes = sorted(record.writes.items(), key=lambda item: (item[1][3], *item[0]))
+        return CheckpointTuple(
+            config={"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns,
+                                     "checkpoint_id": record.checkpoint_id}},
+            checkpoint=self.serde.loads_typed(record.checkpoint),
+            metadata=self.serde.loads_typed(record.metadata),
+            parent_config=(
+                {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns,
+                                  "checkpoint_id": record.parent_checkpoint_id}}
+                if record.parent_checkpoint_id else None
+            ),
+            pending_writes=[(task_id, channel, self.serde.loads_typed(value))
+                            for _, (task_id, channel, value, _) in writes],
+        )
+
+    # --- API của BaseCheckpointSaver ---
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        record = await self._record(thread_id, checkpoint_ns)
+        if record is None:
+            return None
+        checkpoint_id = get_checkpoint_id(config)
+        if checkpoint_id and checkpoint_id != record.checkpoint_id:
+            # Checkpoint cũ không được giữ lại
+            return None
+        return self._to_tuple(thread_id, checkpoint_ns, record)
+
+    async def alist(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None,
+                    before: Optional[RunnableConfig] = None, limit: Optional[int] = None
+                    ) -> AsyncIterator[CheckpointTuple]:
+        if config is None or (limit is not None and limit <= 0):
+            return
+        checkpoint_tuple = await self.aget_tuple(config)
+        if checkpoint_tuple is None:
+            return
+        if before and (before_id := get_checkpoint_id(before)) and checkpoint_tuple.config[
+                "configurable"]["checkpoint_id"] >= before_id:
+            return
+        if filter and not all(checkpoint_tuple.metadata.get(k) == v for k, v in filter.items()):
+            return
+        yield checkpoint_tuple
+
+    async def aput(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+                   new_versions: ChannelVersions) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        compacted = {**checkpoint, "channel_values": self._compact(checkpoint.get("channel_values", {}))}
+        record = _Record(
+            checkpoint["id"],
+            config["configurable"].get("checkpoint_id"),
+            self.serde.dumps_typed(compacted),
+            self.serde.dumps_typed(get_checkpoint_metadata(config, metadata)),
+        )
+        self._remember((thread_id, checkpoint_ns), record)
+        await self._save(thread_id, checkpoint_ns, record)
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns,
+                                 "checkpoint_id": checkpoint["id"]}}
+
+    async def aput_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str,
+                          task_path: str = "") -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        record = self._hot.get((thread_id, checkpoint_ns))
+        if record is None:
+            # Đã bị đẩy khỏi LRU: đọc lại checkpoint từ DB để ghi writes vào đúng bản
+            record = await self._record(thread_id, checkpoint_ns)
+        if record is None or record.checkpoint_id != config["configurable"]["checkpoint_id"]:
+            return
+        changed = False
+        for idx, (channel, value) in enumerate(writes):
+            inner_key = (task_id, WRITES_IDX_MAP.get(channel, idx))
+            if inner_key[1] >= 0 and inner_key in record.writes:
+                continue
+            if channel in STRIPPED_CHANNELS:
+                value = None
+            record.writes[inner_key] = (task_id, channel, self.serde.dumps_typed(value), task_path)
+            changed = True
+        if changed:
+            await self._save_writes(thread_id, checkpoint_ns, record)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        for key in [key for key in self._hot if key[0] == thread_id]:
+            del self._hot[key]
+        async with self.session_factory() as session:
+            await session.execute(delete(GraphCheckpoint).where(GraphCheckpoint.thread_id == thread_id))
+            await session.commit()
+
+    def get_next_version(self, current: Optional[str], channel: None) -> str:
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
+
+    # --- Dọn dẹp ---
+
+    async def prune_expired(self, ttl_days: float = CHECKPOINT_TTL_DAYS) -> int:
+        """Xóa checkpoint của các thread không hoạt động quá ttl_days ngày."""
+        cutoff = datetime.utcnow() - timedelta(days=ttl_days)
+        async with self.session_factory() as session:
+            result = await session.execute(delete(GraphCheckpoint).where(GraphCheckpoint.updated_at < cutoff)
+                                           .returning(GraphCheckpoint.thread_id, GraphCheckpoint.checkpoint_ns))
+            expired = result.all()
+            await session.commit()
+        for thread_id, checkpoint_ns in expired:
+            self._hot.pop((thread_id, checkpoint_ns), None)
+        if expired:
+            logger.info(f"🧹 Đã xóa checkpoint của {len(expired)} hội thoại cũ hơn {ttl_days:g} ngày.")
+        return len(expired)
+
+    async def run_pruner(self, interval_seconds: float = CHECKPOINT_PRUNE_INTERVAL_SECONDS):
+        """Vòng lặp nền cho lifespan: định kỳ gọi `prune_expired`."""
+        while True:
+            try:
+                await self.prune_expired()
+            except Exception as e:
+                logger.error(f"❌ Lỗi khi dọn checkpoint: {e}")
+            await asyncio.sleep(interval_seconds)
+
+    def stats(self) -> dict:
+        return {"hot_threads": len(self._hot), "max_hot_threads": self.hot_threads}
+
+
+checkpointer = PostgresCheckpointSaver()
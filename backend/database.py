@@ -7,7 +7,7 @@ from dotenv import load_dotenv
 
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
-from sqlalchemy import String, Text, DateTime, Integer, ForeignKey, func, Float, UniqueConstraint
+from sqlalchemy import String, Text, DateTime, Integer, ForeignKey, func, Float, UniqueConstraint, LargeBinary, Boolean
 from werkzeug.security import generate_password_hash, check_password_hash
 
 # --- 1. LOAD ENV VARS & SETUP DB CONNECTION ---
@@ -138,4 +138,55 @@ class Feedback(Base):
     # Mối quan hệ
     message: Mapped["ChatMessage"] = relationship(back_populates="feedback")
     user: Mapped["User"] = relationship(back_populates="feedback")
-    __table_args__ = (UniqueConstraint('message_id', 'user_id', name='uq_user_message_feedback'),)
\ No newline at end of file
+    __table_args__ = (UniqueConstraint('message_id', 'user_id', name='uq_user_message_feedback'),)
+
+
+class GraphCheckpoint(Base):
+    """Checkpoint mới nhất của LangGraph cho mỗi hội thoại (thread_id = conversation_id)."""
+    __tablename__ = "graph_checkpoints"
+
+    thread_id: Mapped[str] = mapped_column(String(64), primary_key=True)
+    checkpoint_ns: Mapped[str] = mapped_column(String(255), primary_key=True, default="")
+    checkpoint_id: Mapped[str] = mapped_column(String(64), nullable=False)
+    parent_checkpoint_id: Mapped[Optional[str]] = mapped_column(String(64))
+
+    # Dữ liệu được serialize bằng serde của LangGraph: (kiểu, bytes)
+    checkpoint_type: Mapped[str] = mapped_column(String(32), nullable=False)
+    checkpoint: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    metadata_type: Mapped[str] = mapped_column(String(32), nullable=False)
+    checkpoint_metadata: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    writes_type: Mapped[Optional[str]] = mapped_column(String(32))
+    writes: Mapped[Optional[bytes]] = mapped_column(LargeBinary)
+
+    updated_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.now(), onupdate=func.now(), index=True)
+
+
+class IngestionJob(Base):
+    """Tác vụ nạp một file upload vào kho tri thức (hàng đợi nạp tài liệu, xem ingestion_queue.py)."""
+    __tablename__ = "ingestion_jobs"
+
+    id: Mapped[str] = mapped_column(String(32), primary_key=True, default=lambda: uuid.uuid4().hex)
+    filename: Mapped[str] = mapped_column(String(255), nullable=False)
+    # File tạm chờ xử lý, bị xóa khi tác vụ kết thúc
+    temp_path: Mapped[str] = mapped_column(String(512), nullable=False)
+    uploaded_by: Mapped[Optional[str]] = mapped_column(String(80))
+
+    # queued / parsing / embedding / done / failed / cancelled
+    status: Mapped[str] = mapped_column(String(16), nullable=False, default="queued", index=True)
+    cancel_requested: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    error: Mapped[Optional[str]] = mapped_column(Text)
+
+    pages: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    chunks: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    embedded: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    unchanged: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    deleted: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    batches: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    skipped: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
+
+    created_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.now(), index=True)
+    started_at: Mapped[Optional[datetime]] = mapped_column(DateTime)
+    finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime)
+    # Worker đang xử lý cập nhật định kỳ; quá hạn nghĩa là worker đã chết và tác vụ được đưa lại hàng đợi
+    heartbeat_at: Mapped[Optional[datetime]] = mapped_column(DateTime, index=True)
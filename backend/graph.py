@@ -1,21 +1,36 @@
 
 import base64
-import uuid
-from typing import TypedDict, Annotated, List, Optional, Literal
-from sentence_transformers import CrossEncoder
+from typing import TypedDict, Annotated, List, Optional, Literal, Tuple
 from langgraph.graph import StateGraph, END
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
 import operator
 from dotenv import load_dotenv
-from langchain_cohere import ChatCohere
-from langchain_community.tools.tavily_search import TavilySearchResults
-from agents.predict_image import predict
-from langgraph.checkpoint.memory import InMemorySaver
 import os
-from agents.vector_store import vector_store
+import asyncio
+import threading
+from agents.vector_store import get_vector_store, get_label_index, hybrid_search
 from pydantic import BaseModel, Field
+from worker_pools import inference_pool, retrieval_pool, PoolSaturatedError
+from model_server import get_model_client, ModelServerError
+from llm_clients import llm_clients
+from checkpointer import checkpointer
+from agents.query_router import FastRouter
+from agents.vector_store import get_embeddings
+from agents.answer_cache import answer_cache
+from agents.reranker import reranker, RERANK_CANDIDATES, RERANK_TOP_N
+from agents.web_search import web_search
+from agents.crops import extract_crops
 load_dotenv()
-reranker_model = CrossEncoder('cross-encoder/mmarco-mMiniLMv2-L12-H384-v1')
+FAST_ROUTER_ENABLED = os.getenv("FAST_ROUTER_ENABLED", "1") == "1"
+SPECULATIVE_RETRIEVAL = os.getenv("SPECULATIVE_RETRIEVAL", "1") == "1"
+SPECULATIVE_MIN_OVERLAP = float(os.getenv("SPECULATIVE_MIN_OVERLAP", "0.6"))
+CROP_FILTER_ENABLED = os.getenv("CROP_FILTER_ENABLED", "1") == "1"
+fast_router = FastRouter(embeddings_getter=get_embeddings) if FAST_ROUTER_ENABLED else None
+model_client = get_model_client()
+if not model_client:
+    from agents.predict_image import predict_bytes, decode_base64_image
+
+
 def encode_image(image_path: str) -> str:
     """Encode image to base64"""
     with open(image_path, "rb") as image_file:
@@ -34,6 +49,8 @@ class AgricultureState(TypedDict):
     image_data: Optional[str]
     disease_info: Optional[dict]
     context: dict
+    cached_answer: Optional[dict]
+    prefetched_context: Optional[dict]
 
 
 # def cosine_similarity(a, b):
@@ -177,7 +194,100 @@ class AgricultureState(TypedDict):
 #     return {
 #         **state,
 #         "query_type": query_type}
-def process_user_query(state: AgricultureState) -> AgricultureState:
+# Chỉ câu hỏi dạng văn bản mới dùng cache câu trả lời (chẩn đoán ảnh phụ thuộc vào ảnh)
+CACHEABLE_QUERY_TYPES = {"text_disease", "normal_qa"}
+
+
+async def _lookup_cached_answer(query_type: str, query: str) -> Optional[dict]:
+    if query_type not in CACHEABLE_QUERY_TYPES or not answer_cache.enabled:
+        return None
+    try:
+        cached = await retrieval_pool.run(answer_cache.get, query_type, query)
+    except PoolSaturatedError:
+        raise
+    except Exception as e:
+        print(f"Lỗi khi tra cache câu trả lời: {e}")
+        return None
+    if cached:
+        print(f"Cache hit ({cached['similarity']:.3f}): '{query}' ~ '{cached['query']}'")
+    return cached
+
+
+async def _store_answer(state: AgricultureState, answer: str):
+    """Lưu câu trả lời có căn cứ từ kho tri thức vào cache."""
+    if state['query_type'] not in CACHEABLE_QUERY_TYPES or not state['context'].get('has_good_context'):
+        return
+    try:
+        await retrieval_pool.run(answer_cache.put, state['query_type'], state['condensed_query'], answer,
+                                 state['context'].get('sources', []))
+    except Exception as e:
+        print(f"Lỗi khi lưu cache câu trả lời: {e}")
+
+
+def cached_answer(state: AgricultureState) -> AgricultureState:
+    """Trả lời ngay bằng câu trả lời đã lưu cho câu hỏi tương tự."""
+    cached = state['cached_answer']
+    return {
+        **state,
+        "context": {"retrieved_docs": [], "sources": cached.get("sources", []), "has_good_context": True},
+        "messages": [AIMessage(content=cached["answer"])]
+    }
+
+
+def _token_overlap(a: str, b: str) -> float:
+    """Độ trùng từ (Jaccard) giữa hai câu hỏi."""
+    tokens_a, tokens_b = set(a.lower().split()), set(b.lower().split())
+    if not tokens_a or not tokens_b:
+        return 0.0
+    return len(tokens_a & tokens_b) / len(tokens_a | tokens_b)
+
+
+async def _speculative_search(query: str, cancel_event: threading.Event) -> Optional[list]:
+    try:
+        return await retrieval_pool.run(_search_and_rerank, query, cancel_event)
+    except Exception as e:
+        print(f"Bỏ qua truy xuất song song: {e}")
+        return None
+
+
+def _start_speculative_retrieval(user_query: str) -> Optional[Tuple[asyncio.Task, threading.Event]]:
+    # Không chạy khi retrieval pool có tác vụ đang chờ: tránh tốn tài nguyên cho kết quả có thể bị bỏ
+    if not SPECULATIVE_RETRIEVAL or retrieval_pool.pending >= retrieval_pool.max_workers:
+        return None
+    cancel_event = threading.Event()
+    return asyncio.create_task(_speculative_search(user_query, cancel_event)), cancel_event
+
+
+def _cancel_speculative_retrieval(speculative: Optional[Tuple[asyncio.Task, threading.Event]]):
+    """Hủy task và báo cho thread đang truy xuất dừng trước bước rerank (hủy task không dừng được thread)."""
+    if speculative is not None:
+        task, cancel_event = speculative
+        cancel_event.set()
+        task.cancel()
+
+
+async def _reuse_speculative_retrieval(speculative: Optional[Tuple[asyncio.Task, threading.Event]], user_query: str,
+                                       condensed_query: str, query_type: str,
+                                       cached: Optional[dict]) -> Optional[dict]:
+    """Dùng lại kết quả truy xuất trên câu hỏi gốc nếu câu hỏi đã viết lại đủ gần, ngược lại hủy."""
+    if speculative is None:
+        return None
+    overlap = _token_overlap(user_query, condensed_query)
+    if query_type not in CACHEABLE_QUERY_TYPES or cached or overlap < SPECULATIVE_MIN_OVERLAP:
+        _cancel_speculative_retrieval(speculative)
+        return None
+    final_docs = await speculative[0]
+    if not final_docs:
+        return None
+    print(f"Dùng kết quả truy xuất song song (overlap {overlap:.2f})")
+    return {
+        "query": user_query,
+        "retrieved_docs": [doc.page_content for doc in final_docs],
+        "sources": [doc.metadata.get("source", "Local DB") for doc in final_docs],
+    }
+
+
+async def process_user_query(state: AgricultureState) -> AgricultureState:
     """
  nén lịch sử vừa phân loại .
     """
@@ -191,20 +301,36 @@ def process_user_query(state: AgricultureState) -> AgricultureState:
             "condensed_query": user_query,
             "user_query": user_query,
             "query_type": "image_disease",
-            "disease_info": None
+            "disease_info": None,
+            "cached_answer": None,
+            "prefetched_context": None
         }
 
     # 2. Chuẩn bị dữ liệu cho LLM
     messages = state.get("messages", [])
     if not messages:
-        return {**state, "condensed_query": "", "query_type": "chitchat"}
+        return {**state, "condensed_query": "", "query_type": "chitchat", "prefetched_context": None}
 
     user_query = messages[-1].content
 
     chat_history = messages[-6:-1]
     history_str = "\n".join([f"{msg.type}: {msg.content}" for msg in chat_history])
 
-    llm = ChatCohere(model="command-r-plus-08-2024", temperature=0)
+    # Bộ định tuyến cục bộ: câu hiển nhiên không cần gọi LLM phân loại
+    if fast_router is not None:
+        decision = await retrieval_pool.run(fast_router.route, user_query, bool(chat_history))
+        if decision is not None:
+            print(f"Fast router: {decision.query_type} ({decision.reason}, {decision.confidence:.2f})")
+            return {
+                **state,
+                "condensed_query": user_query,
+                "query_type": decision.query_type,
+                "user_query": user_query,
+                "cached_answer": await _lookup_cached_answer(decision.query_type, user_query),
+                "prefetched_context": None
+            }
+
+    llm = llm_clients.chat_model(temperature=0)
 
     structured_llm = llm.with_structured_output(QueryAnalysis)
 
@@ -247,17 +373,28 @@ def process_user_query(state: AgricultureState) -> AgricultureState:
 #
     """
 
+    # Truy xuất trên câu hỏi gốc song song với lời gọi LLM phân loại
+    speculative = _start_speculative_retrieval(user_query)
     try:
         # Gọi LLM 1 lần duy nhất
-        result = structured_llm.invoke(system_prompt)
+        async with llm_clients.limit():
+            result = await structured_llm.ainvoke(system_prompt)
 
+        cached = await _lookup_cached_answer(result.query_type, result.condensed_query)
         return {
             **state,
             "condensed_query": result.condensed_query,
             "query_type": result.query_type,
-            "user_query": user_query
+            "user_query": user_query,
+            "cached_answer": cached,
+            "prefetched_context": await _reuse_speculative_retrieval(
+                speculative, user_query, result.condensed_query, result.query_type, cached)
         }
 
+    except PoolSaturatedError:
+        # Quá tải: báo lỗi cho client thay vì chạy tiếp normal_qa trên pool đang đầy
+        _cancel_speculative_retrieval(speculative)
+        raise
     except Exception as e:
         print(f"Lỗi khi xử lý query (fallback về normal_qa): {e}")
         # Fallback an toàn nếu API lỗi
@@ -265,17 +402,21 @@ def process_user_query(state: AgricultureState) -> AgricultureState:
             **state,
             "condensed_query": user_query,
             "query_type": "normal_qa",  # Mặc định coi là câu hỏi thường
-            "user_query": user_query
+            "user_query": user_query,
+            "cached_answer": None,
+            "prefetched_context": await _reuse_speculative_retrieval(
+                speculative, user_query, user_query, "normal_qa", None)
         }
-def chitchat(state: AgricultureState) -> AgricultureState:
+async def chitchat(state: AgricultureState) -> AgricultureState:
     """Tạo phản hồi nhanh cho các câu chào hỏi, cảm ơn."""
     # Bạn có thể dùng LLM nếu muốn câu trả lời đa dạng
-    llm = ChatCohere(model="command-r-plus-08-2024", temperature=0)
+    llm = llm_clients.chat_model(temperature=0)
 
     prompt = f"Người dùng: {state['user_query']}. Bạn là trợ lý nông nghiệp thân thiện Hãy trả lời ngắn gọn."
     try:
 
-        response = llm.invoke([SystemMessage("Bạn là trợ lý nông nghiệp thân thiện"),HumanMessage(content=prompt)])
+        async with llm_clients.limit():
+            response = await llm.ainvoke([SystemMessage("Bạn là trợ lý nông nghiệp thân thiện"),HumanMessage(content=prompt)])
 
         # Xử lý kết quả trả về
         if isinstance(response, dict):
@@ -303,11 +444,32 @@ def chitchat(state: AgricultureState) -> AgricultureState:
     }
 
 
-def analyze_image(state: AgricultureState) -> AgricultureState:
+def _classify_image(image_data: str) -> dict:
+    if model_client:
+        return model_client.classify_base64(image_data)
+    # Giải mã base64 thẳng vào bộ nhớ rồi dự đoán, không qua file tạm
+    image_buffer = decode_base64_image(image_data)
+    return predict_bytes(image_buffer)
+
+
+def cache_stats() -> dict:
+    """Thống kê hit/miss của các cache trên đường suy luận (cache ảnh nằm trên model server nếu có)."""
+    stats = {"reranker": reranker.stats()}
+    if model_client:
+        try:
+            stats["image"] = model_client.stats()["image_cache"]
+        except ModelServerError as e:
+            stats["image"] = {"error": str(e)}
+    else:
+        from agents.predict_image import image_cache
+        stats["image"] = image_cache.stats()
+    return stats
+
+
+async def analyze_image(state: AgricultureState) -> AgricultureState:
     """Phân tích ảnh"""
 
     image_data = state.get('image_data')  # Lấy dữ liệu base64
-    temp_filename = None  # Khởi tạo để dùng trong finally
 
     if not image_data:
         return {
@@ -315,39 +477,15 @@ def analyze_image(state: AgricultureState) -> AgricultureState:
             "messages": [AIMessage(content="Không có ảnh nào được gửi lên.")]
         }
 
-    try:
-        # 1. Decode base64 thành bytes
-        image_bytes = base64.b64decode(image_data)
-
-        # 2. Tạo thư mục tạm nếu chưa có
-        temp_dir = "temp_images"
-        if not os.path.exists(temp_dir):
-            os.makedirs(temp_dir)
-
-        # 3. Tạo tên file tạm ngẫu nhiên
-        temp_filename = os.path.join(temp_dir, f"{uuid.uuid4()}.jpg")
-
-        # 4. Lưu ảnh vào file tạm
-        with open(temp_filename, "wb") as f:
-            f.write(image_bytes)
-        print(f"Ảnh tạm đã được lưu tại: {temp_filename}")
-        response = predict(image_path=temp_filename)
-
-
-        disease_info = {
-            "plant_type": "Cây",
-            "disease_detected": response.get("label", "Unknown"),
-            "confidence": f"{response.get('confidence', 0) * 100:.1f}%"
-            }
+    # ResNet chạy trên inference pool để không chặn event loop
+    response = await inference_pool.run(_classify_image, image_data)
 
-    finally:
-        # Xóa file tạm sau khi dùng xong
-        if temp_filename and os.path.exists(temp_filename):
-            try:
-                os.remove(temp_filename)
-                print(f"Đã xóa file tạm: {temp_filename}")
-            except Exception as delete_error:
-                print(f"Lỗi khi xóa file tạm {temp_filename}: {delete_error}")
+    disease_info = {
+        "plant_type": "Cây",
+        "disease_detected": response.get("label", "Unknown"),
+        "class_id": response.get("class_id"),
+        "confidence": f"{response.get('confidence', 0) * 100:.1f}%"
+        }
 
     return {
         "disease_info": disease_info
@@ -367,9 +505,55 @@ def request_more_info(state: AgricultureState) -> AgricultureState:
     }
 
 
-def retrieve_knowledge(state: AgricultureState) -> AgricultureState:
-    global vector_store, reranker_model
-    if not vector_store:
+def _search_and_rerank(search_query: str, cancel_event: Optional[threading.Event] = None) -> list:
+    """
+    Tìm kiếm lai vector + BM25, rerank bằng CrossEncoder (CPU-bound, chạy trên retrieval pool).
+    `cancel_event` được đặt (truy xuất song song bị bỏ) thì dừng trước bước rerank.
+    """
+    # Cây trồng trong câu hỏi hoặc trong nhãn bệnh của model ảnh (đã nằm trong search_query)
+    crops = extract_crops(search_query) if CROP_FILTER_ENABLED else []
+    if crops:
+        print(f"Lọc theo cây trồng: {crops}")
+    try:
+        initial_docs = hybrid_search(search_query, k=RERANK_CANDIDATES, crops=crops)
+    except Exception as e:
+        print(f"Lỗi Vector Search: {e}")
+        initial_docs = []
+    if cancel_event is not None and cancel_event.is_set():
+        return []
+    try:
+        ranked = reranker.rerank(search_query, initial_docs)
+    except Exception as e:
+        # Reranker lỗi (model chưa load được, model server mất kết nối): dùng thứ tự của tìm kiếm lai
+        print(f"Lỗi Rerank, dùng kết quả tìm kiếm lai: {e}")
+        return initial_docs[:RERANK_TOP_N]
+    for doc, score in ranked:
+        print(f"Score: {score:.4f} | Source: {doc.metadata.get('source', 'Unknown')}")
+    return [doc for doc, _ in ranked]
+
+
+def _label_context(state: AgricultureState) -> list:
+    """Chẩn đoán từ ảnh: lấy thẳng các đoạn tri thức của bệnh theo class id."""
+    disease_info = state.get('disease_info') or {}
+    if state['query_type'] != "image_disease" or disease_info.get('class_id') is None:
+        return []
+    label_index = get_label_index()
+    return label_index.lookup(disease_info['class_id']) if label_index else []
+
+
+async def retrieve_knowledge(state: AgricultureState) -> AgricultureState:
+    label_entries = await retrieval_pool.run(_label_context, state)
+    if label_entries:
+        print(f"Tra cứu trực tiếp theo nhãn: {len(label_entries)} đoạn")
+        return {
+            **state,
+            "context": {
+                "retrieved_docs": [entry["content"] for entry in label_entries],
+                "sources": [entry["source"] for entry in label_entries],
+                "has_good_context": True
+            }
+        }
+    if not await retrieval_pool.run(get_vector_store):
         print("Lỗi: vector_store không được load, bỏ qua RAG.")
         return {"context": {"retrieved_docs": [], "sources": [], "has_good_content": False}}
     if state.get('disease_info'):
@@ -377,41 +561,20 @@ def retrieve_knowledge(state: AgricultureState) -> AgricultureState:
     else:
         search_query = state['condensed_query']
 
-    try:
-        initial_docs = vector_store.similarity_search(search_query, k=2)
-    except Exception as e:
-        print(f"Lỗi Vector Search: {e}")
-        initial_docs = []
-    final_docs = []
-    if initial_docs:
-        pairs = [[search_query, doc.page_content] for doc in initial_docs]
-        scores = reranker_model.predict(pairs)
-        scored_docs = list(zip(initial_docs, scores))
-        scored_docs.sort(key=lambda x: x[1], reverse=True)
-        RERANK_THRESHOLD = 0.0
-        valid_docs = []
-        for doc, score in scored_docs:
-            print(f"Score: {score:.4f} | Source: {doc.metadata.get('source', 'Unknown')}")
-            if score > RERANK_THRESHOLD:
-                valid_docs.append(doc)
-        if len(valid_docs) > 0:
-            final_docs = valid_docs[:1]
-        else:
-            final_docs = []
-    retrieved_contents = [doc.page_content for doc in final_docs]
-    sources_list = [doc.metadata.get("source", "Local DB") for doc in final_docs]
-    if not final_docs:
-        try:
-            tavily_tool = TavilySearchResults(max_results=1)
-            web_results = tavily_tool.run(search_query)
-            if isinstance(web_results, list):
-                for res in web_results:
-                    content = res.get('content', '')
-                    url = res.get('url', 'Web')
-                    retrieved_contents.append(f"[Web Search]: {content}")
-                    sources_list.append(url)
-        except Exception as e:
-            print(f"Lỗi Tavily: {e}")
+    prefetched = state.get('prefetched_context')
+    if prefetched and not state.get('disease_info'):
+        # Đã truy xuất song song với bước phân loại
+        retrieved_contents = list(prefetched["retrieved_docs"])
+        sources_list = list(prefetched["sources"])
+    else:
+        final_docs = await retrieval_pool.run(_search_and_rerank, search_query)
+        retrieved_contents = [doc.page_content for doc in final_docs]
+        sources_list = [doc.metadata.get("source", "Local DB") for doc in final_docs]
+    if not retrieved_contents:
+        # Có ngân sách thời gian, lỗi hoặc quá hạn trả về danh sách rỗng
+        for res in await web_search.search(search_query):
+            retrieved_contents.append(f"[Web Search]: {res['content']}")
+            sources_list.append(res['url'])
     has_good_context = len(retrieved_contents) > 0
     context = {
         "retrieved_docs": retrieved_contents,
@@ -446,7 +609,7 @@ Bạn có thể vui lòng:
 
 async def generate_disease_diagnosis(state: AgricultureState) -> AgricultureState:
     """Generate detailed disease diagnosis"""
-    llm = ChatCohere(model="command-r-plus-08-2024", temperature=0.3)
+    llm = llm_clients.chat_model(temperature=0.3)
     context_text = "\n\n".join(state['context'].get('retrieved_docs', []))
     if state['query_type'] == "image_disease":
         disease_context = f"""
@@ -470,12 +633,15 @@ async def generate_disease_diagnosis(state: AgricultureState) -> AgricultureStat
         4. End with a word of encouragement and an offer of additional support.
         Answer in Vietnamese"""
     try:
-        response = await  llm.ainvoke([HumanMessage(content=diagnosis_prompt)])
+        async with llm_clients.limit():
+            response = await llm.ainvoke([HumanMessage(content=diagnosis_prompt)])
         final_response_content = response.content.strip()
 
     # Nếu không có nội dung (ví dụ lỗi)
         if not final_response_content:
             final_response_content = "Xin lỗi, tôi chưa thể tạo câu trả lời lúc này."
+        else:
+            await _store_answer(state, final_response_content)
 
     except Exception as e:
         print(f"Lỗi invoke format: {e}")  # Sửa tên lỗi
@@ -490,17 +656,20 @@ async def generate_disease_diagnosis(state: AgricultureState) -> AgricultureStat
 
 async def generate_normal_qa(state: AgricultureState) -> AgricultureState:
     """Generate response for normal agriculture question"""
-    llm = ChatCohere(model="command-r-plus-08-2024", temperature=0.3)
+    llm = llm_clients.chat_model(temperature=0.3)
     normal_prompt = f"""You are an expert agricultural advisor. Answer the following question comprehensively.
     Question: {state['condensed_query']}
     Please answer accurately and according to the user's request, do not reply to another topic by mistake. Answer in Vietnamese"""
     try:
-        response = await  llm.ainvoke([HumanMessage(content=normal_prompt)])
+        async with llm_clients.limit():
+            response = await llm.ainvoke([HumanMessage(content=normal_prompt)])
         final_response_content = response.content.strip()
 
         # Nếu không có nội dung
         if not final_response_content:
             final_response_content = "Xin lỗi, tôi chưa thể tạo câu trả lời lúc này."
+        else:
+            await _store_answer(state, final_response_content)
 
     except Exception as e:
         print(f"Lỗi invoke format: {e}")  # Sửa tên lỗi
@@ -511,7 +680,6 @@ async def generate_normal_qa(state: AgricultureState) -> AgricultureState:
         "messages": [AIMessage(content=final_response_content)]
     }
 def create_agriculture_graph():
-    memory = InMemorySaver()
     """Create the LangGraph workflow"""
     workflow = StateGraph(AgricultureState)
     # workflow.add_node("condense_history", condense_conversation_history)
@@ -524,6 +692,7 @@ def create_agriculture_graph():
     workflow.add_node("request_clarification", request_clarification)
     workflow.add_node("diagnose_disease", generate_disease_diagnosis)
     workflow.add_node("normal_qa", generate_normal_qa)
+    workflow.add_node("cached_answer", cached_answer)
     # workflow.set_entry_point("condense_history")
     # workflow.add_edge("condense_history", "classify")
     workflow.set_entry_point("process_user_query")
@@ -534,6 +703,8 @@ def create_agriculture_graph():
             return "analyze_image"
         if state['query_type'] == "chitchat":
             return "chitchat"
+        if state.get('cached_answer'):
+            return "cached_answer"
         else:
             return "retrieve_knowledge"
 
@@ -543,7 +714,8 @@ def create_agriculture_graph():
         {
             "analyze_image": "analyze_image",
             "retrieve_knowledge": "retrieve_knowledge",
-            "chitchat": "chitchat"
+            "chitchat": "chitchat",
+            "cached_answer": "cached_answer"
         }
     )
 
@@ -607,8 +779,9 @@ def create_agriculture_graph():
     workflow.add_edge("request_more_info", END)
     workflow.add_edge("request_clarification", END)
     workflow.add_edge("chitchat", END)
+    workflow.add_edge("cached_answer", END)
 
-    return workflow.compile(checkpointer=memory)
+    return workflow.compile(checkpointer=checkpointer)
 
 
 app = create_agriculture_graph()
@@ -0,0 +1,268 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+import traceback
+from datetime import timedelta
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func, select, text, update
+
+from agents.ingestion import IngestionCancelled, ingest_file
+from database import AsyncSessionLocal, IngestionJob
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Số file được nạp đồng thời trên toàn hệ thống (mọi worker uvicorn), mỗi file dùng thêm
+# INGEST_EMBED_WORKERS luồng embedding; giữ nhỏ để chat không bị tranh CPU
+INGEST_MAX_CONCURRENT_JOBS = int(os.getenv("INGEST_MAX_CONCURRENT_JOBS", "1"))
+INGEST_JOB_POLL_SECONDS = float(os.getenv("INGEST_JOB_POLL_SECONDS", "2"))
+INGEST_JOB_HEARTBEAT_SECONDS = float(os.getenv("INGEST_JOB_HEARTBEAT_SECONDS", "1"))
+# Không có heartbeat quá khoảng này: worker đã chết (restart, crash), tác vụ được đưa lại hàng đợi
+INGEST_JOB_STALE_SECONDS = float(os.getenv("INGEST_JOB_STALE_SECONDS", "60"))
+INGEST_JOB_MAX_ATTEMPTS = int(os.getenv("INGEST_JOB_MAX_ATTEMPTS", "3"))
+
+ACTIVE_STATUSES = ("parsing", "embedding")
+PROGRESS_FIELDS = ("pages", "chunks", "embedded", "unchanged", "deleted", "batches", "skipped")
+# Khóa advisory của PostgreSQL: các worker nhận tác vụ lần lượt để giới hạn đồng thời là chính xác
+_CLAIM_LOCK_KEY = 0x696E6765
+
+
+def job_to_dict(job: IngestionJob) -> dict:
+    finished_or_now = job.finished_at or job.heartbeat_at
+    return {
+        "job_id": job.id,
+        "filename": job.filename,
+        "uploaded_by": job.uploaded_by,
+        "status": job.status,
+        "cancel_requested": job.cancel_requested,
+        "attempts": job.attempts,
+        "error": job.error,
+        **{field: getattr(job, field) for field in PROGRESS_FIELDS},
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+        "duration_seconds": (finished_or_now - job.started_at).total_seconds()
+        if job.started_at and finished_or_now else None,
+    }
+
+
+class IngestionQueue:
+    """
+    Hàng đợi nạp tài liệu lưu trong bảng ingestion_jobs.
+
+    - Upload chỉ ghi file tạm + một dòng `queued`; `workers` vòng lặp nền của mỗi tiến trình
+      nhận tác vụ (tối đa INGEST_MAX_CONCURRENT_JOBS tác vụ chạy cùng lúc trên toàn hệ thống)
+      và chạy `ingest_file` trong thread pool.
+    - Trạng thái: queued -> parsing -> embedding -> done / failed / cancelled; số trang, số chunk
+      và heartbeat được ghi xuống DB mỗi INGEST_JOB_HEARTBEAT_SECONDS giây.
+    - Tác vụ mất heartbeat (tiến trình bị restart) được đưa lại hàng đợi; chạy lại an toàn vì
+      `sync_document` chỉ embedding các chunk chưa có.
+    - Hủy: tác vụ đang chờ bị hủy ngay, tác vụ đang chạy dừng sau lô hiện tại và xóa chunk đã ghi.
+    """
+
+    def __init__(self, session_factory=AsyncSessionLocal, workers: int = INGEST_MAX_CONCURRENT_JOBS,
+                 max_concurrent: int = INGEST_MAX_CONCURRENT_JOBS):
+        self.session_factory = session_factory
+        self.workers = workers
+        self.max_concurrent = max_concurrent
+        self._wakeup = asyncio.Event()
+        self._claim_lock = asyncio.Lock()
+        self._stopping = False
+        self._worker_tasks: List[asyncio.Task] = []
+        self._cancel_events: Dict[str, threading.Event] = {}
+
+    # --- API cho endpoint ---
+
+    async def enqueue(self, temp_path: str, filename: str, uploaded_by: Optional[str] = None) -> dict:
+        async with self.session_factory() as session:
+            job = IngestionJob(temp_path=temp_path, filename=filename, uploaded_by=uploaded_by, status="queued")
+            session.add(job)
+            await session.commit()
+            await session.refresh(job)
+        self._wakeup.set()
+        return job_to_dict(job)
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        async with self.session_factory() as session:
+            job = await session.get(IngestionJob, job_id)
+            return job_to_dict(job) if job is not None else None
+
+    async def list(self, limit: int = 50, status: Optional[str] = None) -> List[dict]:
+        query = select(IngestionJob).order_by(IngestionJob.created_at.desc()).limit(limit)
+        if status:
+            query = query.where(IngestionJob.status == status)
+        async with self.session_factory() as session:
+            jobs = (await session.execute(query)).scalars().all()
+        return [job_to_dict(job) for job in jobs]
+
+    async def cancel(self, job_id: str) -> Optional[dict]:
+        """Hủy tác vụ; None nếu không tìm thấy. Tác vụ đã kết thúc được trả về nguyên trạng."""
+        async with self.session_factory() as session:
+            job = await session.get(IngestionJob, job_id, with_for_update=True)
+            if job is None:
+                return None
+            if job.status == "queued":
+                job.status, job.finished_at = "cancelled", func.now()
+                self._remove_temp_file(job.temp_path)
+            elif job.status in ACTIVE_STATUSES:
+                # Worker đang chạy tác vụ (có thể ở tiến trình khác) thấy cờ này ở heartbeat kế tiếp
+                job.cancel_requested = True
+            await session.commit()
+            await session.refresh(job)
+        event = self._cancel_events.get(job_id)
+        if event is not None:
+            event.set()
+        return job_to_dict(job)
+
+    # --- Worker ---
+
+    async def _requeue_stale(self):
+        cutoff = func.now() - timedelta(seconds=INGEST_JOB_STALE_SECONDS)
+        stale = (IngestionJob.status.in_(ACTIVE_STATUSES)) & (IngestionJob.heartbeat_at < cutoff)
+        async with self.session_factory() as session:
+            failed = await session.execute(
+                update(IngestionJob).where(stale, IngestionJob.attempts >= INGEST_JOB_MAX_ATTEMPTS)
+                .values(status="failed", error="Worker dừng đột ngột quá số lần cho phép", finished_at=func.now())
+                .returning(IngestionJob.temp_path))
+            for temp_path, in failed.all():
+                self._remove_temp_file(temp_path)
+            requeued = await session.execute(
+                update(IngestionJob).where(stale).values(status="queued", heartbeat_at=None)
+                .returning(IngestionJob.filename))
+            names = [name for name, in requeued.all()]
+            await session.commit()
+        if names:
+            logger.warning(f"🔁 Đưa lại hàng đợi {len(names)} tác vụ nạp bị gián đoạn: {names}")
+
+    async def _claim(self) -> Optional[IngestionJob]:
+        async with self._claim_lock, self.session_factory() as session:
+            await session.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": _CLAIM_LOCK_KEY})
+            running = await session.scalar(
+                select(func.count()).select_from(IngestionJob).where(IngestionJob.status.in_(ACTIVE_STATUSES)))
+            if running >= self.max_concurrent:
+                await session.commit()
+                return None
+            # Khóa dòng tới khi commit: `cancel` (cũng khóa dòng) chờ tới lúc tác vụ đã là "parsing" rồi
+            # đặt cancel_requested; dòng đang bị `cancel` khóa thì bỏ qua, trạng thái "cancelled" không bị ghi đè
+            job = await session.scalar(select(IngestionJob).where(IngestionJob.status == "queued")
+                                       .order_by(IngestionJob.created_at).limit(1)
+                                       .with_for_update(skip_locked=True))
+            if job is not None:
+                job.status, job.error, job.cancel_requested = "parsing", None, False
+                job.attempts += 1
+                job.started_at = job.heartbeat_at = func.now()
+                for field in PROGRESS_FIELDS:
+                    setattr(job, field, False if field == "skipped" else 0)
+            await session.commit()
+            if job is not None:
+                await session.refresh(job)
+            return job
+
+    async def _save_progress(self, job_id: str, progress: dict) -> bool:
+        """Ghi tiến độ + heartbeat; trả về True nếu có yêu cầu hủy."""
+        values = {field: progress[field] for field in PROGRESS_FIELDS if field in progress}
+        if progress.get("batches") or progress.get("chunks"):
+            values["status"] = "embedding"
+        async with self.session_factory() as session:
+            cancel_requested = await session.scalar(
+                update(IngestionJob).where(IngestionJob.id == job_id, IngestionJob.status.in_(ACTIVE_STATUSES))
+                .values(heartbeat_at=func.now(), **values).returning(IngestionJob.cancel_requested))
+            await session.commit()
+        return bool(cancel_requested)
+
+    async def _finish(self, job_id: str, status: str, progress: dict, error: Optional[str] = None):
+        values = {field: progress[field] for field in PROGRESS_FIELDS if field in progress}
+        if status == "queued":
+            # Tiến trình đang tắt: tác vụ chạy lại từ đầu sau khi khởi động lại
+            values.update(status="queued", heartbeat_at=None, attempts=IngestionJob.attempts - 1)
+        else:
+            values.update(status=status, error=error, finished_at=func.now(), heartbeat_at=func.now())
+        async with self.session_factory() as session:
+            await session.execute(update(IngestionJob).where(IngestionJob.id == job_id).values(**values))
+            await session.commit()
+
+    async def _process(self, job: IngestionJob):
+        cancel_event = threading.Event()
+        self._cancel_events[job.id] = cancel_event
+        progress: dict = {}
+        logger.info(f"🔄 Bắt đầu nạp file {job.filename} (tác vụ {job.id}, lần {job.attempts})")
+        start = time.perf_counter()
+        future = asyncio.ensure_future(run_in_threadpool(
+            ingest_file, job.temp_path, job.filename, on_progress=progress.update, cancel_event=cancel_event))
+        status, error = "done", None
+        try:
+            while True:
+                done, _ = await asyncio.wait({future}, timeout=INGEST_JOB_HEARTBEAT_SECONDS)
+                if done:
+                    break
+                try:
+                    if await self._save_progress(job.id, dict(progress)):
+                        cancel_event.set()
+                except Exception as e:
+                    logger.error(f"❌ Lỗi ghi tiến độ tác vụ nạp {job.id}: {e}")
+            stats = future.result()
+            progress.update(stats)
+            if not (stats["chunks"] or stats["skipped"]):
+                status, error = "failed", "Không trích xuất được nội dung (có thể là PDF scan hoặc rỗng)"
+                logger.warning(f"⚠️ Không trích xuất được nội dung từ file {job.filename}. Bỏ qua.")
+            else:
+                logger.info(f"🎉 Nạp file {job.filename} hoàn tất sau {time.perf_counter() - start:.1f}s: {stats}")
+        except IngestionCancelled:
+            status = "queued" if self._stopping else "cancelled"
+            logger.info(f"⏹️ Dừng nạp file {job.filename} ({status})")
+        except Exception as e:
+            status, error = "failed", str(e)
+            logger.error(f"❌ Lỗi khi nạp file {job.filename}: {e}")
+            traceback.print_exc()
+        finally:
+            self._cancel_events.pop(job.id, None)
+        await self._finish(job.id, status, progress, error)
+        if status != "queued":
+            self._remove_temp_file(job.temp_path)
+
+    async def _worker(self):
+        while not self._stopping:
+            try:
+                await self._requeue_stale()
+                job = await self._claim()
+            except Exception as e:
+                logger.error(f"❌ Lỗi hàng đợi nạp tài liệu: {e}")
+                job = None
+            if job is not None:
+                await self._process(job)
+                continue
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=INGEST_JOB_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        """Gọi trong lifespan: khởi động các vòng lặp worker."""
+        self._stopping = False
+        self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(max(self.workers, 1))]
+
+    async def stop(self):
+        """Dừng worker; tác vụ đang chạy dừng sau lô hiện tại và quay lại hàng đợi."""
+        self._stopping = True
+        self._wakeup.set()
+        for event in self._cancel_events.values():
+            event.set()
+        if self._worker_tasks:
+            await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+
+    @staticmethod
+    def _remove_temp_file(temp_path: str):
+        if temp_path and os.path.exists(temp_path):
+            os.remove(temp_path)
+            logger.info(f"🧹 Đã xóa file tạm: {temp_path}")
+
+
+ingestion_queue = IngestionQueue()
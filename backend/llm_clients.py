@@ -0,0 +1,101 @@
+import asyncio
+import logging
+import os
+import threading
+from contextlib import asynccontextmanager
+from typing import Dict, Optional, Tuple
+
+import cohere
+import httpx
+from dotenv import load_dotenv
+from langchain_cohere import ChatCohere
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+COHERE_MODEL = os.getenv("COHERE_MODEL", "command-r-plus-08-2024")
+COHERE_BASE_URL = os.getenv("COHERE_BASE_URL") or None
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "32"))
+LLM_KEEPALIVE_SECONDS = float(os.getenv("LLM_KEEPALIVE_SECONDS", "60"))
+
+
+class LLMClientRegistry:
+    """
+    Giữ ChatCohere dùng chung cho các node của graph thay vì tạo mới mỗi lượt.
+    Mọi model dùng chung một cặp httpx.Client / httpx.AsyncClient (keep-alive, giữ
+    phiên TLS), mỗi model có giới hạn số request đồng thời riêng.
+    """
+
+    def __init__(self, base_url: Optional[str] = COHERE_BASE_URL, timeout: float = LLM_TIMEOUT_SECONDS,
+                 max_concurrency: int = LLM_MAX_CONCURRENCY, max_connections: int = LLM_MAX_CONNECTIONS,
+                 keepalive_seconds: float = LLM_KEEPALIVE_SECONDS):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.max_connections = max_connections
+        self.keepalive_seconds = keepalive_seconds
+        self._models: Dict[Tuple[str, float], ChatCohere] = {}
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._http: Optional[httpx.Client] = None
+        self._async_http: Optional[httpx.AsyncClient] = None
+        self._lock = threading.Lock()
+
+    def _limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_connections,
+            keepalive_expiry=self.keepalive_seconds,
+        )
+
+    def _http_clients(self) -> Tuple[httpx.Client, httpx.AsyncClient]:
+        if self._http is None:
+            self._http = httpx.Client(limits=self._limits(), timeout=self.timeout)
+            self._async_http = httpx.AsyncClient(limits=self._limits(), timeout=self.timeout)
+        return self._http, self._async_http
+
+    def chat_model(self, model: str = COHERE_MODEL, temperature: float = 0) -> ChatCohere:
+        """ChatCohere dùng chung theo (model, temperature)."""
+        key = (model, temperature)
+        llm = self._models.get(key)
+        if llm is not None:
+            return llm
+        with self._lock:
+            llm = self._models.get(key)
+            if llm is None:
+                llm = ChatCohere(model=model, temperature=temperature, timeout_seconds=self.timeout,
+                                 base_url=self.base_url)
+                http, async_http = self._http_clients()
+                api_key = llm.cohere_api_key.get_secret_value() if llm.cohere_api_key else None
+                # Thay client mặc định (mỗi ChatCohere một connection pool) bằng pool dùng chung
+                llm.client = cohere.Client(api_key=api_key, base_url=self.base_url, timeout=self.timeout,
+                                           client_name=llm.user_agent, httpx_client=http)
+                llm.async_client = cohere.AsyncClient(api_key=api_key, base_url=self.base_url,
+                                                      timeout=self.timeout, client_name=llm.user_agent,
+                                                      httpx_client=async_http)
+                self._models[key] = llm
+                logger.info(f"Khởi tạo LLM client dùng chung: {model} (temperature={temperature})")
+        return llm
+
+    @asynccontextmanager
+    async def limit(self, model: str = COHERE_MODEL):
+        """Giới hạn số request đồng thời tới một model."""
+        semaphore = self._semaphores.get(model)
+        if semaphore is None:
+            semaphore = self._semaphores.setdefault(model, asyncio.Semaphore(self.max_concurrency))
+        async with semaphore:
+            yield
+
+    async def aclose(self):
+        if self._async_http is not None:
+            await self._async_http.aclose()
+        if self._http is not None:
+            self._http.close()
+        self._http = self._async_http = None
+        self._models.clear()
+        logger.info("Đã đóng các kết nối LLM.")
+
+
+llm_clients = LLMClientRegistry()
@@ -5,15 +5,19 @@ from langchain_core.documents import Document
 from typing import List
 
 from dotenv import load_dotenv
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_chroma import Chroma
 from langchain_huggingface import HuggingFaceEmbeddings
+from agents.label_index import class_id_for_record, build_label_index, merge_label_index
+from agents.crops import crop_metadata, extract_crops
+from agents.embedding_cache import with_embedding_cache
+from agents.document_parser import make_text_splitter
+from agents.ingestion import document_hash, sync_document
+from agents.manifest import DocumentManifest
+from agents.vector_store import CHROMA_DB_PATH, JSON_FILE_PATH
 
 load_dotenv()
 
-# --- Cấu hình ---
-JSON_FILE_PATH = r"/data/plant.json"
-CHROMA_DB_PATH = os.getenv("CHROMA_DB_PATH", "./chroma_db_storage")
+# --- Cấu hình: cùng đường dẫn với server (agents/vector_store.py), không phụ thuộc thư mục chạy ---
 EMBED_MODEL = os.getenv("EMBED_MODEL", "AITeamVN/Vietnamese_Embedding")
 
 
@@ -46,6 +50,10 @@ def load_documents_from_json(json_path: str) -> List[Document]:
             "ten_benh": item.get('ten_benh', ''),
             "cay_chu": item.get('cay_chu', '')
         }
+        metadata.update(crop_metadata(extract_crops(item.get('cay_chu', ''), require_context=False)))
+        class_id = class_id_for_record(item.get("id"))
+        if class_id is not None:
+            metadata["class_id"] = class_id
         doc = Document(page_content=text, metadata=metadata)
         docs_json.append(doc)
     print(f"Đã tải và xử lý thành công {len(docs_json)} tài liệu từ JSON.")
@@ -62,37 +70,39 @@ def build_vector_store():
 
     # 2. CHIA NHỎ
     print(f"\nĐang chia {len(all_documents)} tài liệu...")
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,  # Chia mỗi đoạn 1000 ký tự
-        chunk_overlap=200,  # Gối lên nhau 200 ký tự để giữ ngữ cảnh
-        length_function=len
-    )
-    all_splits = text_splitter.split_documents(all_documents)
+    # Cùng cách chia với tài liệu upload và bulk_ingest.py để các công cụ không ghi đè chunk của nhau
+    all_splits = make_text_splitter().split_documents(all_documents)
     print(f"Đã chia thành {len(all_splits)} đoạn (chunks).")
 
     # 3. NHÚNG
     print(f"Đang khởi tạo mô hình embedding (model: {EMBED_MODEL})...")
-    embeddings = HuggingFaceEmbeddings(
+    embeddings = with_embedding_cache(HuggingFaceEmbeddings(
         model_name=EMBED_MODEL,
         model_kwargs={'device': 'cpu'},  # Dùng CPU
         encode_kwargs={'normalize_embeddings': True}
-    )
+    ), EMBED_MODEL)  # Dùng chung cache embedding với server: chunk đã embedding thì không tính lại
     print("Khởi tạo embedding model thành công.")
 
-    # 4. LƯU TRỮ
-    print(f"Đang tạo và lưu trữ Vector Store tại: {CHROMA_DB_PATH}")
-    print("(Việc này có thể mất vài phút tùy thuộc vào số lượng tài liệu...)")
-    vector_store = Chroma.from_documents(
-        documents=all_splits,
-        embedding=embeddings,
+    # 4. LƯU TRỮ: chỉ embedding các chunk mới/đã đổi, xóa chunk không còn trong file (theo manifest)
+    print(f"Đang đồng bộ Vector Store tại: {CHROMA_DB_PATH}")
+    print("(Lần đầu có thể mất vài phút tùy thuộc vào số lượng tài liệu...)")
+    vector_store = Chroma(
         persist_directory=CHROMA_DB_PATH,
+        embedding_function=embeddings,
         collection_metadata={"hnsw:space": "cosine"}  # Chỉ định dùng Cosine
     )
+    stats = sync_document(JSON_FILE_PATH, all_splits, document_hash(JSON_FILE_PATH), vector_store,
+                          DocumentManifest(CHROMA_DB_PATH))
 
     print("\n--- HOÀN THÀNH ---")
-    print(f"Vector Store đã được tạo và lưu vĩnh viễn tại: {CHROMA_DB_PATH}")
+    print(f"Embedding mới: {stats['embedded']} | Giữ nguyên: {stats['unchanged']} | Đã xóa: {stats['deleted']}")
+    print(f"Vector Store được lưu vĩnh viễn tại: {CHROMA_DB_PATH}")
     print(f"Tổng số vector đã được lưu: {vector_store._collection.count()}")
 
+    # 5. CHỈ MỤC NHÃN: class id của model ảnh -> các chunk của bệnh tương ứng
+    label_index = merge_label_index(build_label_index(all_splits), [JSON_FILE_PATH], CHROMA_DB_PATH)
+    print(f"Chỉ mục nhãn: {len(label_index)} lớp có tri thức trực tiếp.")
+
 
 # --- Chạy hàm build ---
 if __name__ == "__main__":
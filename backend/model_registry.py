@@ -0,0 +1,133 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+LOADING = "loading"
+READY = "ready"
+FAILED = "failed"
+
+# Model load lỗi: `get` chỉ thử load lại sau khoảng chờ này (tăng gấp đôi mỗi lần lỗi, tối đa MAX)
+MODEL_RETRY_BACKOFF_SECONDS = float(os.getenv("MODEL_RETRY_BACKOFF_SECONDS", "30"))
+MODEL_RETRY_BACKOFF_MAX_SECONDS = float(os.getenv("MODEL_RETRY_BACKOFF_MAX_SECONDS", "600"))
+
+
+class ModelLoadError(RuntimeError):
+    """Model không load được (lỗi được giữ lại để báo qua /ready)."""
+
+
+class _Entry:
+    def __init__(self, name: str, loader: Callable[[], Any], warmup: Optional[Callable[[Any], None]]):
+        self.name = name
+        self.loader = loader
+        self.warmup = warmup
+        self.value = None
+        self.state = PENDING
+        self.error: Optional[str] = None
+        self.load_seconds: Optional[float] = None
+        self.failures = 0
+        self.retry_at: Optional[float] = None
+        self.lock = threading.Lock()
+
+
+class ModelRegistry:
+    """
+    Đăng ký các model/tài nguyên nặng để load lười (lần đầu `get`) hoặc load song song
+    trong lifespan bằng `load_all`. Mỗi model có trạng thái riêng cho endpoint /ready.
+    Model load lỗi giữ trạng thái FAILED: `get` báo lỗi ngay thay vì load lại đồng bộ trong mỗi
+    request, chỉ thử lại sau khoảng backoff, khi gọi `reload` hoặc `load_all`.
+    """
+
+    def __init__(self, retry_backoff: float = MODEL_RETRY_BACKOFF_SECONDS,
+                 retry_backoff_max: float = MODEL_RETRY_BACKOFF_MAX_SECONDS):
+        self._entries: Dict[str, _Entry] = {}
+        self.retry_backoff = retry_backoff
+        self.retry_backoff_max = retry_backoff_max
+
+    def register(self, name: str, loader: Callable[[], Any], warmup: Optional[Callable[[Any], None]] = None):
+        if name not in self._entries:
+            self._entries[name] = _Entry(name, loader, warmup)
+
+    def get(self, name: str) -> Any:
+        """Trả về model đã load, load ngay nếu chưa có. Ném ModelLoadError nếu load lỗi."""
+        entry = self._entries[name]
+        if entry.state == READY:
+            return entry.value
+        if self._backing_off(entry):
+            raise ModelLoadError(f"Model '{name}' không khả dụng: {entry.error}")
+        with entry.lock:
+            if entry.state != READY and not self._backing_off(entry):
+                self._load(entry)
+        if entry.state != READY:
+            raise ModelLoadError(f"Model '{name}' không khả dụng: {entry.error}")
+        return entry.value
+
+    def reload(self, name: str) -> Any:
+        """Load lại ngay, bỏ qua backoff (model lỗi đã được sửa, vd. file model vừa được chép vào)."""
+        entry = self._entries[name]
+        with entry.lock:
+            entry.retry_at = None
+        return self.get(name)
+
+    @staticmethod
+    def _backing_off(entry: _Entry) -> bool:
+        return entry.state == FAILED and entry.retry_at is not None and time.monotonic() < entry.retry_at
+
+    def _load(self, entry: _Entry):
+        entry.state = LOADING
+        entry.error = None
+        start = time.perf_counter()
+        logger.info(f"⏳ Đang load '{entry.name}'...")
+        try:
+            value = entry.loader()
+            if entry.warmup is not None:
+                entry.warmup(value)
+        except Exception as e:
+            entry.state = FAILED
+            entry.error = f"{type(e).__name__}: {e}"
+            entry.failures += 1
+            delay = min(self.retry_backoff * 2 ** (entry.failures - 1), self.retry_backoff_max)
+            entry.retry_at = time.monotonic() + delay
+            logger.error(f"❌ Load '{entry.name}' thất bại (lần {entry.failures}, thử lại sau {delay:.0f}s): "
+                         f"{entry.error}")
+            return
+        entry.value = value
+        entry.load_seconds = time.perf_counter() - start
+        entry.failures = 0
+        entry.retry_at = None
+        entry.state = READY
+        logger.info(f"✅ '{entry.name}' sẵn sàng sau {entry.load_seconds:.1f}s")
+
+    async def load_all(self):
+        """Load song song mọi model đã đăng ký trên các thread riêng (thử lại cả model đang backoff)."""
+        async def load_one(name: str):
+            try:
+                await asyncio.to_thread(self.reload, name)
+            except ModelLoadError:
+                pass
+
+        await asyncio.gather(*(load_one(name) for name in list(self._entries)))
+
+    def status(self) -> Dict[str, dict]:
+        return {
+            name: {
+                "state": entry.state,
+                "load_seconds": round(entry.load_seconds, 2) if entry.load_seconds is not None else None,
+                "error": entry.error,
+                "failures": entry.failures,
+                "retry_in": (round(max(entry.retry_at - time.monotonic(), 0), 1)
+                             if entry.state == FAILED and entry.retry_at is not None else None),
+            }
+            for name, entry in self._entries.items()
+        }
+
+    def is_ready(self) -> bool:
+        return all(entry.state == READY for entry in self._entries.values())
+
+
+registry = ModelRegistry()
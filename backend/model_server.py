@@ -0,0 +1,278 @@
+"""
+Tiến trình phục vụ model dùng chung cho nhiều uvicorn worker.
+
+Embedding model, CrossEncoder reranker và ResNet phân loại bệnh chỉ được load một
+lần trong tiến trình này. Các worker FastAPI kết nối qua Unix socket
+(multiprocessing.connection, có authkey) khi biến môi trường MODEL_SERVER_SOCKET
+được đặt; nếu không, mỗi worker tự load model như trước.
+
+Authkey bắt buộc, không có giá trị mặc định: đặt MODEL_SERVER_AUTHKEY hoặc
+MODEL_SERVER_AUTHKEY_FILE (file chứa key, vd. sinh bằng `openssl rand -hex 32`) giống nhau
+cho server và các worker. Thiếu key thì cả server lẫn client đều không khởi động.
+
+Khởi chạy:
+    python model_server.py --socket /run/agri/models.sock
+"""
+import argparse
+import logging
+import os
+import queue
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+from typing import List, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+MODEL_SERVER_SOCKET = os.getenv("MODEL_SERVER_SOCKET")
+MODEL_SERVER_AUTHKEY_FILE = os.getenv("MODEL_SERVER_AUTHKEY_FILE")
+MODEL_SERVER_POOL_SIZE = int(os.getenv("MODEL_SERVER_POOL_SIZE", "8"))
+MODEL_SERVER_WAIT_SECONDS = float(os.getenv("MODEL_SERVER_WAIT_SECONDS", "300"))
+EMBED_MODEL = os.getenv("EMBED_MODEL", "AITeamVN/Vietnamese_Embedding")
+RERANKER_MODEL = os.getenv("RERANKER_MODEL", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")
+# eager | int8 | onnx | onnx-int8 (xem agents/model_backends.load_cross_encoder)
+RERANKER_BACKEND = os.getenv("RERANKER_BACKEND", "eager")
+RERANKER_ONNX_DIR = os.getenv("RERANKER_ONNX_DIR", os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "model", "reranker_onnx"))
+
+
+class ModelServerError(RuntimeError):
+    """Lỗi do model server trả về hoặc không kết nối được model server."""
+
+
+def load_authkey() -> bytes:
+    """Authkey từ MODEL_SERVER_AUTHKEY hoặc file MODEL_SERVER_AUTHKEY_FILE; thiếu thì báo lỗi."""
+    key = os.getenv("MODEL_SERVER_AUTHKEY", "").strip()
+    if not key and MODEL_SERVER_AUTHKEY_FILE:
+        try:
+            with open(MODEL_SERVER_AUTHKEY_FILE, "r", encoding="utf-8") as f:
+                key = f.read().strip()
+        except OSError as e:
+            raise ModelServerError(f"Không đọc được MODEL_SERVER_AUTHKEY_FILE={MODEL_SERVER_AUTHKEY_FILE}: {e}") from e
+    if not key:
+        raise ModelServerError("Chưa cấu hình authkey cho model server: đặt MODEL_SERVER_AUTHKEY "
+                               "hoặc MODEL_SERVER_AUTHKEY_FILE")
+    return key.encode("utf-8")
+
+
+# --- CLIENT (chạy trong các worker FastAPI) ---
+
+class ModelServerClient:
+    """Client giữ một pool kết nối tới model server, an toàn khi gọi từ nhiều thread."""
+
+    def __init__(self, address: str, authkey: Optional[bytes] = None, pool_size: int = MODEL_SERVER_POOL_SIZE):
+        self.address = address
+        self.authkey = authkey or load_authkey()
+        self._pool: "queue.LifoQueue" = queue.LifoQueue(maxsize=pool_size)
+
+    def _connect(self):
+        return Client(self.address, family="AF_UNIX", authkey=self.authkey)
+
+    def _acquire(self):
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            return self._connect()
+
+    def _release(self, conn):
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def call(self, op: str, *args):
+        last_error = None
+        # Thử lại một lần với kết nối mới nếu kết nối cũ đã bị đóng (server restart)
+        for _ in range(2):
+            try:
+                conn = self._acquire()
+            except OSError as e:
+                raise ModelServerError(f"Không kết nối được model server tại {self.address}: {e}") from e
+            try:
+                conn.send((op, args))
+                status, result = conn.recv()
+            except (EOFError, OSError) as e:
+                conn.close()
+                last_error = e
+                continue
+            self._release(conn)
+            if status != "ok":
+                raise ModelServerError(result)
+            return result
+        raise ModelServerError(f"Mất kết nối tới model server: {last_error}")
+
+    def ping(self) -> dict:
+        return self.call("ping")
+
+    def wait_ready(self, timeout: float = MODEL_SERVER_WAIT_SECONDS, interval: float = 2.0) -> dict:
+        """Chờ model server khởi động xong (server chỉ mở socket sau khi load hết model)."""
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                return self.ping()
+            except ModelServerError:
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(interval)
+
+    def embeddings(self) -> "RemoteEmbeddings":
+        return RemoteEmbeddings(self)
+
+    def reranker(self) -> "RemoteCrossEncoder":
+        return RemoteCrossEncoder(self)
+
+    def classify_base64(self, image_data: str) -> dict:
+        return self.call("classify_base64", image_data)
+
+    def stats(self) -> dict:
+        return self.call("stats")
+
+
+class RemoteEmbeddings(Embeddings):
+    """Embeddings của LangChain, tính toán trên model server."""
+
+    def __init__(self, client: ModelServerClient):
+        self.client = client
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.client.call("embed_documents", list(texts))
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.client.call("embed_query", text)
+
+
+class RemoteCrossEncoder:
+    """Cùng giao diện `predict(pairs)` với sentence_transformers.CrossEncoder."""
+
+    def __init__(self, client: ModelServerClient):
+        self.client = client
+
+    def predict(self, pairs, **kwargs) -> np.ndarray:
+        return np.asarray(self.client.call("rerank", [list(pair) for pair in pairs]), dtype=np.float32)
+
+
+_client: Optional[ModelServerClient] = None
+
+
+def get_model_client() -> Optional[ModelServerClient]:
+    """Trả về client dùng chung nếu MODEL_SERVER_SOCKET được cấu hình, ngược lại None."""
+    global _client
+    if not MODEL_SERVER_SOCKET:
+        return None
+    if _client is None:
+        _client = ModelServerClient(MODEL_SERVER_SOCKET)
+        logger.info(f"Sử dụng model server tại: {MODEL_SERVER_SOCKET}")
+    return _client
+
+
+# --- SERVER ---
+
+class ModelServer:
+    def __init__(self, address: str, authkey: Optional[bytes] = None):
+        self.address = address
+        self.authkey = authkey or load_authkey()
+        self.embeddings = None
+        self.reranker = None
+        self.predict_image = None
+        self.started_at = None
+
+    def load(self):
+        """Load song song embedding, reranker và classifier (kèm warm-up) trước khi mở socket."""
+        import asyncio
+        from langchain_huggingface import HuggingFaceEmbeddings
+        from agents import predict_image
+        from agents.model_backends import load_cross_encoder
+        from model_registry import registry
+
+        registry.register("embeddings", lambda: HuggingFaceEmbeddings(
+            model_name=EMBED_MODEL,
+            model_kwargs={'device': 'cpu'},
+            encode_kwargs={'normalize_embeddings': True}
+        ), warmup=lambda model: model.embed_query("khởi động"))
+        registry.register("reranker", lambda: load_cross_encoder(RERANKER_BACKEND, RERANKER_MODEL,
+                                                                 onnx_dir=RERANKER_ONNX_DIR),
+                          warmup=lambda model: model.predict([["khởi động", "khởi động"]]))
+        asyncio.run(registry.load_all())
+        if not registry.is_ready():
+            raise RuntimeError(f"Không load được model: {registry.status()}")
+
+        self.embeddings = registry.get("embeddings")
+        self.reranker = registry.get("reranker")
+        self.predict_image = predict_image
+        logger.info("✅ Model server đã load xong các model.")
+
+    def handle(self, op: str, args: tuple):
+        if op == "ping":
+            return {"status": "ok", "pid": os.getpid(), "uptime": time.time() - self.started_at}
+        if op == "embed_documents":
+            return self.embeddings.embed_documents(args[0])
+        if op == "embed_query":
+            return self.embeddings.embed_query(args[0])
+        if op == "rerank":
+            return [float(score) for score in self.reranker.predict(args[0])]
+        if op == "classify_base64":
+            return self.predict_image.predict_bytes(self.predict_image.decode_base64_image(args[0]))
+        if op == "stats":
+            return {"image_cache": self.predict_image.image_cache.stats()}
+        raise ValueError(f"Thao tác không hỗ trợ: {op}")
+
+    def _serve_connection(self, conn):
+        with conn:
+            while True:
+                try:
+                    op, args = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    response = ("ok", self.handle(op, args))
+                except Exception as e:
+                    logger.error(f"❌ Lỗi khi xử lý '{op}': {e}")
+                    response = ("error", f"{type(e).__name__}: {e}")
+                try:
+                    conn.send(response)
+                except (EOFError, OSError):
+                    return
+
+    def serve_forever(self):
+        if os.path.exists(self.address):
+            os.remove(self.address)
+        os.makedirs(os.path.dirname(self.address) or ".", exist_ok=True)
+        self.started_at = time.time()
+        with Listener(self.address, family="AF_UNIX", authkey=self.authkey) as listener:
+            logger.info(f"🚀 Model server đang lắng nghe tại: {self.address}")
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:
+                    logger.warning(f"⚠️ Từ chối kết nối: {e}")
+                    continue
+                # Mỗi kết nối một thread; các request ảnh đồng thời được gom batch trong predict_image
+                threading.Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    parser = argparse.ArgumentParser(description="Model server cho Agriculture Chatbot")
+    parser.add_argument("--socket", default=MODEL_SERVER_SOCKET or "/tmp/agri-models.sock",
+                        help="Đường dẫn Unix socket để lắng nghe")
+    args = parser.parse_args()
+
+    try:
+        server = ModelServer(args.socket)
+    except ModelServerError as e:
+        parser.exit(1, f"{e}\n")
+    server.load()
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
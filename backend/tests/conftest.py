@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Chạy được từ thư mục backend hoặc thư mục gốc repo: các module được import như khi chạy app
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
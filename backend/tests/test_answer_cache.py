@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from agents import answer_cache as answer_cache_module
+from agents.answer_cache import KnowledgeVersion, SemanticAnswerCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+        self.ns = 0
+
+    def monotonic(self):
+        return self.now
+
+    def time_ns(self):
+        self.ns += 1
+        return self.ns
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(answer_cache_module, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def embeddings():
+    return DeterministicFakeEmbedding(size=32)
+
+
+def make_cache(tmp_path, embeddings, **kwargs):
+    return SemanticAnswerCache(embeddings_getter=lambda: embeddings,
+                               version=KnowledgeVersion(str(tmp_path / "knowledge_version")), **kwargs)
+
+
+def test_hit_requires_same_query_type(tmp_path, embeddings, clock):
+    cache = make_cache(tmp_path, embeddings, max_entries=4)
+    assert cache.get("normal_qa", "Bệnh đạo ôn là gì") is None
+    cache.put("normal_qa", "Bệnh đạo ôn là gì", "Đạo ôn là bệnh do nấm", ["plant.json"])
+    hit = cache.get("normal_qa", "Bệnh đạo ôn là gì")
+    assert hit["answer"] == "Đạo ôn là bệnh do nấm" and hit["sources"] == ["plant.json"]
+    assert cache.get("text_disease", "Bệnh đạo ôn là gì") is None
+
+
+def test_entries_expire_after_ttl(tmp_path, embeddings, clock):
+    cache = make_cache(tmp_path, embeddings, max_entries=4, ttl_seconds=60)
+    cache.get("normal_qa", "q")
+    cache.put("normal_qa", "q", "a")
+    clock.now += 59
+    assert cache.get("normal_qa", "q") is not None
+    clock.now += 2
+    assert cache.get("normal_qa", "q") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_lru_eviction(tmp_path, embeddings, clock):
+    cache = make_cache(tmp_path, embeddings, max_entries=2)
+    for query in ("q1", "q2"):
+        cache.put("normal_qa", query, f"a-{query}")
+    cache.get("normal_qa", "q1")
+    cache.put("normal_qa", "q3", "a-q3")
+    assert cache.get("normal_qa", "q2") is None
+    assert cache.get("normal_qa", "q1")["answer"] == "a-q1"
+    assert cache.get("normal_qa", "q3")["answer"] == "a-q3"
+
+
+def test_put_is_dropped_when_knowledge_changed_after_lookup(tmp_path, embeddings, clock):
+    cache = make_cache(tmp_path, embeddings, max_entries=4)
+    cache.get("normal_qa", "q")
+    cache.clear()
+    cache.put("normal_qa", "q", "câu trả lời dựa trên kho cũ")
+    assert cache.get("normal_qa", "q") is None
+
+
+def test_clear_in_one_worker_invalidates_others(tmp_path, embeddings, clock):
+    worker_a = make_cache(tmp_path, embeddings, max_entries=4)
+    worker_b = make_cache(tmp_path, embeddings, max_entries=4)
+    worker_a.put("normal_qa", "q", "a")
+    assert worker_a.get("normal_qa", "q") is not None
+    worker_b.clear()
+    assert worker_a.get("normal_qa", "q") is None
+    assert np.all(worker_a._types == -1)
@@ -0,0 +1,110 @@
+import threading
+import time
+
+import pytest
+
+from agents.batch_inference import MicroBatcher
+
+
+class RecordingInfer:
+    """infer_fn giả: ghi lại từng batch, trả về input * 10."""
+
+    def __init__(self, delay: float = 0.0):
+        self.batches = []
+        self.delay = delay
+        self._lock = threading.Lock()
+
+    def __call__(self, inputs):
+        with self._lock:
+            self.batches.append(list(inputs))
+        time.sleep(self.delay)
+        return [item * 10 for item in inputs]
+
+
+@pytest.fixture
+def make_batcher():
+    batchers = []
+
+    def factory(infer_fn, **kwargs):
+        batcher = MicroBatcher(infer_fn, **kwargs)
+        batchers.append(batcher)
+        return batcher
+
+    yield factory
+    for batcher in batchers:
+        batcher.close()
+
+
+def test_requests_are_coalesced_up_to_max_batch_size(make_batcher):
+    infer = RecordingInfer()
+    batcher = make_batcher(infer, max_batch_size=4, max_wait_ms=500)
+    futures = [batcher.submit(i) for i in range(10)]
+    assert [future.result(timeout=5) for future in futures] == [i * 10 for i in range(10)]
+    assert [len(batch) for batch in infer.batches] == [4, 4, 2]
+    assert batcher.batches_run == 3 and batcher.average_batch_size == pytest.approx(10 / 3)
+
+
+def test_partial_batch_is_flushed_after_max_wait(make_batcher):
+    infer = RecordingInfer()
+    batcher = make_batcher(infer, max_batch_size=8, max_wait_ms=50)
+    start = time.monotonic()
+    assert batcher(1, timeout=5) == 10
+    elapsed = time.monotonic() - start
+    assert 0.04 <= elapsed < 1.0
+    # Input đến sau khi batch trước đã chạy vào batch mới
+    assert batcher(2, timeout=5) == 20
+    assert infer.batches == [[1], [2]]
+
+
+def test_each_caller_gets_its_own_result(make_batcher):
+    infer = RecordingInfer(delay=0.01)
+    batcher = make_batcher(infer, max_batch_size=5, max_wait_ms=20)
+    results = {}
+
+    def call(value):
+        results[value] = batcher(value, timeout=5)
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(40)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == {i: i * 10 for i in range(40)}
+    assert all(len(batch) <= 5 for batch in infer.batches)
+    assert sorted(item for batch in infer.batches for item in batch) == list(range(40))
+
+
+def test_exception_is_propagated_to_every_waiting_future(make_batcher):
+    def failing(inputs):
+        raise ValueError("model lỗi")
+
+    batcher = make_batcher(failing, max_batch_size=3, max_wait_ms=500)
+    futures = [batcher.submit(i) for i in range(3)]
+    for future in futures:
+        with pytest.raises(ValueError, match="model lỗi"):
+            future.result(timeout=5)
+
+
+def test_wrong_number_of_results_fails_the_batch(make_batcher):
+    calls = []
+
+    def short(inputs):
+        calls.append(len(inputs))
+        return [0] * (len(inputs) - 1) if len(calls) == 1 else [item for item in inputs]
+
+    batcher = make_batcher(short, max_batch_size=2, max_wait_ms=500)
+    futures = [batcher.submit(i) for i in range(2)]
+    for future in futures:
+        with pytest.raises(RuntimeError, match="1 kết quả cho 2 input"):
+            future.result(timeout=5)
+    # Worker vẫn chạy tiếp sau batch lỗi
+    assert batcher(7, timeout=5) == 7
+
+
+def test_batch_size_one_runs_inline():
+    infer = RecordingInfer()
+    batcher = MicroBatcher(infer, max_batch_size=1)
+    assert batcher(3) == 30
+    assert batcher._thread is None
+    with pytest.raises(ValueError):
+        MicroBatcher(infer, max_batch_size=0)
@@ -0,0 +1,67 @@
+import time
+
+import numpy as np
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from agents.embedding_cache import CachedEmbeddings, EmbeddingStore
+
+
+def vector(value: float, dim: int = 4):
+    return np.full(dim, value, dtype=np.float32)
+
+
+def slots(store: EmbeddingStore) -> dict:
+    return dict(store._connect().execute("SELECT key, slot FROM entries").fetchall())
+
+
+def test_fresh_slots_are_allocated_in_order(tmp_path):
+    store = EmbeddingStore(str(tmp_path), capacity=4)
+    store.put_many({"a": vector(1), "b": vector(2)})
+    store.put_many({"c": vector(3), "a": vector(9)})
+    assert slots(store) == {"a": 0, "b": 1, "c": 2}
+    # Key đã có không bị ghi đè
+    np.testing.assert_array_equal(store.get_many(["a"])["a"], vector(1))
+
+
+def test_full_store_evicts_least_recently_used(tmp_path):
+    store = EmbeddingStore(str(tmp_path), capacity=3)
+    for key, value in (("a", 1), ("b", 2), ("c", 3)):
+        store.put_many({key: vector(value)})
+        time.sleep(0.01)
+    store.get_many(["a"])
+    time.sleep(0.01)
+    store.put_many({"d": vector(4)})
+    assert set(slots(store)) == {"a", "c", "d"}
+    assert slots(store)["d"] == 1  # dùng lại slot của "b"
+    found = store.get_many(["a", "b", "d"])
+    assert set(found) == {"a", "d"}
+    np.testing.assert_array_equal(found["d"], vector(4))
+    assert len(store) == 3
+
+
+def test_store_is_shared_between_instances(tmp_path):
+    EmbeddingStore(str(tmp_path), capacity=4).put_many({"a": vector(1)})
+    other = EmbeddingStore(str(tmp_path), capacity=4)
+    np.testing.assert_array_equal(other.get_many(["a"])["a"], vector(1))
+
+
+def test_capacity_change_resets_entries(tmp_path):
+    EmbeddingStore(str(tmp_path), capacity=4).put_many({"a": vector(1)})
+    assert EmbeddingStore(str(tmp_path), capacity=8).get_many(["a"]) == {}
+
+
+def test_cached_embeddings_only_compute_misses(tmp_path):
+    inner = DeterministicFakeEmbedding(size=8)
+    calls = []
+    original = inner.embed_documents
+    object.__setattr__(inner, "embed_documents", lambda texts: calls.append(list(texts)) or original(texts))
+    cached = CachedEmbeddings(inner, "fake/model", cache_dir=str(tmp_path), capacity=16)
+
+    first = cached.embed_documents(["một", "hai"])
+    second = cached.embed_documents(["hai", "ba", "một"])
+    assert calls == [["một", "hai"], ["ba"]]
+    assert second[0] == first[1] and second[2] == first[0]
+    assert cached.stats()["hits"] == 2 and cached.stats()["misses"] == 3
+    # Query và document dùng key khác nhau
+    cached.embed_query("một")
+    assert cached.misses == 4
@@ -0,0 +1,70 @@
+from langchain_core.documents import Document
+
+from agents.lexical_index import BM25Index, reciprocal_rank_fusion, tokenize
+from agents.vector_store import hybrid_search
+
+
+class FakeCollection:
+    def __init__(self, docs):
+        self.docs = {doc.id: doc for doc in docs}
+
+    def count(self):
+        return len(self.docs)
+
+    def get(self, ids=None, include=None):
+        ids = list(self.docs) if ids is None else [doc_id for doc_id in ids if doc_id in self.docs]
+        return {"ids": ids, "documents": [self.docs[doc_id].page_content for doc_id in ids],
+                "metadatas": [self.docs[doc_id].metadata for doc_id in ids]}
+
+
+class FakeVectorStore:
+    """Trả về kết quả vector cố định theo thứ tự cho trước."""
+
+    def __init__(self, docs, ranking):
+        self._collection = FakeCollection(docs)
+        self.ranking = ranking
+
+    def similarity_search(self, query, k=4, filter=None):
+        return [self._collection.docs[doc_id] for doc_id in self.ranking][:k]
+
+
+DOCS = [
+    Document(id="a", page_content="Bệnh đạo ôn trên lúa do nấm Pyricularia oryzae", metadata={"crops": "lua"}),
+    Document(id="b", page_content="Bệnh bạc lá lúa do vi khuẩn Xanthomonas oryzae", metadata={"crops": "lua"}),
+    Document(id="c", page_content="Bệnh mốc sương cà chua do Phytophthora infestans", metadata={"crops": "ca_chua"}),
+    Document(id="d", page_content="Cách bón phân cho cây ngô giai đoạn trổ cờ", metadata={"crops": "ngo"}),
+]
+
+
+def test_tokenize_adds_syllable_bigrams():
+    assert tokenize("Đạo ôn") == ["đạo", "ôn", "đạo_ôn"]
+
+
+def test_rrf_rewards_documents_ranked_by_both_sources():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "a"]], k=60)
+    assert [doc_id for doc_id, _ in fused] == ["a", "c", "b"]
+    assert fused[0][1] == 1 / 61 + 1 / 62
+
+
+def test_bm25_ranks_exact_scientific_name_first():
+    index = BM25Index()
+    index.add([doc.id for doc in DOCS], DOCS)
+    assert index.search("Xanthomonas oryzae", k=2)[0][0].id == "b"
+
+
+def test_bm25_crop_partition_and_remove():
+    index = BM25Index()
+    index.add([doc.id for doc in DOCS], DOCS)
+    assert [doc.id for doc, _ in index.search("bệnh", k=4, crops=["ca_chua"])] == ["c"]
+    index.remove(["c"])
+    assert index.search("bệnh", k=4, crops=["ca_chua"]) == []
+
+
+def test_hybrid_search_fuses_vector_and_bm25():
+    index = BM25Index()
+    index.add([doc.id for doc in DOCS], DOCS)
+    # Vector bỏ sót "b" (tên khoa học), BM25 xếp b > a: "a" có ở cả hai nguồn, "b" vượt "d"
+    vector_store = FakeVectorStore(DOCS, ranking=["a", "d", "c"])
+    results = hybrid_search("bạc lá Xanthomonas oryzae", k=3, vector_k=3, lexical_k=3,
+                            vector_store=vector_store, lexical_index=index)
+    assert [doc.id for doc in results] == ["a", "b", "d"]
@@ -0,0 +1,60 @@
+import io
+
+import numpy as np
+from PIL import Image
+
+from agents.image_cache import PerceptualHashCache, dhash, hamming_distance
+
+
+def make_image(seed: int, size=(224, 224)) -> Image.Image:
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 255, size=(8, 8, 3), dtype=np.uint8)
+    return Image.fromarray(small).resize(size, Image.BILINEAR)
+
+
+def recompress(image: Image.Image, quality: int = 70) -> Image.Image:
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality)
+    return Image.open(io.BytesIO(buffer.getvalue()))
+
+
+def test_dhash_is_stable_under_recompression_and_resize():
+    image = make_image(1)
+    assert dhash(image) == dhash(image.copy())
+    assert hamming_distance(dhash(image), dhash(recompress(image.resize((180, 180))))) <= 4
+    assert hamming_distance(dhash(image), dhash(make_image(2))) > 4
+
+
+def test_near_duplicate_hits_cache():
+    cache = PerceptualHashCache(max_entries=4, max_distance=4)
+    image = make_image(1)
+    cache.put(dhash(image), {"class_id": 13, "confidence": 0.9})
+    hit = cache.get(dhash(recompress(image)))
+    assert hit == {"class_id": 13, "confidence": 0.9}
+    assert cache.get(dhash(make_image(2))) is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_exact_match_only_when_distance_zero():
+    cache = PerceptualHashCache(max_entries=4, max_distance=0)
+    cache.put(0b1010, {"class_id": 1})
+    assert cache.get(0b1010) is not None
+    assert cache.get(0b1011) is None
+
+
+def test_lru_eviction():
+    cache = PerceptualHashCache(max_entries=2, max_distance=0)
+    cache.put(1, {"class_id": 1})
+    cache.put(2, {"class_id": 2})
+    cache.get(1)
+    cache.put(4, {"class_id": 4})
+    assert cache.get(2) is None
+    assert cache.get(1) == {"class_id": 1}
+    assert cache.get(4) == {"class_id": 4}
+
+
+def test_returned_result_is_a_copy():
+    cache = PerceptualHashCache(max_entries=2)
+    cache.put(1, {"class_id": 1})
+    cache.get(1)["class_id"] = 99
+    assert cache.get(1) == {"class_id": 1}
@@ -0,0 +1,128 @@
+import uuid
+
+import chromadb
+import pytest
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from agents import document_parser, ingestion
+from agents.answer_cache import KnowledgeVersion, SemanticAnswerCache
+from agents.lexical_index import BM25Index
+from agents.manifest import DocumentManifest, chunk_id
+
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    embedded: int = 0
+
+    def embed_documents(self, texts):
+        self.embedded += len(texts)
+        return super().embed_documents(texts)
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    embeddings = CountingEmbeddings(size=16)
+    vector_store = Chroma(collection_name=f"test-{uuid.uuid4().hex}", embedding_function=embeddings,
+                          client=chromadb.EphemeralClient())
+    version = KnowledgeVersion(str(tmp_path / "knowledge_version"))
+    monkeypatch.setattr(ingestion, "answer_cache", SemanticAnswerCache(4, embeddings_getter=lambda: embeddings,
+                                                                       version=version))
+    monkeypatch.setattr(ingestion, "_legacy_uploads", None)
+    return vector_store, embeddings, DocumentManifest(str(tmp_path)), version
+
+
+def chunks(*texts):
+    return [Document(page_content=text, metadata={"source": "lua.pdf"}) for text in texts]
+
+
+def test_only_new_chunks_are_embedded_and_stale_ones_deleted(store):
+    vector_store, embeddings, manifest, version = store
+    lexical_index = BM25Index()
+    stats = ingestion.sync_document("lua.pdf", chunks("một", "hai", "ba"), "h1", vector_store, manifest,
+                                    lexical_index=lexical_index, batch_size=2)
+    assert (stats["embedded"], stats["batches"], stats["deleted"]) == (3, 2, 0)
+    first_version = version.token()
+    assert first_version is not None
+
+    stats = ingestion.sync_document("lua.pdf", chunks("một", "ba", "bốn", "một"), "h2", vector_store, manifest,
+                                    lexical_index=lexical_index)
+    assert (stats["chunks"], stats["unchanged"], stats["embedded"], stats["deleted"]) == (3, 2, 1, 1)
+    assert embeddings.embedded == 4
+    expected = {chunk_id("lua.pdf", text) for text in ("một", "ba", "bốn")}
+    assert set(vector_store._collection.get(include=[])["ids"]) == expected
+    assert set(manifest.get("lua.pdf")["chunk_ids"]) == expected
+    assert len(lexical_index) == 3
+    assert version.token() != first_version
+
+
+def test_unchanged_hash_is_skipped_without_reading_chunks(store):
+    vector_store, embeddings, manifest, _ = store
+    ingestion.sync_document("lua.pdf", chunks("một", "hai"), "h1", vector_store, manifest)
+
+    def never():
+        raise AssertionError("không được đọc chunk khi hash không đổi")
+        yield
+
+    stats = ingestion.sync_document("lua.pdf", never(), "h1", vector_store, manifest)
+    assert stats["skipped"] and stats["unchanged"] == 2
+    assert embeddings.embedded == 2
+
+
+def test_failure_rolls_back_new_chunks_and_keeps_previous_version(store):
+    vector_store, _, manifest, _ = store
+    ingestion.sync_document("lua.pdf", chunks("một"), "h1", vector_store, manifest)
+
+    def broken():
+        yield from chunks("hai", "ba")
+        raise RuntimeError("đọc file lỗi")
+
+    with pytest.raises(RuntimeError):
+        ingestion.sync_document("lua.pdf", broken(), "h2", vector_store, manifest, batch_size=1)
+    assert vector_store._collection.get(include=[])["ids"] == [chunk_id("lua.pdf", "một")]
+    assert manifest.get("lua.pdf")["content_hash"] == "h1"
+
+
+def test_legacy_upload_chunks_are_replaced(store):
+    vector_store, _, manifest, _ = store
+    vector_store.add_documents([
+        Document(page_content="cũ", metadata={"source": "../temp_uploads/123e4567-e89b-12d3-a456-426614174000_lua.pdf"}),
+        Document(page_content="khác", metadata={"source": "ngo.pdf"}),
+    ])
+    stats = ingestion.sync_document("lua.pdf", chunks("mới"), "h1", vector_store, manifest)
+    assert stats["deleted"] == 1
+    sources = {metadata["source"] for metadata in vector_store._collection.get(include=["metadatas"])["metadatas"]}
+    assert sources == {"lua.pdf", "ngo.pdf"}
+
+
+def test_document_hash_changes_with_splitter_settings(tmp_path, monkeypatch):
+    path = tmp_path / "a.txt"
+    path.write_text("nội dung", encoding="utf-8")
+    before = ingestion.document_hash(str(path))
+    assert ingestion.document_hash(str(path)) == before
+    monkeypatch.setattr(document_parser, "CHUNK_SIZE", document_parser.CHUNK_SIZE + 100)
+    assert ingestion.document_hash(str(path)) != before
+
+
+def test_web_search_write_back_goes_through_manifest(store, monkeypatch):
+    from agents import vector_store as vector_store_module, web_search
+
+    vector_store, embeddings, manifest, _ = store
+    monkeypatch.setattr(ingestion, "manifest", manifest)
+    monkeypatch.setattr(vector_store_module, "get_vector_store", lambda: vector_store)
+    monkeypatch.setattr(vector_store_module, "get_lexical_index", lambda: None)
+    monkeypatch.setattr(web_search, "WEB_SEARCH_WRITE_BACK_MIN_SCORE", 0.5)
+    monkeypatch.setattr(web_search, "WEB_SEARCH_WRITE_BACK_MIN_CHARS", 10)
+    content = "Bệnh đạo ôn hại lúa. " * 60
+    results = [{"url": "https://a.vn/dao-on", "content": content, "score": 0.9},
+               {"url": "https://b.vn/thap", "content": content, "score": 0.1}]
+
+    web_search._write_back("đạo ôn", results)
+    entry = manifest.get("https://a.vn/dao-on")
+    assert entry is not None and len(entry["chunk_ids"]) > 1
+    assert manifest.get("https://b.vn/thap") is None
+    assert set(vector_store._collection.get(include=[])["ids"]) == set(entry["chunk_ids"])
+    embedded = embeddings.embedded
+
+    web_search._write_back("bệnh đạo ôn", results)
+    assert embeddings.embedded == embedded
@@ -0,0 +1,70 @@
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from agents.query_router import FastRouter, evaluate_routes, load_disease_terms, load_eval_set
+
+
+@pytest.fixture(scope="module")
+def router():
+    # Không có embedding: chỉ kiểm tra tầng luật từ khóa
+    return FastRouter(embeddings_getter=None)
+
+
+@pytest.mark.parametrize("query", ["xin chào", "cảm ơn bạn nhiều nhé", "ok", "Chào bot!"])
+def test_chitchat(router, query):
+    assert router.route(query).query_type == "chitchat"
+
+
+def test_disease_name_with_knowledge_intent_is_normal_qa(router):
+    assert router.route("bệnh đạo ôn là gì").query_type == "normal_qa"
+
+
+def test_symptom_description_is_text_disease(router):
+    assert router.route("lá lúa có vết hình thoi màu nâu").query_type == "text_disease"
+
+
+def test_chitchat_prefix_does_not_hide_question(router):
+    decision = router.route("chào bạn, lúa bị đạo ôn chữa sao")
+    assert decision is not None and decision.query_type == "normal_qa"
+
+
+def test_follow_up_with_history_goes_to_llm(router):
+    # Câu tiếp nối cần LLM viết lại từ lịch sử, kể cả khi mở đầu bằng "ok"
+    assert router.route("ok vậy còn sâu đục thân?", has_history=True) is None
+    assert router.route("chữa thế nào?", has_history=True) is None
+
+
+def test_pure_chitchat_with_history_is_still_chitchat(router):
+    assert router.route("cảm ơn bạn", has_history=True).query_type == "chitchat"
+
+
+def test_unclear_query_without_embeddings_returns_none(router):
+    assert router.route("giá phân bón hôm nay") is None
+
+
+def test_disease_terms_have_no_truncated_fragments():
+    terms = load_disease_terms()
+    assert {"đạo ôn", "bạc lá"} <= terms
+    assert not {"f hại", "đốm vi", "bọ cánh", "tomato yellow"} & terms
+
+
+def test_rules_are_precise_on_labelled_set(router):
+    # Câu không khớp luật đi tới LLM; câu được định tuyến nhanh phải đúng route
+    report = evaluate_routes(router, load_eval_set())
+    for route, stats in report.items():
+        assert stats["precision"] >= 0.95, (route, stats)
+        assert stats["coverage"] >= 0.5, (route, stats)
+
+
+def test_centroid_fallback_is_off_by_default():
+    calls = []
+
+    def embeddings_getter():
+        calls.append(1)
+        return DeterministicFakeEmbedding(size=8)
+
+    router = FastRouter(embeddings_getter=embeddings_getter)
+    assert router.route("giá phân bón hôm nay") is None
+    assert calls == []
+    assert FastRouter(embeddings_getter=embeddings_getter, use_centroid=True, min_similarity=-1.0,
+                      min_margin=0.0).route("giá phân bón hôm nay") is not None
@@ -0,0 +1,83 @@
+import asyncio
+import contextvars
+import functools
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "8"))
+INFERENCE_QUEUE_LIMIT = int(os.getenv("INFERENCE_QUEUE_LIMIT", "32"))
+RETRIEVAL_WORKERS = int(os.getenv("RETRIEVAL_WORKERS", "4"))
+RETRIEVAL_QUEUE_LIMIT = int(os.getenv("RETRIEVAL_QUEUE_LIMIT", "64"))
+
+
+class PoolSaturatedError(RuntimeError):
+    """Pool đã đủ số tác vụ đang chạy + đang chờ, từ chối nhận thêm."""
+
+
+class BoundedExecutor:
+    """
+    Thread pool có giới hạn hàng đợi cho các tác vụ CPU-bound (PyTorch, Chroma,
+    CrossEncoder nhả GIL khi tính toán) được gọi từ event loop.
+    Khi số tác vụ đang chạy + đang chờ đạt max_workers + max_queue, `run` ném
+    PoolSaturatedError thay vì để hàng đợi tăng vô hạn.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queue: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.limit = max_workers + max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.rejected = 0
+
+    async def run(self, fn, *args, **kwargs):
+        with self._lock:
+            if self.pending >= self.limit:
+                self.rejected += 1
+                raise PoolSaturatedError(f"Pool '{self.name}' đang quá tải ({self.pending} tác vụ)")
+            self.pending += 1
+        # Giữ contextvars (callback của LangChain/LangGraph) khi chạy trên thread khác
+        ctx = contextvars.copy_context()
+        call = functools.partial(ctx.run, fn, *args, **kwargs)
+        try:
+            future = self._executor.submit(call)
+        except BaseException:
+            self._release()
+            raise
+        # Giảm `pending` khi tác vụ thực sự xong trên thread, không phải khi coroutine chờ bị hủy:
+        # tác vụ đã chạy vẫn chiếm thread cho tới khi kết thúc
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    def _release(self, _future=None):
+        with self._lock:
+            self.pending -= 1
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.max_workers,
+            "limit": self.limit,
+            "pending": self.pending,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+inference_pool = BoundedExecutor("inference", INFERENCE_WORKERS, INFERENCE_QUEUE_LIMIT)
+retrieval_pool = BoundedExecutor("retrieval", RETRIEVAL_WORKERS, RETRIEVAL_QUEUE_LIMIT)
+
+
+def shutdown_pools():
+    for pool in (inference_pool, retrieval_pool):
+        pool.shutdown()
+    logger.info("Đã dừng các worker pool.")
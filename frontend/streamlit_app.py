@@ -31,6 +31,17 @@ API_ENDPOINTS = {
     "feedback": f"{API_BASE_URL}/feedback"
 }
 
+# Trạng thái hiển thị khi backend báo đang chạy tới node nào (sự kiện SSE "node")
+NODE_STATUS = {
+    "process_user_query": "🤔 Đang phân tích câu hỏi...",
+    "analyze_image": "🔬 Đang phân tích ảnh...",
+    "retrieve_knowledge": "📚 Đang tra cứu tài liệu...",
+    "diagnose_disease": "🩺 Đang chẩn đoán...",
+    "normal_qa": "✍️ Đang soạn câu trả lời...",
+    "chitchat": "💬 Đang trả lời...",
+    "cached_answer": "⚡ Đã có câu trả lời cho câu hỏi tương tự...",
+}
+
 # =============================================================================
 # CUSTOM CSS
 # =============================================================================
@@ -670,6 +681,17 @@ def render_chat_view():
 
                             data_json = json.loads(data_str)
 
+                            if data_json.get("event") == "node" and not full_response:
+                                status_text = NODE_STATUS.get(data_json.get("node"))
+                                if status_text:
+                                    message_placeholder.markdown(f"{status_text} ▌")
+                                continue
+
+                            if data_json.get("event") == "token":
+                                full_response += data_json.get("content", "")
+                                message_placeholder.markdown(full_response + " ▌")
+                                continue
+
                             if data_json.get("event") == "end":
                                 full_response = data_json.get("final_message", "❌ Không nhận được phản hồi")
                                 message_placeholder.markdown(full_response)